@@ -0,0 +1,225 @@
+"""
+Stonegrove University Aggregation Cube
+
+Counts, sums and sums of squares of NSS and graduate outcome measures per
+(fact, academic year, programme, subgroup), kept up to date by the stages that
+generate the facts (NSSSystem.generate_responses, GraduateOutcomesSystem.
+generate_outcomes) and written to data/stonegrove_aggregation_cube.csv next to
+them. Means, % positive, outcome shares and standard deviations by programme,
+faculty, SES band, disability, species and year come from the cube's cells
+(summary()) without re-reading the response tables.
+
+One cell per (fact, academic_year, faculty, programme_code, dimension, group, measure):
+  - faculty: the programme's faculty in config/programme_characteristics.csv, by
+    programme name (as in dim_programmes); 'unknown' if the programme is not listed
+  - dimension: 'all' (group 'all'), 'ses_band' (SES_BANDS from student_features, e.g.
+    '1-3'), 'disability' ('none', 'disability', 'significant') or 'species'
+  - measure: a numeric column (NaN rows skipped) or a 0/1 indicator such as
+    'teaching_quality_positive' or 'outcome_type=employed'
+  - count, sum, sum_sq over the rows in the cell
+
+Cells only add, so cubes from separate runs, years or shards merge by summing
+(merge(), AggregationCube.read_csv()).
+"""
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from core_systems.student_features import SES_BANDS, StudentFeatures
+
+
+KEY_COLUMNS = ['fact', 'academic_year', 'faculty', 'programme_code', 'dimension', 'group', 'measure']
+STAT_COLUMNS = ['count', 'sum', 'sum_sq']
+
+DIMENSIONS = ('all', 'ses_band', 'disability', 'species')
+
+_SES_LABELS = np.array(
+    [f"{lo}-{hi}" for lo, hi in zip((1,) + tuple(b + 1 for b in SES_BANDS[:-1]), SES_BANDS)]
+    + [f"{SES_BANDS[-1] + 1}+"],
+    dtype=object,
+)
+
+
+def subgroups(features: StudentFeatures, rows: np.ndarray) -> Dict[str, np.ndarray]:
+    """Group label per row for each dimension ('unknown' where rows == -1 or the value is missing)."""
+    rows = np.asarray(rows)
+    found = rows >= 0
+    n = len(rows)
+
+    def gather(values: np.ndarray) -> np.ndarray:
+        out = np.full(n, 'unknown', dtype=object)
+        out[found] = values[rows[found]]
+        return out
+
+    ses = pd.to_numeric(pd.Series(features.category('socio_economic_rank'), dtype=object), errors='coerce')
+    ses_band = _SES_LABELS[np.searchsorted(SES_BANDS, ses.fillna(4).to_numpy(), side='left')]
+    disability = np.where(features.significant_disability, 'significant',
+                          np.where(features.has_disability, 'disability', 'none')).astype(object)
+    species = features.columns.get('species')
+    species = pd.Series(species, dtype=object).fillna('unknown').astype(str).to_numpy(dtype=object) \
+        if species is not None else np.full(len(features), 'unknown', dtype=object)
+    return {
+        'all': np.full(n, 'all', dtype=object),
+        'ses_band': gather(ses_band),
+        'disability': gather(disability),
+        'species': gather(species),
+    }
+
+
+@lru_cache(maxsize=None)
+def _load_faculties(path: Path) -> Dict[str, str]:
+    if not path.exists():
+        return {}
+    df = pd.read_csv(path)
+    return dict(zip(df['programme_name'].astype(str), df['faculty'].astype(str)))
+
+
+def faculties(features: StudentFeatures, rows: np.ndarray,
+              path='config/programme_characteristics.csv') -> np.ndarray:
+    """Faculty per row by programme name, as in dim_programmes ('unknown' where rows == -1 or not listed)."""
+    rows = np.asarray(rows)
+    out = np.full(len(rows), 'unknown', dtype=object)
+    names = features.columns.get('program_name')
+    if names is None:
+        return out
+    lookup = _load_faculties(Path(path).resolve())
+    found = np.flatnonzero(rows >= 0)
+    out[found] = [lookup.get(str(name), 'unknown') for name in names[rows[found]]]
+    return out
+
+
+class AggregationCube:
+    """Additive per-cell statistics of NSS and graduate outcome measures."""
+
+    __slots__ = ('_parts',)
+
+    def __init__(self, cells: Optional[pd.DataFrame] = None):
+        self._parts: List[pd.DataFrame] = []
+        if cells is not None and not cells.empty:
+            self._parts.append(cells[KEY_COLUMNS + STAT_COLUMNS])
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def add(
+        self,
+        fact: str,
+        academic_year: str,
+        programme_code: Iterable,
+        faculty: Iterable,
+        groups: Mapping[str, np.ndarray],
+        measures: Mapping[str, np.ndarray],
+    ) -> None:
+        """
+        Add one batch of rows: programme code, faculty, a label per dimension and a
+        value per measure for each row (NaN values are not counted).
+        """
+        programme = pd.Series(programme_code, dtype=object).fillna('unknown').astype(str).to_numpy()
+        if len(programme) == 0:
+            return
+        faculty = pd.Series(faculty, dtype=object).fillna('unknown').astype(str).to_numpy()
+        prog_codes, prog_levels = pd.MultiIndex.from_arrays([faculty, programme]).factorize()
+        fac_levels = prog_levels.get_level_values(0).to_numpy(dtype=object)
+        prog_levels = prog_levels.get_level_values(1).to_numpy(dtype=object)
+        values = {name: np.asarray(v, dtype=float) for name, v in measures.items()}
+        valid = {name: ~np.isnan(v) for name, v in values.items()}
+
+        frames = []
+        for dimension, labels in groups.items():
+            group_codes, group_levels = pd.factorize(np.asarray(labels, dtype=object))
+            cells, inverse = np.unique(prog_codes * len(group_levels) + group_codes, return_inverse=True)
+            for name, v in values.items():
+                ok = valid[name]
+                count = np.bincount(inverse, weights=ok, minlength=len(cells))
+                keep = count > 0
+                if not keep.any():
+                    continue
+                x = np.where(ok, v, 0.0)
+                frames.append(pd.DataFrame({
+                    'fact': fact,
+                    'academic_year': academic_year,
+                    'faculty': fac_levels[cells[keep] // len(group_levels)],
+                    'programme_code': prog_levels[cells[keep] // len(group_levels)],
+                    'dimension': dimension,
+                    'group': np.asarray(group_levels, dtype=object)[cells[keep] % len(group_levels)],
+                    'measure': name,
+                    'count': count[keep].astype(np.int64),
+                    'sum': np.bincount(inverse, weights=x, minlength=len(cells))[keep],
+                    'sum_sq': np.bincount(inverse, weights=x * x, minlength=len(cells))[keep],
+                }))
+        if frames:
+            self._parts.append(pd.concat(frames, ignore_index=True))
+
+    def merge(self, other: "AggregationCube") -> "AggregationCube":
+        """Add another cube's cells into this one (another run, year range or shard)."""
+        self._parts.extend(other._parts)
+        return self
+
+    @property
+    def cells(self) -> pd.DataFrame:
+        """All cells, one row per key, sorted by key."""
+        if not self._parts:
+            return pd.DataFrame(columns=KEY_COLUMNS + STAT_COLUMNS)
+        if len(self._parts) > 1:
+            merged = pd.concat(self._parts, ignore_index=True)
+            merged = merged.groupby(KEY_COLUMNS, sort=True, as_index=False)[STAT_COLUMNS].sum()
+            self._parts = [merged]
+        return self._parts[0]
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def write_csv(self, path) -> int:
+        """Write the cells; returns the number written."""
+        cells = self.cells
+        cells.to_csv(path, index=False)
+        return len(cells)
+
+    @classmethod
+    def read_csv(cls, *paths) -> "AggregationCube":
+        """Cube from one or more written cubes, merged."""
+        cube = cls()
+        for path in paths:
+            cells = pd.read_csv(Path(path), dtype={c: str for c in KEY_COLUMNS}, keep_default_na=False)
+            cube.merge(cls(cells))
+        return cube
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def summary(
+        self,
+        fact: str,
+        measures: Optional[Sequence[str]] = None,
+        by: Sequence[str] = ('academic_year',),
+        dimension: str = 'all',
+    ) -> pd.DataFrame:
+        """
+        count, mean and std (sample) of measures of a fact for one dimension, grouped
+        by any of academic_year, programme_code and faculty (plus group, when the
+        dimension is not 'all'). One row per group and measure.
+        """
+        cells = self.cells
+        cells = cells[(cells['fact'] == fact) & (cells['dimension'] == dimension)]
+        if measures is not None:
+            cells = cells[cells['measure'].isin(list(measures))]
+        keys = list(by) + (['group'] if dimension != 'all' else []) + ['measure']
+        totals = cells.groupby(keys, sort=True)[STAT_COLUMNS].sum()
+        n = totals['count']
+        mean = totals['sum'] / n
+        var = (totals['sum_sq'] - totals['sum'] * mean) / (n - 1)
+        return pd.DataFrame({
+            'count': n,
+            'mean': mean,
+            'std': np.sqrt(var.clip(lower=0)).where(n > 1),
+        }).reset_index()
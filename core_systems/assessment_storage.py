@@ -0,0 +1,243 @@
+"""
+Stonegrove University Assessment Storage
+
+Encodings and layouts for assessment events.
+
+In memory, the repeated string columns of an assessment table (academic_year,
+programme_code, module_code, module_title, assessment_type, component_code, grade,
+assessment_date) are pandas categoricals: one small integer code per row into the
+distinct values. grade and component_code use fixed, ordered categories (GRADES,
+COMPONENTS). assessment_date is derived from (academic_year, semester, component)
+codes rather than formatted per row; see assessment_dates().
+
+Two layouts hold the same marks:
+
+  long  one row per (student, module, component): MIDTERM then FINAL. combined_mark
+        is set on FINAL rows only; the MIDTERM grade is a formative signal from the
+        MIDTERM mark, the FINAL grade is from combined_mark. This is the default
+        stonegrove_assessment_events.csv / fact_assessment layout.
+  wide  one row per (student, module) with midterm_mark, final_mark, combined_mark,
+        the final grade and the teaching semester. Component rows, MIDTERM grades and
+        dates are not stored; to_long() rebuilds them exactly.
+
+read_assessment_events() reads either layout from CSV. final_marks() gives the FINAL
+marks used by progression, NSS and degree classification from either layout.
+"""
+
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+COMPONENTS = ('MIDTERM', 'FINAL')
+
+# Grade bands: a mark >= GRADE_THRESHOLDS[i] gets GRADES[i + 1]
+GRADES = ('Fail', 'Third', '2:2', '2:1', 'First')
+GRADE_THRESHOLDS = np.array([40.0, 50.0, 60.0, 70.0])
+
+GRADE_DTYPE = pd.CategoricalDtype(GRADES, ordered=True)
+COMPONENT_DTYPE = pd.CategoricalDtype(COMPONENTS, ordered=True)
+
+# String columns held as categoricals (those present in a frame)
+CATEGORICAL_COLUMNS = [
+    'academic_year', 'programme_code', 'module_code', 'module_title',
+    'assessment_type', 'component_code', 'grade', 'assessment_date',
+]
+
+# Small integer columns and their in-memory dtype
+_INT_COLUMNS = {'module_year': np.int8, 'semester': np.int8}
+
+# Long layout column order (stonegrove_assessment_events.csv; fact_assessment keeps a subset)
+LONG_COLUMNS = [
+    'student_id', 'academic_year', 'programme_code', 'module_code', 'component_code',
+    'module_title', 'assessment_type', 'assessment_mark', 'combined_mark', 'grade',
+    'assessment_date', 'module_year',
+]
+
+# Wide layout column order
+WIDE_COLUMNS = [
+    'student_id', 'academic_year', 'programme_code', 'module_code', 'module_title',
+    'assessment_type', 'module_year', 'semester', 'midterm_mark', 'final_mark',
+    'combined_mark', 'grade',
+]
+
+LAYOUTS = ('long', 'wide')
+
+
+# ---------------------------------------------------------------------------
+# Codes
+# ---------------------------------------------------------------------------
+
+def grade_codes(marks) -> np.ndarray:
+    """Index into GRADES for each mark (UK bands: First >=70 ... Fail <40); -1 for NaN."""
+    marks = np.asarray(marks, dtype=float)
+    return np.where(np.isnan(marks), -1, np.searchsorted(GRADE_THRESHOLDS, marks, side='right'))
+
+
+def grades(marks) -> pd.Categorical:
+    """Grade for each mark as a GRADE_DTYPE categorical."""
+    return pd.Categorical.from_codes(grade_codes(np.ravel(marks)), dtype=GRADE_DTYPE)
+
+
+def assessment_dates(academic_year: str, semester: int) -> Dict[str, str]:
+    """MIDTERM and FINAL assessment dates for an academic year and teaching semester.
+
+    Semester 1 (Autumn): MIDTERM Nov 1, FINAL Dec 15 of the starting calendar year.
+    Semester 2 (Spring):  MIDTERM Mar 15, FINAL May 15 of the following calendar year.
+    """
+    start = int(str(academic_year).split('-')[0])  # e.g. 1046
+    end = start + 1                                 # e.g. 1047
+    if semester == 1:
+        return {'MIDTERM': f"{start}-11-01", 'FINAL': f"{start}-12-15"}
+    return {'MIDTERM': f"{end}-03-15", 'FINAL': f"{end}-05-15"}
+
+
+def assessment_date_column(academic_years, semesters, components) -> pd.Categorical:
+    """
+    assessment_date for each row from its (academic_year, semester, component) codes.
+    Each distinct combination is formatted once.
+    """
+    year_codes, year_levels = pd.factorize(np.asarray(academic_years, dtype=object))
+    sem_codes, sem_levels = pd.factorize(np.asarray(semesters, dtype=np.int64))
+    comp_codes = pd.Categorical(np.asarray(components, dtype=object), dtype=COMPONENT_DTYPE).codes
+    labels = [
+        assessment_dates(year, int(sem))[comp]
+        for year in year_levels for sem in sem_levels for comp in COMPONENTS
+    ]
+    categories, label_codes = np.unique(np.asarray(labels, dtype=object), return_inverse=True)
+    combo = (year_codes * len(sem_levels) + sem_codes) * len(COMPONENTS) + comp_codes
+    return pd.Categorical.from_codes(label_codes[combo], categories=categories)
+
+
+def semesters_from_dates(dates) -> np.ndarray:
+    """Teaching semester of each assessment_date (autumn dates are semester 1)."""
+    dates = pd.Categorical(dates)
+    months = np.array([int(str(d).split('-')[1]) for d in dates.categories], dtype=np.int64)
+    return np.where(months[dates.codes] >= 9, 1, 2).astype(np.int8)
+
+
+def encode_assessment(df: pd.DataFrame) -> pd.DataFrame:
+    """Assessment frame (either layout) with categorical and small integer columns."""
+    if df.empty:
+        return df
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col not in df.columns:
+            continue
+        if col == 'grade':
+            df[col] = df[col].astype(GRADE_DTYPE)
+        elif col == 'component_code':
+            df[col] = df[col].astype(COMPONENT_DTYPE)
+        elif not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col, dtype in _INT_COLUMNS.items():
+        if col in df.columns and df[col].notna().all():
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def concat_assessment(frames: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate per-year assessment frames, re-encoding the combined categoricals."""
+    frames = [f for f in frames if f is not None and not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    return encode_assessment(pd.concat(frames, ignore_index=True))
+
+
+# ---------------------------------------------------------------------------
+# Layouts
+# ---------------------------------------------------------------------------
+
+def layout_of(df: pd.DataFrame) -> str:
+    """'wide' if the frame has per-component mark columns, else 'long'."""
+    return 'wide' if 'final_mark' in df.columns else 'long'
+
+
+def to_wide(df: pd.DataFrame) -> pd.DataFrame:
+    """One row per (student, module) from a long assessment frame (FINAL row order)."""
+    if df.empty or layout_of(df) == 'wide':
+        return df
+    comp = df['component_code'].astype(str).to_numpy()
+    finals = df[comp == 'FINAL']
+    mids = df[comp == 'MIDTERM']
+    keys = [c for c in ('student_id', 'academic_year', 'module_code', 'module_title') if c in df.columns]
+
+    out = {c: finals[c].to_numpy() for c in WIDE_COLUMNS[:7] if c in finals.columns}
+    if 'assessment_date' in finals.columns:
+        out['semester'] = semesters_from_dates(finals['assessment_date'])
+    mid_index = pd.MultiIndex.from_frame(mids[keys].astype(object))
+    final_index = pd.MultiIndex.from_frame(finals[keys].astype(object))
+    out['midterm_mark'] = mids['assessment_mark'].set_axis(mid_index).reindex(final_index).to_numpy()
+    out['final_mark'] = finals['assessment_mark'].to_numpy()
+    out['combined_mark'] = finals['combined_mark'].to_numpy()
+    out['grade'] = finals['grade'].to_numpy()
+    return encode_assessment(pd.DataFrame(out))
+
+
+def to_long(df: pd.DataFrame) -> pd.DataFrame:
+    """Long assessment frame (MIDTERM then FINAL per module) from a wide one."""
+    if df.empty or layout_of(df) == 'long':
+        return df
+    n_comp = len(COMPONENTS)
+    rep = np.repeat(np.arange(len(df)), n_comp)
+    component = pd.Categorical.from_codes(np.tile(np.arange(n_comp), len(df)), dtype=COMPONENT_DTYPE)
+
+    marks = np.column_stack([df['midterm_mark'].to_numpy(dtype=float), df['final_mark'].to_numpy(dtype=float)])
+    combined = np.full(marks.shape, np.nan)
+    combined[:, -1] = df['combined_mark'].to_numpy(dtype=float)
+    grade_codes_ = grade_codes(marks)     # MIDTERM grade is a formative signal
+    final_grade = pd.Categorical(df['grade'], dtype=GRADE_DTYPE).codes
+    grade_codes_[:, -1] = np.where(final_grade >= 0, final_grade, grade_codes(combined[:, -1]))
+
+    columns = {c: df[c].to_numpy()[rep] for c in LONG_COLUMNS if c in df.columns}
+    columns['component_code'] = component
+    columns['assessment_mark'] = marks.ravel()
+    columns['combined_mark'] = combined.ravel()
+    columns['grade'] = pd.Categorical.from_codes(grade_codes_.ravel(), dtype=GRADE_DTYPE)
+    if 'semester' in df.columns and 'academic_year' in df.columns:
+        columns['assessment_date'] = assessment_date_column(
+            columns['academic_year'], df['semester'].to_numpy()[rep], component,
+        )
+    return encode_assessment(pd.DataFrame({c: columns[c] for c in LONG_COLUMNS if c in columns}))
+
+
+def to_layout(df: pd.DataFrame, layout: str) -> pd.DataFrame:
+    """Convert an assessment frame to 'long' or 'wide'."""
+    if layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of {LAYOUTS}, got {layout!r}")
+    return to_wide(df) if layout == 'wide' else to_long(df)
+
+
+def read_assessment_events(path, layout: Optional[str] = 'long') -> pd.DataFrame:
+    """
+    Read an assessment CSV written in either layout, encoded. layout converts to
+    'long' or 'wide'; None keeps the stored layout.
+    """
+    df = encode_assessment(pd.read_csv(path))
+    return df if layout is None else to_layout(df, layout)
+
+
+# ---------------------------------------------------------------------------
+# Marks
+# ---------------------------------------------------------------------------
+
+def final_marks(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per (student, module) with `mark`: combined_mark where set, else the FINAL
+    (or only) component mark. Accepts either layout, and long frames without
+    component_code or combined_mark.
+    """
+    if layout_of(df) == 'wide':
+        finals = df.copy()
+        finals['mark'] = finals['combined_mark'].fillna(finals['final_mark'])
+        return finals
+    if 'component_code' in df.columns:
+        finals = df[df['component_code'] == 'FINAL'].copy()
+    else:
+        finals = df.copy()
+    if 'combined_mark' in finals.columns:
+        finals['mark'] = finals['combined_mark'].fillna(finals['assessment_mark'])
+    else:
+        finals['mark'] = finals['assessment_mark']
+    return finals
@@ -2,19 +2,34 @@
 Stonegrove University Assessment System
 
 Generates end-of-module marks for enrolled students.
-Output: stonegrove_assessment_events.csv with module_code, component_code.
+Output: stonegrove_assessment_events.csv with module_code, component_code
+(long or wide layout; see core_systems/assessment_storage.py).
 Marks are modified by engagement (attendance, participation, academic_engagement).
 Uses module_characteristics (CSV or YAML) for assessment_type and difficulty where available.
 """
 
 import csv
 import io
+import sys
 import pandas as pd
 import numpy as np
 import yaml
 from typing import Dict, List, Optional
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core_systems.assessment_storage import (
+    COMPONENT_DTYPE, GRADE_DTYPE, assessment_date_column, assessment_dates, encode_assessment, grade_codes,
+)
+from core_systems.marks_ledger import MarksLedger
+from core_systems.module_registry import load_module_registry
+from core_systems.student_features import StudentFeatures
+
+
+def midterm_last_week(weeks_per_semester: int = 12) -> int:
+    """Last teaching week of the MIDTERM engagement window: two thirds of the semester (8 of 12)."""
+    return max(1, 2 * int(weeks_per_semester) // 3)
+
 
 def _parse_module_list_csv(value: str) -> List[str]:
     """Parse module list from CSV-formatted string (handles commas in module names)."""
@@ -24,37 +39,6 @@ def _parse_module_list_csv(value: str) -> List[str]:
     return [m.strip() for m in next(reader) if m.strip()]
 
 
-def _difficulty_to_mark_modifier(difficulty: float) -> float:
-    """Convert difficulty (0.25-0.9) to mark modifier. Higher difficulty = lower marks.
-    Slope tuned to create a clear negative difficulty–mark correlation (~-0.10 to -0.20).
-    Range: ~1.03 (diff=0.29) down to ~0.86 (diff=0.88)."""
-    if difficulty <= 0.5:
-        return 1.0 + (0.5 - difficulty) * 0.15  # 0.5->1.0, 0.3->1.03
-    return 1.0 - (difficulty - 0.5) * 0.37       # 0.7->0.926, 0.9->0.852
-
-
-def _get_module_difficulty_modifier_fallback(module_title: str) -> float:
-    """Fallback: infer from module title when not in config. Feminist-aware."""
-    title_lower = module_title.lower()
-    if any(w in title_lower for w in ['advanced', 'capstone', 'research']):
-        return 0.9
-    if any(w in title_lower for w in ['epistemolog', 'theoretical', 'complex']):
-        return 0.95
-    return 1.0
-
-
-def _get_assessment_type_fallback(module_title: str) -> str:
-    """Fallback: infer assessment type from module title when not in config."""
-    title_lower = module_title.lower()
-    if any(w in title_lower for w in ['practical', 'hands', 'craft', 'practice']):
-        return 'practical'
-    if any(w in title_lower for w in ['project', 'design', 'praxis']):
-        return 'project'
-    if any(w in title_lower for w in ['essay', 'theory', 'critical']):
-        return 'essay'
-    return 'mixed'
-
-
 def _grade_from_mark(mark: float) -> str:
     """UK grading: First (>=70), 2:1 (>=60), 2:2 (>=50), Third (>=40), Fail (<40)."""
     if mark >= 70:
@@ -75,14 +59,24 @@ class AssessmentSystem:
     Uses module_characteristics (CSV or YAML) for assessment_type and difficulty.
     """
 
+    # MIDTERM engagement window: teaching weeks 1..midterm_last_week(weeks_per_semester)
+    # (1-8 of 12). Engagement rows carry the teaching week at every resolution (fortnight
+    # = its last week, teaching day = its week), so the window follows the engagement calendar.
+
+    # Base mark distribution: mixture of (weight, mean, std)
+    BASE_MIXTURE = ((0.7, 60, 8), (0.15, 75, 6), (0.15, 45, 10))
+
+    # Mark components per module, in output order, and their combined_mark weights
+    COMPONENTS = ('MIDTERM', 'FINAL')
+    COMPONENT_WEIGHTS = (0.4, 0.6)
+
     def __init__(self, seed: int = 42, curriculum_file: str = "curriculum-and-lore/Stonegrove_University_Curriculum.xlsx"):
         self.seed = seed
         self.rng = np.random.default_rng(seed)
         self.curriculum_file = curriculum_file
         self.modules_df = None
-        self.module_chars = {}  # module_title -> {assessment_type, difficulty_level}
+        self.modules = load_module_registry()  # assessment_type, mark_modifier, semester by module ID
         self._load_curriculum()
-        self._load_module_characteristics()
         self._load_disability_modifiers()
         self._load_assessment_modifiers()
 
@@ -94,33 +88,6 @@ class AssessmentSystem:
             for _, row in self.modules_df.iterrows()
         }
 
-    def _load_module_characteristics(self):
-        """Load module characteristics from CSV (preferred) or YAML. Used for assessment_type and difficulty."""
-        csv_path = Path('config/module_characteristics.csv')
-        yaml_path = Path('config/module_characteristics.yaml')
-        if csv_path.exists():
-            df = pd.read_csv(csv_path)
-            for _, row in df.iterrows():
-                title = str(row.get('module_title', '')).strip()
-                if title:
-                    raw_mod = row.get('mark_modifier')
-                    self.module_chars[title] = {
-                        'assessment_type': str(row.get('assessment_type', 'mixed')).strip() or 'mixed',
-                        'difficulty_level': float(row.get('difficulty_level', 0.5)),
-                        'mark_modifier':    float(raw_mod) if pd.notna(raw_mod) else None,
-                        'semester':         int(row.get('semester', 1)),
-                    }
-        elif yaml_path.exists():
-            with open(yaml_path, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f) or {}
-            for title, info in (data.get('modules') or {}).items():
-                if isinstance(info, dict):
-                    self.module_chars[str(title).strip()] = {
-                        'assessment_type': str(info.get('assessment_type', 'mixed')).strip() or 'mixed',
-                        'difficulty_level': float(info.get('difficulty_level', 0.5)),
-                    }
-        # else: module_chars stays empty, fallbacks used
-
     def _load_disability_modifiers(self):
         """Load disability assessment modifiers from CSV."""
         self.disability_modifiers = {}
@@ -145,21 +112,12 @@ class AssessmentSystem:
             self._ses_modifiers = {1: 0.91, 2: 0.93, 3: 0.95, 4: 0.97, 5: 1.03, 6: 1.05, 7: 1.07, 8: 1.09}
 
     def _get_assessment_type(self, module_title: str) -> str:
-        """Get assessment_type from module_characteristics, else infer from title."""
-        title = str(module_title).strip()
-        if title in self.module_chars:
-            return self.module_chars[title]['assessment_type']
-        return _get_assessment_type_fallback(module_title)
+        """Get assessment_type from module_characteristics, else inferred from title (see ModuleRegistry)."""
+        return self.modules.assessment_type[self.modules.module_id(module_title)]
 
     def _get_difficulty_modifier(self, module_title: str) -> float:
-        """Get mark modifier from module_characteristics CSV (preferred), else compute from difficulty."""
-        title = str(module_title).strip()
-        if title in self.module_chars:
-            mod = self.module_chars[title].get('mark_modifier')
-            if mod is not None:
-                return mod
-            return _difficulty_to_mark_modifier(self.module_chars[title]['difficulty_level'])
-        return _get_module_difficulty_modifier_fallback(module_title)
+        """Mark modifier from module_characteristics CSV (preferred), else from difficulty, else from title."""
+        return float(self.modules.mark_modifier[self.modules.module_id(module_title)])
 
     def _get_disability_modifier(self, disabilities: str) -> float:
         """Product of modifiers for each disability from config/disability_assessment_modifiers.csv.
@@ -197,15 +155,9 @@ class AssessmentSystem:
     def _assessment_dates(self, academic_year: str, semester: int) -> Dict[str, str]:
         """Return MIDTERM and FINAL assessment dates for a given academic year and teaching semester.
 
-        Semester 1 (Autumn): MIDTERM Nov 1, FINAL Dec 15 of the starting calendar year.
-        Semester 2 (Spring):  MIDTERM Mar 15, FINAL May 15 of the following calendar year.
+        See assessment_storage.assessment_dates.
         """
-        start = int(academic_year.split('-')[0])  # e.g. 1046
-        end = start + 1                            # e.g. 1047
-        if semester == 1:
-            return {'MIDTERM': f"{start}-11-01", 'FINAL': f"{start}-12-15"}
-        else:
-            return {'MIDTERM': f"{end}-03-15", 'FINAL': f"{end}-05-15"}
+        return assessment_dates(academic_year, semester)
 
     def _engagement_to_modifier(self, avg_engagement: float) -> float:
         """Convert engagement score (0-1) to mark modifier. High engagement slightly boosts marks.
@@ -215,6 +167,38 @@ class AssessmentSystem:
             return 1.0
         return float(np.clip(0.88 + 0.24 * avg_engagement, 0.88, 1.12))
 
+    # ------------------------------------------------------------------
+    # Batch mark engine
+    # ------------------------------------------------------------------
+
+    def _student_modifiers(self, features: StudentFeatures) -> np.ndarray:
+        """Per-student product of clan, disability, education and SES modifiers (generate_mark order)."""
+        mod = np.ones(len(features))
+        mod *= features.modifier('assessment_clan', 'clan', lambda c: self._get_clan_modifier(str(c).lower()))
+        mod *= features.modifier('assessment_disability', 'disabilities', self._get_disability_modifier)
+        mod *= features.modifier('assessment_education', 'education', self._get_education_modifier)
+        mod *= features.modifier('assessment_ses', 'socio_economic_rank', self._get_socio_economic_modifier)
+        return mod
+
+    def _engagement_modifiers(self, avg_engagement: np.ndarray) -> np.ndarray:
+        """Vectorized _engagement_to_modifier; NaN (no engagement rows) -> 1.0."""
+        mod = np.clip(0.88 + 0.24 * avg_engagement, 0.88, 1.12)
+        return np.where(np.isnan(avg_engagement), 1.0, mod)
+
+    def generate_marks(self, modifier: np.ndarray) -> np.ndarray:
+        """
+        Marks for an array of combined modifiers, drawn in bulk: one mixture choice,
+        base draw and noise draw per mark. Same distribution as generate_mark.
+        """
+        n = modifier.shape
+        r = self.rng.random(n)
+        z = self.rng.standard_normal(n)
+        weights, means, stds = (np.array(c, dtype=float) for c in zip(*self.BASE_MIXTURE))
+        comp = np.minimum(np.searchsorted(np.cumsum(weights), r, side='right'), len(weights) - 1)
+        base = means[comp] + stds[comp] * z
+        mark = base * modifier + self.rng.normal(0, 5, n)
+        return np.clip(np.round(mark, 1), 0.0, 100.0)
+
     def generate_mark(self, student: pd.Series, module_title: str,
                      engagement_modifier: Optional[float] = None) -> float:
         """
@@ -224,12 +208,12 @@ class AssessmentSystem:
         """
         # Base distribution
         r = self.rng.random()
-        if r < 0.7:
-            base = self.rng.normal(60, 8)
-        elif r < 0.85:
-            base = self.rng.normal(75, 6)
-        else:
-            base = self.rng.normal(45, 10)
+        cum = 0.0
+        for weight, mean, std in self.BASE_MIXTURE:
+            cum += weight
+            if r < cum:
+                break
+        base = self.rng.normal(mean, std)
 
         # Modifiers (species-level variation is captured by clan modifiers)
         mod = 1.0
@@ -265,28 +249,52 @@ class AssessmentSystem:
         engagement_path: str = "data/stonegrove_weekly_engagement.csv",
         academic_year: Optional[str] = None,
         engagement_df: Optional[pd.DataFrame] = None,
+        weeks_per_semester: int = 12,
     ) -> tuple:
         """
         Return (final_lookup, midterm_lookup):
-          - final_lookup:   (student_id, module_title) -> avg_engagement across all 12 weeks
-          - midterm_lookup: (student_id, module_title) -> avg_engagement across weeks 1-8
+          - final_lookup:   (student_id, module_title) -> avg_engagement across all weeks
+          - midterm_lookup: (student_id, module_title) -> avg_engagement across the midterm
+            window (weeks 1-8 of 12, midterm_last_week)
 
         Midterm captures early enthusiasm + midterm crunch; final uses the full arc.
         """
+        final_agg, midterm_agg = self.engagement_means(
+            engagement_path, academic_year=academic_year, engagement_df=engagement_df,
+            weeks_per_semester=weeks_per_semester,
+        )
+        if final_agg is None:
+            return {}, {}
+        final_lookup = {k: float(v) for k, v in final_agg.items()}
+        midterm_lookup = {k: float(v) for k, v in midterm_agg.items()}
+        return final_lookup, midterm_lookup
+
+    def engagement_means(
+        self,
+        engagement_path: str = "data/stonegrove_weekly_engagement.csv",
+        academic_year: Optional[str] = None,
+        engagement_df: Optional[pd.DataFrame] = None,
+        weeks_per_semester: int = 12,
+    ) -> tuple:
+        """
+        (final, midterm) mean engagement as Series indexed by (student_id, module_title),
+        or (None, None) if there is no usable engagement data. See _load_engagement_lookups.
+        weeks_per_semester: the engagement calendar's teaching weeks (sets the midterm window).
+        """
         if engagement_df is not None:
             df = engagement_df.copy()
         else:
             path = Path(engagement_path)
             if not path.exists():
-                return {}, {}
+                return None, None
             df = pd.read_csv(path)
         if df.empty or 'student_id' not in df.columns or 'module_title' not in df.columns:
-            return {}, {}
+            return None, None
         if academic_year and 'academic_year' in df.columns:
             df = df[df['academic_year'] == academic_year]
         cols = [c for c in ['attendance_rate', 'participation_score', 'academic_engagement'] if c in df.columns]
         if not cols:
-            return {}, {}
+            return None, None
         df = df.copy()
         df['engagement'] = df[cols].mean(axis=1)
         df['student_id'] = df['student_id'].astype(str)
@@ -294,17 +302,15 @@ class AssessmentSystem:
 
         # Final: all weeks
         final_agg = df.groupby(['student_id', 'module_title'])['engagement'].mean()
-        final_lookup = {k: float(v) for k, v in final_agg.items()}
 
-        # Midterm: weeks 1-8 only
+        # Midterm: weeks 1-8 of 12 only
         if 'week_number' in df.columns:
-            midterm_df = df[df['week_number'] <= 8]
+            midterm_df = df[df['week_number'] <= midterm_last_week(weeks_per_semester)]
         else:
             midterm_df = df  # fallback: use all weeks if week_number not present
         midterm_agg = midterm_df.groupby(['student_id', 'module_title'])['engagement'].mean()
-        midterm_lookup = {k: float(v) for k, v in midterm_agg.items()}
 
-        return final_lookup, midterm_lookup
+        return final_agg, midterm_agg
 
     def generate_assessment_data(
         self,
@@ -313,89 +319,124 @@ class AssessmentSystem:
         assessment_date: Optional[str] = None,  # deprecated; dates now computed per module/semester
         weekly_engagement_path: str = "data/stonegrove_weekly_engagement.csv",
         weekly_engagement_df: Optional[pd.DataFrame] = None,
+        features: Optional[StudentFeatures] = None,
+        engagement_means: Optional[tuple] = None,
+        marks_ledger: Optional[MarksLedger] = None,
+        weeks_per_semester: int = 12,
     ) -> pd.DataFrame:
         """
         Generate assessment events for all enrolled students.
 
         Produces two rows per student per module: MIDTERM and FINAL components.
-        - MIDTERM: engagement from weeks 1-8 (early enthusiasm + midterm crunch)
-        - FINAL: engagement from all 12 weeks; combined_mark = 0.4*MIDTERM + 0.6*FINAL
+        - MIDTERM: engagement from the first two thirds of the semester (weeks 1-8 of 12;
+          early enthusiasm + midterm crunch)
+        - FINAL: engagement from all weeks; combined_mark = 0.4*MIDTERM + 0.6*FINAL
         - Progression uses combined_mark from FINAL rows only.
 
         assessment_date parameter is deprecated and ignored; dates are now derived
         from the module's teaching semester via _assessment_dates().
+
+        Rows are built as (student, module) pair arrays and all marks are drawn in one
+        generate_marks call; generate_mark is the single-mark equivalent.
+
+        String columns are returned as categoricals (assessment_storage.encode_assessment);
+        assessment_storage.to_wide gives one row per (student, module).
+
+        features: StudentFeatures built from enrolled_df (row-aligned); built here if None.
+        engagement_means: a precomputed engagement_means() result for the year (e.g. from
+        the re-scoring cache); when given, weekly engagement is not read.
+        marks_ledger: running per-student marks (core_systems/marks_ledger.py); this
+        year's FINAL marks are recorded into it by programme year.
+        weeks_per_semester: teaching weeks of the engagement read (sets the MIDTERM window).
         """
-        final_lookup, midterm_lookup = self._load_engagement_lookups(
-            weekly_engagement_path, academic_year=academic_year,
-            engagement_df=weekly_engagement_df,
-        )
-        records = []
-        for idx, student in enrolled_df.iterrows():
-            sid_raw = student.get('student_id', idx)
-            student_id = str(sid_raw.iloc[0]) if isinstance(sid_raw, pd.Series) else str(sid_raw)
-            program_code = student['program_code']
-            prog_year = int(student.get('programme_year', 1))
-            mod_col = f'year{prog_year}_modules'
-            modules = _parse_module_list_csv(student.get(mod_col, student.get('year1_modules', '')))
-
-            for module_title in modules:
-                if not module_title.strip():
-                    continue
-                module_title = module_title.strip()
-                module_code = self.module_code_lookup.get(
-                    (program_code, module_title),
-                    f"{program_code}.??"  # should not occur if curriculum is complete
-                )
-                mod_chars = self.module_chars.get(module_title, {})
-                module_semester = mod_chars.get('semester', 1)
-                dates = self._assessment_dates(academic_year, module_semester)
-                assessment_type = self._get_assessment_type(module_title)
-
-                key = (student_id, module_title)
-
-                # MIDTERM: engagement from weeks 1-8 (captures early enthusiasm + midterm crunch)
-                midterm_avg = midterm_lookup.get(key)
-                midterm_eng_mod = self._engagement_to_modifier(midterm_avg) if midterm_avg is not None else None
-                midterm_mark = self.generate_mark(student, module_title, engagement_modifier=midterm_eng_mod)
-
-                # FINAL: engagement from all 12 weeks
-                final_avg = final_lookup.get(key)
-                final_eng_mod = self._engagement_to_modifier(final_avg) if final_avg is not None else None
-                final_mark = self.generate_mark(student, module_title, engagement_modifier=final_eng_mod)
-
-                # Combined mark weights: 40% midterm, 60% final
-                combined_mark = round(0.4 * midterm_mark + 0.6 * final_mark, 1)
-
-                records.append({
-                    'student_id': student_id,
-                    'academic_year': academic_year,
-                    'programme_code': program_code,
-                    'module_code': module_code,
-                    'component_code': 'MIDTERM',
-                    'module_title': module_title,
-                    'assessment_type': assessment_type,
-                    'assessment_mark': midterm_mark,
-                    'combined_mark': None,
-                    'grade': _grade_from_mark(midterm_mark),  # formative signal
-                    'assessment_date': dates['MIDTERM'],
-                    'module_year': prog_year,
-                })
-                records.append({
-                    'student_id': student_id,
-                    'academic_year': academic_year,
-                    'programme_code': program_code,
-                    'module_code': module_code,
-                    'component_code': 'FINAL',
-                    'module_title': module_title,
-                    'assessment_type': assessment_type,
-                    'assessment_mark': final_mark,
-                    'combined_mark': combined_mark,
-                    'grade': _grade_from_mark(combined_mark),
-                    'assessment_date': dates['FINAL'],
-                    'module_year': prog_year,
-                })
-
-        return pd.DataFrame(records)
+        if engagement_means is None:
+            engagement_means = self.engagement_means(
+                weekly_engagement_path, academic_year=academic_year,
+                engagement_df=weekly_engagement_df, weeks_per_semester=weeks_per_semester,
+            )
+        final_agg, midterm_agg = engagement_means
+        if enrolled_df.empty:
+            return pd.DataFrame()
+
+        # --- Per-student columns ---
+        if features is None:
+            features = StudentFeatures(enrolled_df)
+        student_ids = features.student_ids
+        program_codes = features.columns['program_code']
+        prog_years = features.programme_year
+        student_mod = self._student_modifiers(features)
+
+        # Module list for each student's programme year (parsed once per distinct list)
+        fallback = enrolled_df['year1_modules'] if 'year1_modules' in enrolled_df.columns else pd.Series('', index=enrolled_df.index)
+        raw_lists = fallback.to_numpy(dtype=object, copy=True)
+        for py in np.unique(prog_years):
+            col = f'year{py}_modules'
+            if col in enrolled_df.columns:
+                raw_lists[prog_years == py] = enrolled_df[col].to_numpy(dtype=object)[prog_years == py]
+        parsed: Dict[str, List[str]] = {}
+        module_lists = []
+        for raw in raw_lists:
+            key = '' if pd.isna(raw) else str(raw)
+            if key not in parsed:
+                parsed[key] = _parse_module_list_csv(key)
+            module_lists.append(parsed[key])
+
+        # --- (student, module) pairs ---
+        counts = np.fromiter((len(m) for m in module_lists), dtype=np.int64, count=len(module_lists))
+        pair_student = np.repeat(np.arange(len(module_lists)), counts)
+        titles = np.array([t for m in module_lists for t in m], dtype=object)
+        if not len(titles):
+            return pd.DataFrame()
+        module_ids = self.modules.module_ids(titles)
+        pair_program = program_codes[pair_student]
+        module_codes = np.array([
+            self.module_code_lookup.get((pc, t), f"{pc}.??")  # should not occur if curriculum is complete
+            for pc, t in zip(pair_program, titles)
+        ], dtype=object)
+        semesters = self.modules.semester[module_ids]
+
+        # Engagement: MIDTERM uses weeks 1-8 of 12 (early enthusiasm + midterm crunch), FINAL all weeks
+        pair_index = pd.MultiIndex.from_arrays([student_ids[pair_student], titles])
+        engagement = np.full((len(titles), len(self.COMPONENTS)), np.nan)
+        if final_agg is not None:
+            engagement[:, 0] = midterm_agg.reindex(pair_index).to_numpy(dtype=float)
+            engagement[:, 1] = final_agg.reindex(pair_index).to_numpy(dtype=float)
+
+        # --- Marks: (pairs, components) ---
+        modifier = (student_mod[pair_student] * self.modules.mark_modifier[module_ids])[:, None]
+        modifier = modifier * self._engagement_modifiers(engagement)
+        marks = self.generate_marks(modifier)
+        combined = np.round(marks @ np.array(self.COMPONENT_WEIGHTS), 1)
+
+        # --- Rows: MIDTERM then FINAL for each pair (categorical string columns) ---
+        n_comp = len(self.COMPONENTS)
+        rep = np.repeat(np.arange(len(titles)), n_comp)
+        component = pd.Categorical.from_codes(np.tile(np.arange(n_comp), len(titles)), dtype=COMPONENT_DTYPE)
+        combined_col = np.full(marks.shape, np.nan)
+        combined_col[:, -1] = combined
+        grades = grade_codes(marks)   # MIDTERM grade is a formative signal
+        grades[:, -1] = grade_codes(combined)
+        if marks_ledger is not None:
+            marks_ledger.record(
+                student_ids[pair_student], prog_years[pair_student],
+                np.where(np.isnan(combined), marks[:, -1], combined),
+            )
+        return encode_assessment(pd.DataFrame({
+            'student_id':      student_ids[pair_student][rep],
+            'academic_year':   pd.Categorical.from_codes(np.zeros(len(rep), dtype=np.int8), categories=[academic_year]),
+            'programme_code':  pair_program[rep],
+            'module_code':     module_codes[rep],
+            'component_code':  component,
+            'module_title':    titles[rep],
+            'assessment_type': self.modules.assessment_type[module_ids][rep],
+            'assessment_mark': marks.ravel(),
+            'combined_mark':   combined_col.ravel(),
+            'grade':           pd.Categorical.from_codes(grades.ravel(), dtype=GRADE_DTYPE),
+            'assessment_date': assessment_date_column(
+                np.full(len(rep), academic_year, dtype=object), semesters[rep], component,
+            ),
+            'module_year':     prog_years[pair_student][rep],
+        }))
 
 
 def main():
@@ -8,13 +8,37 @@ Reads from data/ and config/, writes 10 clean tables to data/relational/:
                fact_graduate_outcomes, fact_nss_responses,
                fact_weekly_engagement_YYYY-YY.csv (one file per academic year)
 
+fact_student_week_engagement_YYYY-YY.csv (ENGAGEMENT_GRAIN "student_week"/"both")
+is written by the pipeline in its final form and is not rebuilt here.
+
+fact_assessment is written in the layout of stonegrove_assessment_events.csv (long,
+or wide: one row per student-module; see core_systems/assessment_storage.py).
+
+Weekly engagement written by the pipeline in the quantized format
+(fact_weekly_engagement_YYYY-YY.npz) or as a memory-mapped tensor
+(fact_weekly_engagement_YYYY-YY.tensor/) is read and rewritten in that format.
+
+Academic years come from data/metadata.json (the years the pipeline ran), and weekly
+engagement is read and rewritten one year at a time, so long runs are not loaded whole.
+
+main(data_dir) builds another output directory's relational/ (run_replicates.py partitions).
+
 Run from project root after run_longitudinal_pipeline.py.
 """
 
+import json
+import shutil
+import sys
 from pathlib import Path
 import pandas as pd
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from core_systems.assessment_storage import layout_of, read_assessment_events, to_long, to_wide
+from core_systems.engagement_storage import EngagementTensor, QuantizedEngagement, stored_bits
+from core_systems.module_registry import load_module_registry
+
 DATA_DIR = PROJECT_ROOT / "data"
 CONFIG_DIR = PROJECT_ROOT / "config"
 OUT_DIR = DATA_DIR / "relational"
@@ -22,28 +46,59 @@ OUT_DIR = DATA_DIR / "relational"
 ACADEMIC_YEARS = ["1046-47", "1047-48", "1048-49", "1049-50", "1050-51", "1051-52", "1052-53"]
 
 
+def academic_years(data_dir: Path = DATA_DIR) -> list:
+    """Academic years of the last pipeline run (data/metadata.json), else ACADEMIC_YEARS."""
+    try:
+        with open(data_dir / "metadata.json") as f:
+            years = json.load(f).get("academic_years")
+    except (OSError, ValueError):
+        years = None
+    return list(years) if years else ACADEMIC_YEARS
+
+
 # ---------------------------------------------------------------------------
 # Loaders
 # ---------------------------------------------------------------------------
 
-def load_weekly_engagement() -> pd.DataFrame:
-    """Load weekly engagement from per-year splits in data/relational/."""
-    splits = sorted((DATA_DIR / "relational").glob("fact_weekly_engagement_*.csv"))
-    if not splits:
-        raise FileNotFoundError(
-            "No weekly engagement data found. Run run_longitudinal_pipeline.py first — "
-            "it writes fact_weekly_engagement_YYYY-YY.csv to data/relational/."
-        )
-    return pd.concat([pd.read_csv(p) for p in splits], ignore_index=True)
+def weekly_engagement_formats(relational_dir: Path = OUT_DIR) -> set:
+    """Formats present among the per-year weekly engagement splits: {"csv", "quantized", "tensor"}."""
+    formats = set()
+    if any(relational_dir.glob("fact_weekly_engagement_*.csv")):
+        formats.add("csv")
+    if any(relational_dir.glob("fact_weekly_engagement_*.npz")):
+        formats.add("quantized")
+    if any(relational_dir.glob("fact_weekly_engagement_*.tensor")):
+        formats.add("tensor")
+    return formats
+
+
+def load_weekly_engagement(academic_year: str = "*", relational_dir: Path = OUT_DIR) -> pd.DataFrame:
+    """Load weekly engagement from per-year splits in data/relational/ (CSV preferred); one year or all."""
+    stem = f"fact_weekly_engagement_{academic_year}"
+    splits = sorted(relational_dir.glob(f"{stem}.csv"))
+    if splits:
+        return pd.concat([pd.read_csv(p) for p in splits], ignore_index=True)
+    quantized = sorted(relational_dir.glob(f"{stem}.npz"))
+    if quantized:
+        return pd.concat([QuantizedEngagement.load(p).to_frame() for p in quantized], ignore_index=True)
+    tensors = sorted(relational_dir.glob(f"{stem}.tensor"))
+    if tensors:
+        return pd.concat([EngagementTensor.open(p).to_frame() for p in tensors], ignore_index=True)
+    if academic_year != "*":
+        return pd.DataFrame()
+    raise FileNotFoundError(
+        "No weekly engagement data found. Run run_longitudinal_pipeline.py first — "
+        "it writes fact_weekly_engagement_YYYY-YY.csv to data/relational/."
+    )
 
 
 # ---------------------------------------------------------------------------
 # Dimensions
 # ---------------------------------------------------------------------------
 
-def build_dim_academic_years() -> pd.DataFrame:
+def build_dim_academic_years(years: list = ACADEMIC_YEARS) -> pd.DataFrame:
     rows = []
-    for y in ACADEMIC_YEARS:
+    for y in years:
         y1 = int(y.split("-")[0])
         y2 = y1 + 1
         rows.append({
@@ -135,25 +190,38 @@ def build_fact_weekly_engagement(
         .drop_duplicates(["programme_code", "module_title"])
     )
     df = engagement_df.rename(columns={"program_code": "programme_code"}).copy()
-    df = df.merge(lookup, on=["programme_code", "module_title"], how="left")
+    # Rows already in relational form (written by an earlier build and kept by a run
+    # that loaded engagement from the stage cache) carry module_code and no module_title;
+    # they pass through.
+    if "module_code" not in df.columns or ("module_title" in df.columns and df["module_title"].notna().any()):
+        df = df.drop(columns=["module_code"], errors="ignore")
+        df = df.merge(lookup, on=["programme_code", "module_title"], how="left")
 
-    unmatched = df["module_code"].isna().sum()
-    if unmatched > 0:
-        print(f"  WARNING: {unmatched:,} engagement rows could not be matched to a module_code")
+        unmatched = df["module_code"].isna().sum()
+        if unmatched > 0:
+            print(f"  WARNING: {unmatched:,} engagement rows could not be matched to a module_code")
 
     keep = [
-        "student_id", "academic_year", "week_number", "module_code", "semester",
+        "student_id", "academic_year", "week_number", "teaching_day", "module_code", "semester",
         "attendance_rate", "participation_score", "academic_engagement",
         "social_engagement", "stress_level",
     ]
     return df[[c for c in keep if c in df.columns]]
 
 
-def build_fact_assessment(assessment_df: pd.DataFrame) -> pd.DataFrame:
-    keep = [
-        "student_id", "academic_year", "module_code", "component_code",
-        "assessment_mark", "combined_mark", "grade", "assessment_date",
-    ]
+def build_fact_assessment(assessment_df: pd.DataFrame, layout: str = "long") -> pd.DataFrame:
+    """Long: one row per component. Wide: one row per student-module (dates from semester)."""
+    if layout == "wide":
+        assessment_df = to_wide(assessment_df)
+        keep = [
+            "student_id", "academic_year", "module_code", "semester",
+            "midterm_mark", "final_mark", "combined_mark", "grade",
+        ]
+    else:
+        keep = [
+            "student_id", "academic_year", "module_code", "component_code",
+            "assessment_mark", "combined_mark", "grade", "assessment_date",
+        ]
     return assessment_df[[c for c in keep if c in assessment_df.columns]].copy()
 
 
@@ -173,47 +241,73 @@ def build_fact_nss_responses(nss_df: pd.DataFrame) -> pd.DataFrame:
 # Main
 # ---------------------------------------------------------------------------
 
-def main():
-    OUT_DIR.mkdir(exist_ok=True)
+def main(data_dir: Path = DATA_DIR):
+    """Build data_dir/relational/ from the pipeline outputs in data_dir (default data/)."""
+    data_dir = Path(data_dir)
+    out_dir = data_dir / "relational"
+    out_dir.mkdir(exist_ok=True)
 
     print("Loading raw pipeline outputs...")
-    students_df      = pd.read_csv(DATA_DIR / "stonegrove_individual_students.csv")
-    enrollment_df    = pd.read_csv(DATA_DIR / "stonegrove_enrollment.csv")
-    engagement_df    = load_weekly_engagement()
-    assessment_df    = pd.read_csv(DATA_DIR / "stonegrove_assessment_events.csv")
-    progression_df   = pd.read_csv(DATA_DIR / "stonegrove_progression_outcomes.csv")
-    grad_outcomes_df = pd.read_csv(DATA_DIR / "stonegrove_graduate_outcomes.csv")
-    nss_df           = pd.read_csv(DATA_DIR / "stonegrove_nss_responses.csv")
+    students_df      = pd.read_csv(data_dir / "stonegrove_individual_students.csv")
+    enrollment_df    = pd.read_csv(data_dir / "stonegrove_enrollment.csv")
+    years            = academic_years(data_dir)
+    engagement_formats = weekly_engagement_formats(out_dir)
+    assessment_df    = read_assessment_events(data_dir / "stonegrove_assessment_events.csv", layout=None)
+    assessment_layout = layout_of(assessment_df)
+    assessment_df    = to_long(assessment_df)
+    progression_df   = pd.read_csv(data_dir / "stonegrove_progression_outcomes.csv")
+    grad_outcomes_df = pd.read_csv(data_dir / "stonegrove_graduate_outcomes.csv")
+    nss_df           = pd.read_csv(data_dir / "stonegrove_nss_responses.csv")
 
     print("Loading config files...")
     prog_chars_df   = pd.read_csv(CONFIG_DIR / "programme_characteristics.csv")
-    module_chars_df = pd.read_csv(CONFIG_DIR / "module_characteristics.csv")
+    module_chars_df = load_module_registry(CONFIG_DIR / "module_characteristics.csv",
+                                           CONFIG_DIR / "module_characteristics.yaml").frame
 
     tables = {
-        "dim_academic_years":     build_dim_academic_years(),
+        "dim_academic_years":     build_dim_academic_years(years),
         "dim_students":           build_dim_students(students_df),
         "dim_programmes":         build_dim_programmes(prog_chars_df, enrollment_df),
         "dim_modules":            build_dim_modules(assessment_df, module_chars_df),
         "fact_enrollment":        build_fact_enrollment(enrollment_df),
-        "fact_assessment":        build_fact_assessment(assessment_df),
+        "fact_assessment":        build_fact_assessment(assessment_df, assessment_layout),
         "fact_progression":       build_fact_progression(progression_df),
         "fact_graduate_outcomes": build_fact_graduate_outcomes(grad_outcomes_df),
         "fact_nss_responses":     build_fact_nss_responses(nss_df),
     }
 
-    print(f"\nWriting to {OUT_DIR}/:")
+    print(f"\nWriting to {out_dir}/:")
     for name, df in tables.items():
-        path = OUT_DIR / f"{name}.csv"
+        path = out_dir / f"{name}.csv"
         df.to_csv(path, index=False)
         print(f"  {name}.csv  — {len(df):,} rows × {len(df.columns)} cols")
 
-    # Weekly engagement: write one cleaned file per academic year
-    for year in ACADEMIC_YEARS:
-        year_eng = engagement_df[engagement_df["academic_year"] == year]
+    # Weekly engagement: read, clean and write one academic year at a time
+    if not engagement_formats:
+        print("  (no weekly engagement splits — summary fidelity or student-week grain run; "
+              "skipping fact_weekly_engagement)")
+    for year in (years if engagement_formats else []):
+        year_eng = load_weekly_engagement(year, out_dir)
+        if year_eng.empty:
+            continue
+        year_eng = year_eng[year_eng["academic_year"] == year]
         year_fact = build_fact_weekly_engagement(year_eng, assessment_df)
-        path = OUT_DIR / f"fact_weekly_engagement_{year}.csv"
-        year_fact.to_csv(path, index=False)
-        print(f"  fact_weekly_engagement_{year}.csv  — {len(year_fact):,} rows × {len(year_fact.columns)} cols")
+        if "csv" in engagement_formats:
+            path = out_dir / f"fact_weekly_engagement_{year}.csv"
+            year_fact.to_csv(path, index=False)
+            print(f"  fact_weekly_engagement_{year}.csv  — {len(year_fact):,} rows × {len(year_fact.columns)} cols")
+        if "quantized" in engagement_formats:
+            path = out_dir / f"fact_weekly_engagement_{year}.npz"
+            bits = stored_bits(path) if path.exists() else 8
+            QuantizedEngagement.from_frame(year_fact, bits=bits).save(path)
+            print(f"  fact_weekly_engagement_{year}.npz  — {len(year_fact):,} rows ({bits}-bit)")
+        if "tensor" in engagement_formats:
+            path = out_dir / f"fact_weekly_engagement_{year}.tensor"
+            shutil.rmtree(path, ignore_errors=True)
+            if year_fact.empty:
+                continue
+            tensor = EngagementTensor.write(year_fact, path)
+            print(f"  fact_weekly_engagement_{year}.tensor/  — {tensor.values.shape} (student × period × slot × metric)")
 
     print("\nDone.")
 
@@ -0,0 +1,68 @@
+"""
+Stonegrove University Run Checkpoint
+
+State of a longitudinal run after its last completed academic year, written by
+run_longitudinal_pipeline.main at the end of every year so that an interrupted run
+can continue (--resume) instead of starting again:
+  - completed: number of academic years done
+  - student_state: the hot tier (StudentStateTable: active students' columns and
+    outcomes, repeat history, marks ledger)
+  - lineage: hashes of the history and ledger contents (stage cache inputs)
+  - archive: the FactArchive index (parts already on disk under data/archive/)
+  - cube: the aggregation cube so far
+  - manifest: the stage cache manifest of the completed years
+  - rng_state: global numpy and random states
+  - settings: cohort size, seed, academic years and output settings of the run
+
+The checkpoint is data/archive/checkpoint.pkl, replaced atomically each year. A
+resumed run continues from the year after `completed` and writes the same final
+outputs as an uninterrupted run; anything the interrupted year had written is
+overwritten. load() refuses a checkpoint written with other settings.
+"""
+
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class RunCheckpoint:
+    """Everything main() carries from one academic year to the next."""
+
+    __slots__ = ('settings', 'completed', 'student_state', 'lineage', 'archive', 'cube', 'manifest', 'rng_state')
+
+    def __init__(self, settings: Dict, completed: int, student_state, lineage: Dict, archive, cube,
+                 manifest: Dict, rng_state: tuple):
+        self.settings = settings
+        self.completed = completed
+        self.student_state = student_state
+        self.lineage = lineage
+        self.archive = archive
+        self.cube = cube
+        self.manifest = manifest
+        self.rng_state = rng_state
+
+    def save(self, path) -> None:
+        """Write atomically (a crash mid-write leaves the previous checkpoint)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump({name: getattr(self, name) for name in self.__slots__}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, settings: Dict) -> Optional["RunCheckpoint"]:
+        """The checkpoint at path, or None if there is none; ValueError if written with other settings."""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state.get('settings') != settings:
+            changed = sorted(k for k in set(settings) | set(state.get('settings') or {})
+                             if (state.get('settings') or {}).get(k) != settings.get(k))
+            raise ValueError(f"checkpoint {path} was written with other settings ({', '.join(changed)}); "
+                             f"run without --resume to start again")
+        return cls(**state)
@@ -0,0 +1,356 @@
+"""
+Stonegrove University Cohort Flow
+
+Expected cohort flows under the progression model, for what-ifs on
+config/year_progression_rules.yaml (base_withdrawal_after_fail,
+year_withdrawal_after_fail, ...) without a stochastic pipeline run.
+
+Students move each academic year between six active states and two absorbing ones:
+
+  Y1, Y2, Y3   in programme year k, never repeated
+  R1, R2, R3   in programme year k, repeated before (prior_repeat_withdrawal applies)
+  withdrawn, graduated
+
+A year's outcome (progressed 'enrolled', 'repeating', 'withdrawn', 'graduated')
+follows the progression model (ProgressionSystem.outcome_probabilities): pass the
+year and progress or withdraw (Year 3 passers graduate), or fail and repeat or
+withdraw. Pass/fail and average marks are not modelled here; they are calibrated
+from a stochastic run's outputs (enrollment + progression outcomes), one
+observation per student-year. R states are calibrated from the student-years that
+follow a repeat (repeaters pass less often), or from all of the programme year's
+student-years if the run has none.
+
+Students are split into subgroups by SES band, significant disability and
+conscientiousness tercile. For each subgroup and programme year, the outcome
+probabilities are the progression model averaged over the calibration
+student-years (their traits, marks and pass/fail), shrunk towards the programme
+year's overall average where a subgroup has few observations. Each subgroup's
+expected counts are then propagated over the academic years with one matrix
+product per year, a new cohort entering Y1 each year.
+
+Usage:
+    python core_systems/cohort_flow.py                       # expected vs observed (data/)
+    python core_systems/cohort_flow.py --set base_withdrawal_after_fail=0.5 \\
+        --set year_withdrawal_after_fail.1=0.6
+"""
+
+import argparse
+import copy
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core_systems.progression_history import ProgressionHistory
+from core_systems.progression_system import ProgressionSystem
+from core_systems.student_features import SES_BANDS, _significant_disability
+
+
+STATES = ('Y1', 'Y2', 'Y3', 'R1', 'R2', 'R3')
+OUTCOMES = ('enrolled', 'repeating', 'withdrawn', 'graduated')
+
+# Subgroups: SES rank bands (student_features.SES_BANDS) and conscientiousness terciles
+TRAIT_BIN_QUANTILES = (1 / 3, 2 / 3)
+
+# Observations a subgroup cell needs to outweigh its programme year's overall average
+PRIOR_WEIGHT = 5.0
+
+
+def _state(programme_year: int, repeated: bool) -> int:
+    """Index into STATES."""
+    return programme_year - 1 + (3 if repeated else 0)
+
+
+def _set_path(config: dict, path: str, value) -> None:
+    """config[a][b] = value for path 'a.b' (integer-looking keys match int or str)."""
+    *parents, leaf = path.split('.')
+    node = config
+    for key in parents:
+        node = node.setdefault(key, {})
+    if leaf.lstrip('-').isdigit() and int(leaf) in node:
+        leaf = int(leaf)
+    node[leaf] = value
+
+
+# ---------------------------------------------------------------------------
+# Calibration data
+# ---------------------------------------------------------------------------
+
+def student_years(enrollment_df: pd.DataFrame, progression_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per progression outcome with the student's programme_year that year,
+    pass/fail, avg_mark, whether they had repeated before (has_prior_repeat) and the
+    attributes used for subgroups and the progression model.
+    """
+    keys = ['student_id', 'academic_year']
+    enrolled = enrollment_df.loc[:, ~enrollment_df.columns.duplicated()].copy()
+    enrolled['student_id'] = enrolled['student_id'].astype(str)
+    outcomes = progression_df[keys + ['year_outcome', 'avg_mark']].copy()
+    outcomes['student_id'] = outcomes['student_id'].astype(str)
+    attrs = ['programme_year', 'socio_economic_rank', 'disabilities',
+             'refined_conscientiousness', 'motivation_academic_drive', 'refined_neuroticism']
+    rows = outcomes.merge(enrolled[keys + [c for c in attrs if c in enrolled.columns]], on=keys, how='inner')
+    rows['passed'] = rows['year_outcome'] == 'pass'
+    rows['programme_year'] = rows['programme_year'].fillna(1).astype(int).clip(1, 3)
+
+    # Repeat history before each year, replayed from the progression outcomes
+    history = ProgressionHistory()
+    prior = np.zeros(len(rows), dtype=bool)
+    year_rows = rows.groupby('academic_year', sort=True).indices
+    for academic_year, year_outcomes in progression_df.groupby('academic_year', sort=True):
+        if academic_year in year_rows:
+            idx = year_rows[academic_year]
+            prior[idx] = history.has_repeated(rows['student_id'].to_numpy()[idx])
+        history.record(year_outcomes['student_id'], academic_year, year_outcomes['status'])
+    rows['has_prior_repeat'] = prior
+    return rows
+
+
+def subgroup_codes(rows: pd.DataFrame, trait_edges: Sequence[float]) -> np.ndarray:
+    """Subgroup index per row: (SES band, significant disability, conscientiousness bin)."""
+    ses = np.searchsorted(SES_BANDS, rows['socio_economic_rank'].fillna(4).to_numpy(), side='left')
+    disability = rows['disabilities'].fillna('').map(_significant_disability).to_numpy(dtype=int)
+    trait = np.searchsorted(trait_edges, rows['refined_conscientiousness'].fillna(0.5).to_numpy(), side='right')
+    n_trait = len(trait_edges) + 1
+    return (ses * 2 + disability) * n_trait + trait
+
+
+# ---------------------------------------------------------------------------
+# Model
+# ---------------------------------------------------------------------------
+
+class CohortFlowModel:
+    """Expected progression flows by subgroup, calibrated from a stochastic run."""
+
+    __slots__ = ('rows', 'groups', 'n_groups', 'trait_edges', 'entrant_shares',
+                 'cohort_size', 'academic_years', 'config', 'system')
+
+    def __init__(
+        self,
+        rows: pd.DataFrame,
+        entrant_shares: np.ndarray,
+        cohort_size: float,
+        academic_years: Sequence[str],
+        trait_edges: Sequence[float],
+        config_path: str = "config/year_progression_rules.yaml",
+    ):
+        self.rows = rows
+        self.trait_edges = tuple(trait_edges)
+        self.n_groups = (len(SES_BANDS) + 1) * 2 * (len(self.trait_edges) + 1)
+        self.groups = subgroup_codes(rows, self.trait_edges)
+        self.entrant_shares = entrant_shares
+        self.cohort_size = cohort_size
+        self.academic_years = list(academic_years)
+        self.system = ProgressionSystem(config_path=config_path)
+        self.config = self.system.config
+
+    @classmethod
+    def from_outputs(
+        cls,
+        enrollment_df: pd.DataFrame,
+        progression_df: pd.DataFrame,
+        config_path: str = "config/year_progression_rules.yaml",
+    ) -> "CohortFlowModel":
+        """Calibrate from stonegrove_enrollment.csv and stonegrove_progression_outcomes.csv frames."""
+        rows = student_years(enrollment_df, progression_df)
+        for year in (1, 2, 3):
+            if not (rows['programme_year'] == year).any():
+                raise ValueError(f"no Year {year} progression outcomes to calibrate from "
+                                 f"(run at least three academic years)")
+        trait_edges = np.quantile(rows['refined_conscientiousness'].dropna(), TRAIT_BIN_QUANTILES)
+
+        # New entrants: each student's first academic year
+        first = enrollment_df.loc[:, ~enrollment_df.columns.duplicated()].sort_values('academic_year', kind='stable')
+        first = first.drop_duplicates('student_id')
+        academic_years = sorted(enrollment_df['academic_year'].astype(str).unique())
+        groups = subgroup_codes(first, trait_edges)
+        n_groups = (len(SES_BANDS) + 1) * 2 * (len(trait_edges) + 1)
+        shares = np.bincount(groups, minlength=n_groups) / len(first)
+        cohort_size = len(first) / len(academic_years)
+        return cls(rows, shares, cohort_size, academic_years, trait_edges, config_path)
+
+    def with_overrides(self, overrides: Optional[Mapping[str, object]] = None) -> dict:
+        """Copy of the progression config with dotted-path overrides applied."""
+        config = copy.deepcopy(self.config)
+        for path, value in (overrides or {}).items():
+            _set_path(config, path, value)
+        return config
+
+    def outcome_matrices(self, overrides: Optional[Mapping[str, object]] = None) -> np.ndarray:
+        """
+        (subgroup, state, outcome) probabilities: the progression model averaged over the
+        calibration student-years of each subgroup and programme year, under the config
+        with overrides applied.
+        """
+        system = self.system
+        saved = system.config, system.pass_threshold
+        system.config = self.with_overrides(overrides)
+        system.pass_threshold = system.config.get("pass_threshold", 40)
+        try:
+            rows = self.rows
+            passed = rows['passed'].to_numpy()
+            programme_year = rows['programme_year'].to_numpy()
+            args = (
+                rows['refined_conscientiousness'].fillna(0.5).to_numpy(dtype=float),
+                rows['motivation_academic_drive'].fillna(0.5).to_numpy(dtype=float),
+                rows['refined_neuroticism'].fillna(0.5).to_numpy(dtype=float),
+                rows['avg_mark'].to_numpy(dtype=float),
+                rows['disabilities'].fillna('').map(_significant_disability).to_numpy(dtype=bool),
+                programme_year,
+            )
+            graduating = passed & (programme_year == 3)
+            prior = rows['has_prior_repeat'].to_numpy()
+            n_groups, n = self.n_groups, len(rows)
+            matrices = np.zeros((n_groups, len(STATES), len(OUTCOMES)))
+            for repeated in (False, True):
+                p_first = system.outcome_probabilities(passed, *args, np.full(n, repeated))
+                probs = np.zeros((n, len(OUTCOMES)))
+                probs[:, 0] = np.where(passed & ~graduating, p_first, 0.0)
+                probs[:, 1] = np.where(passed, 0.0, p_first)
+                probs[:, 2] = np.where(graduating, 0.0, 1.0 - p_first)
+                probs[:, 3] = graduating
+                for year in (1, 2, 3):
+                    cell = (programme_year == year) & (prior == repeated)
+                    if not cell.any():
+                        cell = programme_year == year
+                    groups = self.groups[cell]
+                    counts = np.bincount(groups, minlength=n_groups)[:, None]
+                    sums = np.stack([np.bincount(groups, probs[cell, o], minlength=n_groups)
+                                     for o in range(len(OUTCOMES))], axis=1)
+                    overall = probs[cell].mean(axis=0)
+                    matrices[:, _state(year, repeated)] = (sums + PRIOR_WEIGHT * overall) / (counts + PRIOR_WEIGHT)
+        finally:
+            system.config, system.pass_threshold = saved
+        return matrices
+
+    def project(
+        self,
+        overrides: Optional[Mapping[str, object]] = None,
+        academic_years: Optional[Sequence[str]] = None,
+        cohort_size: Optional[float] = None,
+    ) -> pd.DataFrame:
+        """
+        Expected headcount and outcome counts per academic year: a cohort of cohort_size
+        enters Y1 each year, split across subgroups as the calibration entrants were.
+        """
+        years = list(academic_years) if academic_years is not None else self.academic_years
+        size = self.cohort_size if cohort_size is None else cohort_size
+        outcomes = self.outcome_matrices(overrides)
+
+        # Active-state transitions from outcomes: progress k -> k+1 (same repeat flag),
+        # repeat k -> Rk; withdrawn and graduated leave the active states
+        transitions = np.zeros((self.n_groups, len(STATES), len(STATES)))
+        for repeated in (False, True):
+            for year in (1, 2, 3):
+                s = _state(year, repeated)
+                if year < 3:
+                    transitions[:, s, _state(year + 1, repeated)] += outcomes[:, s, 0]
+                transitions[:, s, _state(year, True)] += outcomes[:, s, 1]
+
+        state = np.zeros((self.n_groups, len(STATES)))
+        records = []
+        for academic_year in years:
+            state[:, 0] += size * self.entrant_shares
+            counts = np.einsum('gs,gso->o', state, outcomes)
+            by_year = state.sum(axis=0)
+            records.append({
+                'academic_year': academic_year,
+                'headcount': state.sum(),
+                'year1': by_year[0] + by_year[3],
+                'year2': by_year[1] + by_year[4],
+                'year3': by_year[2] + by_year[5],
+                **dict(zip(OUTCOMES, counts)),
+            })
+            state = np.einsum('gs,gst->gt', state, transitions)
+        return pd.DataFrame(records)
+
+
+# ---------------------------------------------------------------------------
+# Observed flows
+# ---------------------------------------------------------------------------
+
+def observed_flows(enrollment_df: pd.DataFrame, progression_df: pd.DataFrame) -> pd.DataFrame:
+    """Headcount by programme year and outcome counts per academic year from a stochastic run."""
+    rows = student_years(enrollment_df, progression_df)
+    status = progression_df[['student_id', 'academic_year', 'status']].copy()
+    status['student_id'] = status['student_id'].astype(str)
+    rows = rows.merge(status, on=['student_id', 'academic_year'], how='left')
+    records = []
+    for academic_year, year_rows in rows.groupby('academic_year', sort=True):
+        py = year_rows['programme_year'].value_counts()
+        st = year_rows['status'].value_counts()
+        records.append({
+            'academic_year': academic_year,
+            'headcount': len(year_rows),
+            **{f'year{k}': int(py.get(k, 0)) for k in (1, 2, 3)},
+            **{o: int(st.get(o, 0)) for o in OUTCOMES},
+        })
+    return pd.DataFrame(records)
+
+
+def compare(expected: pd.DataFrame, observed: pd.DataFrame) -> pd.DataFrame:
+    """Expected and observed counts side by side (one row per academic year and measure)."""
+    measures = ['headcount', 'year1', 'year2', 'year3', *OUTCOMES]
+    merged = expected.merge(observed, on='academic_year', suffixes=('_expected', '_observed'))
+    out = []
+    for m in measures:
+        out.append(pd.DataFrame({
+            'academic_year': merged['academic_year'],
+            'measure': m,
+            'expected': merged[f'{m}_expected'].round(1),
+            'observed': merged[f'{m}_observed'],
+        }))
+    return pd.concat(out, ignore_index=True)
+
+
+def _parse_overrides(items: Iterable[str]) -> Dict[str, object]:
+    overrides = {}
+    for item in items:
+        path, _, value = item.partition('=')
+        overrides[path.strip()] = yaml.safe_load(value)
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expected cohort flows under the progression model")
+    parser.add_argument("--data", default="data", help="directory with stonegrove_enrollment.csv and "
+                                                        "stonegrove_progression_outcomes.csv")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="override a year_progression_rules.yaml value, e.g. "
+                             "base_withdrawal_after_fail=0.5 or year_withdrawal_after_fail.1=0.6")
+    args = parser.parse_args()
+
+    print("Stonegrove University Cohort Flow")
+    print("=" * 50)
+    data_dir = Path(args.data)
+    enrollment = pd.read_csv(data_dir / "stonegrove_enrollment.csv")
+    progression = pd.read_csv(data_dir / "stonegrove_progression_outcomes.csv")
+    model = CohortFlowModel.from_outputs(enrollment, progression)
+    observed = observed_flows(enrollment, progression)
+
+    baseline = model.project()
+    print(f"\nCalibrated on {len(model.rows)} student-years, {len(model.academic_years)} academic years")
+    print("\nBaseline (expected vs observed):")
+    print(compare(baseline, observed).pivot(index='measure', columns='academic_year',
+                                            values=['expected', 'observed']).to_string())
+
+    overrides = _parse_overrides(args.set)
+    if overrides:
+        t = time.perf_counter()
+        what_if = model.project(overrides)
+        elapsed = (time.perf_counter() - t) * 1000
+        print(f"\nWhat-if {overrides} ({elapsed:.1f} ms):")
+        cols = ['academic_year', 'headcount', *OUTCOMES]
+        print(what_if[cols].round(1).to_string(index=False))
+        print("\nChange from baseline:")
+        diff = what_if[cols[1:]] - baseline[cols[1:]]
+        print(pd.concat([what_if[['academic_year']], diff.round(1)], axis=1).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""
+Stonegrove University Engagement Storage
+
+Compact on-disk format for weekly engagement (optional alternative to CSV).
+
+All five engagement metrics are clipped to [0.05, 0.95] by the engagement system, so
+they are stored as unsigned fixed point over that range:
+
+    value = 0.05 + code * 0.90 / (2**bits - 1)
+
+    bits=8  (uint8):  step 0.00353, max round-trip error 0.00176
+    bits=16 (uint16): step 0.0000137, max round-trip error 0.0000069
+
+Keys are stored as small integers: student_id (int32), week_number and semester (uint8),
+teaching_day (uint16, teaching-day resolution),
+and string keys (academic_year, program_code, module_title, module_code) as uint16
+indexes into a vocabulary stored in the same file. Per-row analysis columns
+(module_difficulty, personality_*, motivation_*) are not stored; they are available
+from dim_modules / dim_students.
+
+Output: fact_weekly_engagement_YYYY-YY.npz (one file per academic year)
+
+EngagementTensor is a second, uncompressed layout for random access: each academic
+year is one fixed-shape float32 array (student × period × module-slot × metric) saved
+as .npy and opened with np.load(mmap_mode='r'), plus a small index mapping student
+IDs to rows and each student's modules to slots. One student's (or one
+student-module's) weekly history is a single slice; processes that open the same
+file share its pages through the OS cache instead of each reading a copy.
+
+Output: fact_weekly_engagement_YYYY-YY.tensor/ (values.npy + index.npz)
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+METRICS = [
+    'attendance_rate',
+    'participation_score',
+    'academic_engagement',
+    'social_engagement',
+    'stress_level',
+]
+
+METRIC_MIN = 0.05
+METRIC_MAX = 0.95
+
+# Integer keys and their storage dtype
+_INT_KEYS = {
+    'student_id':  np.int32,
+    'week_number': np.uint8,
+    'semester':    np.uint8,
+    'teaching_day': np.uint16,   # teaching_day resolution only
+}
+
+# String keys: dictionary-encoded against a per-file vocabulary
+_CATEGORICAL_KEYS = ['academic_year', 'program_code', 'programme_code', 'module_title', 'module_code']
+
+_CODE_DTYPES = {8: np.uint8, 16: np.uint16}
+
+
+def quantization_step(bits: int) -> float:
+    """Resolution of one code step for the given bit width."""
+    return (METRIC_MAX - METRIC_MIN) / float((1 << bits) - 1)
+
+
+def quantize(values, bits: int = 8) -> np.ndarray:
+    """Encode metric values in [0.05, 0.95] as unsigned fixed point (round to nearest)."""
+    if bits not in _CODE_DTYPES:
+        raise ValueError(f"bits must be 8 or 16, got {bits}")
+    v = np.clip(np.asarray(values, dtype=np.float64), METRIC_MIN, METRIC_MAX)
+    codes = np.rint((v - METRIC_MIN) / quantization_step(bits))
+    return codes.astype(_CODE_DTYPES[bits])
+
+
+def dequantize(codes, bits: int = 8) -> np.ndarray:
+    """Decode fixed-point codes back to float metric values."""
+    return (METRIC_MIN + np.asarray(codes, dtype=np.float64) * quantization_step(bits)).astype(np.float32)
+
+
+def stored_bits(path) -> int:
+    """Bit width of an existing quantized file (reads only its metadata)."""
+    with np.load(Path(path), allow_pickle=False) as npz:
+        return int(json.loads(str(npz['meta']))['bits'])
+
+
+class QuantizedEngagement:
+    """
+    Weekly engagement held as integer key arrays and fixed-point metric codes.
+
+    Metrics are decoded to floats on demand (decode / to_frame). Because decoding is
+    affine, aggregates can be computed on the integer codes and decoded once at the end
+    (grouped_sums), which is how scripts/aggregate_engagement.py consumes this format.
+    """
+
+    def __init__(self, keys: Dict[str, np.ndarray], vocab: Dict[str, np.ndarray],
+                 codes: Dict[str, np.ndarray], bits: int = 8):
+        self.keys = keys      # key name -> int array (categorical keys hold vocab indexes)
+        self.vocab = vocab    # categorical key name -> array of labels
+        self.codes = codes    # metric name -> uint8/uint16 array
+        self.bits = bits
+
+    def __len__(self) -> int:
+        for arr in self.codes.values():
+            return len(arr)
+        return 0
+
+    # ------------------------------------------------------------------
+    # Encoding
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, bits: int = 8) -> "QuantizedEngagement":
+        """Encode a weekly engagement DataFrame (raw or relational columns)."""
+        keys: Dict[str, np.ndarray] = {}
+        vocab: Dict[str, np.ndarray] = {}
+        for col, dtype in _INT_KEYS.items():
+            if col in df.columns:
+                keys[col] = pd.to_numeric(df[col]).to_numpy().astype(dtype)
+        for col in _CATEGORICAL_KEYS:
+            if col in df.columns:
+                idx, labels = pd.factorize(df[col].astype(str), sort=True)
+                if len(labels) > np.iinfo(np.uint16).max:
+                    raise ValueError(f"Too many distinct values in {col} for uint16 keys")
+                keys[col] = idx.astype(np.uint16)
+                vocab[col] = np.asarray(labels, dtype=str)
+        codes = {m: quantize(df[m].to_numpy(), bits) for m in METRICS if m in df.columns}
+        return cls(keys, vocab, codes, bits)
+
+    # ------------------------------------------------------------------
+    # Decoding
+    # ------------------------------------------------------------------
+
+    def decode(self, metric: str) -> np.ndarray:
+        """Return one metric as float32 values."""
+        return dequantize(self.codes[metric], self.bits)
+
+    def labels(self, key: str) -> np.ndarray:
+        """Return a key column as its original values (strings for categorical keys)."""
+        if key in self.vocab:
+            return self.vocab[key][self.keys[key]]
+        return self.keys[key]
+
+    def to_frame(self, metrics: Optional[List[str]] = None) -> pd.DataFrame:
+        """Decode to a DataFrame with the same column names as the CSV format."""
+        data = {key: self.labels(key) for key in self.keys}
+        for m in (metrics or list(self.codes)):
+            data[m] = self.decode(m)
+        return pd.DataFrame(data)
+
+    def grouped_sums(self, metric: str, group_index: np.ndarray, n_groups: int,
+                     mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Sum of decoded metric values per group, computed from integer code sums.
+        group_index: one group number per row (0..n_groups-1); mask excludes rows.
+        """
+        codes = self.codes[metric]
+        idx = group_index
+        if mask is not None:
+            codes, idx = codes[mask], idx[mask]
+        code_sums = np.bincount(idx, weights=codes, minlength=n_groups)
+        counts = np.bincount(idx, minlength=n_groups)
+        return METRIC_MIN * counts + quantization_step(self.bits) * code_sums
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path) -> None:
+        """Write to a compressed .npz file."""
+        arrays = {f"key__{k}": v for k, v in self.keys.items()}
+        arrays.update({f"vocab__{k}": v for k, v in self.vocab.items()})
+        arrays.update({f"metric__{m}": v for m, v in self.codes.items()})
+        meta = {'bits': self.bits, 'metric_min': METRIC_MIN, 'metric_max': METRIC_MAX}
+        arrays['meta'] = np.array(json.dumps(meta))
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path) -> "QuantizedEngagement":
+        """Read a file written by save()."""
+        keys, vocab, codes = {}, {}, {}
+        with np.load(Path(path), allow_pickle=False) as npz:
+            meta = json.loads(str(npz['meta']))
+            for name in npz.files:
+                kind, _, col = name.partition('__')
+                if kind == 'key':
+                    keys[col] = npz[name]
+                elif kind == 'vocab':
+                    vocab[col] = npz[name]
+                elif kind == 'metric':
+                    codes[col] = npz[name]
+        return cls(keys, vocab, codes, bits=int(meta['bits']))
+
+
+class EngagementTensor:
+    """
+    Weekly engagement for one academic year as a memory-mapped 4-D array.
+
+    values[row, t, slot, k] is metric METRICS[k] for student student_ids[row] in
+    period t for module modules[slot_module[row, slot]]. Periods are weeks
+    (t = week_number - 1), or teaching days at teaching-day resolution
+    (t = teaching_day - 1); period_week gives each period's week_number. Empty slots
+    (students taking fewer modules than the widest enrolment) and unused periods
+    (odd weeks at fortnightly resolution) hold NaN; empty slots have slot_module == -1.
+    Modules are keyed by module_code when the frame has one (relational fact),
+    otherwise by module_title (raw pipeline output).
+    """
+
+    def __init__(self, values: np.ndarray, student_ids: np.ndarray, slot_module: np.ndarray,
+                 modules: np.ndarray, module_key: str, meta: Optional[Dict] = None,
+                 student_labels: Optional[Dict[str, np.ndarray]] = None,
+                 slot_semester: Optional[np.ndarray] = None,
+                 period_week: Optional[np.ndarray] = None):
+        self.values = values                  # (students, weeks, slots, metrics) float32
+        self.student_ids = student_ids        # sorted int64 student IDs, one per row
+        self.slot_module = slot_module        # (students, slots) index into modules, -1 = empty
+        self.modules = modules                # module labels (codes or titles)
+        self.module_key = module_key          # 'module_code' or 'module_title'
+        self.meta = meta or {}                # academic_year etc.
+        self.student_labels = student_labels or {}  # per-student string columns (program_code)
+        self.slot_semester = slot_semester    # (students, slots) teaching semester, 0 = unknown
+        self.period_week = (period_week if period_week is not None
+                            else np.arange(1, values.shape[1] + 1))  # week_number per period
+        self.time_key = self.meta.get('time_key', 'week_number')
+
+    @property
+    def n_periods(self) -> int:
+        return self.values.shape[1]
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def write(cls, df: pd.DataFrame, path) -> "EngagementTensor":
+        """Lay out a weekly engagement DataFrame (one academic year) under directory `path`."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        module_key = 'module_code' if 'module_code' in df.columns else 'module_title'
+
+        sid = pd.to_numeric(df['student_id']).to_numpy().astype(np.int64)
+        student_ids = np.unique(sid)
+        row = np.searchsorted(student_ids, sid)
+        module_idx, modules = pd.factorize(df[module_key].astype(str), sort=True)
+
+        # Slot = order in which a student's modules first appear
+        pairs = pd.DataFrame({'row': row, 'module': module_idx}).drop_duplicates()
+        pairs['slot'] = pairs.groupby('row').cumcount()
+        n_slots = int(pairs['slot'].max()) + 1
+        slot_module = np.full((len(student_ids), n_slots), -1, dtype=np.int32)
+        slot_module[pairs['row'].to_numpy(), pairs['slot'].to_numpy()] = pairs['module'].to_numpy()
+        slot = pd.DataFrame({'row': row, 'module': module_idx}).merge(
+            pairs, on=['row', 'module'], how='left')['slot'].to_numpy()
+
+        time_key = 'teaching_day' if 'teaching_day' in df.columns else 'week_number'
+        week = pd.to_numeric(df[time_key]).to_numpy().astype(np.int64) - 1
+        period_week = np.arange(1, int(week.max()) + 2)
+        period_week[week] = pd.to_numeric(df['week_number']).to_numpy()
+        shape = (len(student_ids), len(period_week), n_slots, len(METRICS))
+        values = np.lib.format.open_memmap(path / 'values.npy', mode='w+', dtype=np.float32, shape=shape)
+        values[:] = np.nan
+        for k, m in enumerate(METRICS):
+            values[row, week, slot, k] = df[m].to_numpy(dtype=np.float32)
+        values.flush()
+        del values
+
+        arrays = {
+            'student_ids': student_ids,
+            'slot_module': slot_module,
+            'modules': np.asarray(modules, dtype=str),
+            'period_week': period_week,
+        }
+        if 'semester' in df.columns:
+            slot_semester = np.zeros_like(slot_module, dtype=np.uint8)
+            slot_semester[row, slot] = pd.to_numeric(df['semester']).fillna(0).to_numpy().astype(np.uint8)
+            arrays['slot_semester'] = slot_semester
+        for col in ('program_code', 'programme_code'):
+            if col in df.columns:
+                labels = np.empty(len(student_ids), dtype=object)
+                labels[row] = df[col].astype(str).to_numpy()
+                arrays[f'student__{col}'] = labels.astype(str)
+        meta = {'module_key': module_key, 'time_key': time_key, 'metrics': METRICS}
+        if 'academic_year' in df.columns and df['academic_year'].nunique() == 1:
+            meta['academic_year'] = str(df['academic_year'].iloc[0])
+        arrays['meta'] = np.array(json.dumps(meta))
+        np.savez(path / 'index.npz', **arrays)
+        return cls.open(path)
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def open(cls, path) -> "EngagementTensor":
+        """Open read-only; values stay on disk and are paged in as slices are read."""
+        path = Path(path)
+        values = np.load(path / 'values.npy', mmap_mode='r')
+        with np.load(path / 'index.npz', allow_pickle=False) as idx:
+            meta = json.loads(str(idx['meta']))
+            student_labels = {n.partition('__')[2]: idx[n] for n in idx.files if n.startswith('student__')}
+            return cls(
+                values,
+                student_ids=idx['student_ids'],
+                slot_module=idx['slot_module'],
+                modules=idx['modules'],
+                module_key=meta['module_key'],
+                meta=meta,
+                student_labels=student_labels,
+                slot_semester=idx['slot_semester'] if 'slot_semester' in idx.files else None,
+                period_week=idx['period_week'] if 'period_week' in idx.files else None,
+            )
+
+    def student_row(self, student_id) -> int:
+        """Row offset of a student (KeyError if not enrolled this year)."""
+        row = int(np.searchsorted(self.student_ids, int(student_id)))
+        if row >= len(self.student_ids) or self.student_ids[row] != int(student_id):
+            raise KeyError(student_id)
+        return row
+
+    def module_index(self, module) -> int:
+        """Index of a module label (code or title, per module_key) in self.modules."""
+        i = int(np.searchsorted(self.modules, str(module)))
+        if i >= len(self.modules) or self.modules[i] != str(module):
+            raise KeyError(module)
+        return i
+
+    def student(self, student_id) -> np.ndarray:
+        """(periods, slots, metrics) view of one student; slot labels from student_modules()."""
+        return self.values[self.student_row(student_id)]
+
+    def student_modules(self, student_id) -> List[str]:
+        """Module labels for the student's slots, in slot order."""
+        slots = self.slot_module[self.student_row(student_id)]
+        return [str(self.modules[m]) for m in slots if m >= 0]
+
+    def series(self, student_id, module) -> np.ndarray:
+        """(periods, metrics) history of one student on one module."""
+        row = self.student_row(student_id)
+        slot = np.flatnonzero(self.slot_module[row] == self.module_index(module))
+        if len(slot) == 0:
+            raise KeyError((student_id, module))
+        return self.values[row, :, slot[0]]
+
+    def module(self, module):
+        """
+        All students on one module: (student_ids, values) with values shaped
+        (students, periods, metrics), gathered in one indexed read.
+        """
+        rows, slots = np.nonzero(self.slot_module == self.module_index(module))
+        return self.student_ids[rows], self.values[rows, :, slots]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Flatten to the long weekly layout (one row per student, module, period)."""
+        rows, slots = np.nonzero(self.slot_module >= 0)
+        n_pairs, n_periods = len(rows), self.n_periods
+        block = np.asarray(self.values[rows, :, slots])         # (pairs, periods, metrics)
+        present = ~np.isnan(block[:, :, 0]).ravel()
+        pair = np.repeat(np.arange(n_pairs), n_periods)[present]
+        data = {'student_id': self.student_ids[rows][pair]}
+        if 'academic_year' in self.meta:
+            data['academic_year'] = self.meta['academic_year']
+        for col, labels in self.student_labels.items():
+            data[col] = labels[rows][pair]
+        data['week_number'] = np.tile(self.period_week, n_pairs)[present]
+        if self.time_key != 'week_number':
+            data[self.time_key] = np.tile(np.arange(1, n_periods + 1), n_pairs)[present]
+        data[self.module_key] = self.modules[self.slot_module[rows, slots]][pair]
+        if self.slot_semester is not None:
+            data['semester'] = self.slot_semester[rows, slots][pair]
+        for k, m in enumerate(METRICS):
+            data[m] = block[:, :, k].ravel()[present]
+        return pd.DataFrame(data)
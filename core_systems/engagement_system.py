@@ -1,12 +1,20 @@
 import csv
 import io
+import sys
 import pandas as pd
 import numpy as np
 import yaml
-from typing import Dict, List, Tuple, Optional
+from scipy.special import ndtr
+from typing import Dict, List, Mapping, Tuple, Optional
 from dataclasses import dataclass
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core_systems.assessment_system import midterm_last_week
+from core_systems.module_registry import load_module_registry
+from core_systems.student_features import StudentFeatures
+from supporting_systems.record_batch import RecordBatchBuilder
+
 
 def _parse_module_list_csv(value: str) -> List[str]:
     """Parse module list from CSV-formatted string (handles commas in module names)."""
@@ -17,7 +25,10 @@ def _parse_module_list_csv(value: str) -> List[str]:
 
 @dataclass
 class WeeklyEngagement:
-    """Container for weekly engagement data"""
+    """Container for weekly engagement data (single-record API; batches use RecordBatchBuilder)"""
+    __slots__ = ('student_id', 'week_number', 'program_code', 'module_title', 'attendance_rate',
+                 'participation_score', 'academic_engagement', 'social_engagement', 'stress_level',
+                 'engagement_factors')
     student_id: str
     week_number: int
     program_code: str
@@ -31,7 +42,10 @@ class WeeklyEngagement:
 
 @dataclass
 class SemesterEngagement:
-    """Container for semester-level engagement summary"""
+    """Container for semester-level engagement summary (single-record API)"""
+    __slots__ = ('student_id', 'programme_year', 'semester', 'program_code', 'average_attendance',
+                 'average_participation', 'average_academic_engagement', 'average_social_engagement',
+                 'average_stress_level', 'engagement_trend', 'risk_factors')
     student_id: str
     programme_year: int   # year in programme (1/2/3); was 'semester' before Feb 2026 refactor
     semester: int         # teaching semester (1 = Autumn, 2 = Spring); 0 if mixed/unknown
@@ -55,6 +69,12 @@ class EngagementSystem:
     early-enthusiasm boost, midterm crunch, and exam-period stress spike.
     """
 
+    # Output grains for generate_engagement_data
+    GRAINS = ("module_week", "student_week", "both")
+
+    # Temporal resolutions: periods per teaching week
+    RESOLUTIONS = {'fortnightly': 0.5, 'weekly': 1.0, 'teaching_day': 5.0}
+
     # Maps base_engagement keys → short metric name → output column name
     _METRIC_MAP = [
         ('base_attendance',         'attendance',         'attendance_rate'),
@@ -64,44 +84,35 @@ class EngagementSystem:
         ('base_stress',             'stress',             'stress_level'),
     ]
 
+    # Module-week analysis columns (weekly fidelity, module_week/both grains)
+    _ANALYSIS_COLS = (
+        'module_difficulty', 'module_social_requirements', 'module_creativity_requirements',
+        'personality_conscientiousness', 'personality_extraversion',
+        'motivation_academic_drive', 'motivation_social_connection',
+    )
+
+    # Semester summary columns; averages in _METRIC_MAP order
+    _SEMESTER_AVERAGES = (
+        'average_attendance', 'average_participation', 'average_academic_engagement',
+        'average_social_engagement', 'average_stress_level',
+    )
+    _SEMESTER_SCHEMA = {
+        'student_id': object, 'programme_year': np.int64, 'program_code': object,
+        **dict.fromkeys(_SEMESTER_AVERAGES, np.float64),
+        'engagement_trend': object, 'risk_factors': object,
+    }
+
     def __init__(self):
         """Initialize the engagement system"""
         self._load_characteristics()
         self._load_engagement_modifiers()
 
     def _load_characteristics(self):
-        """Load module and program characteristics from CSV (preferred) or YAML."""
-        mc_csv = Path('config/module_characteristics.csv')
+        """Module characteristics from the shared registry; programme characteristics from CSV (preferred) or YAML."""
+        self.modules = load_module_registry()
         pc_csv = Path('config/programme_characteristics.csv')
-        mc_yaml = Path('config/module_characteristics.yaml')
         pc_yaml = Path('config/program_characteristics.yaml')
 
-        # Module characteristics
-        self._module_chars = {}
-        if mc_csv.exists():
-            df = pd.read_csv(mc_csv)
-            for _, row in df.iterrows():
-                title = str(row.get('module_title', '')).strip()
-                if title:
-                    self._module_chars[title] = {
-                        'difficulty': float(row.get('difficulty_level', 0.5)),
-                        'social_requirements': float(row.get('social_requirements', 0.5)),
-                        'creativity_requirements': float(row.get('creativity_requirements', 0.5)),
-                        'semester': int(row.get('semester', 1)),
-                    }
-        elif mc_yaml.exists():
-            with open(mc_yaml, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f) or {}
-            for title, info in (data.get('modules') or {}).items():
-                if isinstance(info, dict):
-                    self._module_chars[str(title).strip()] = {
-                        'difficulty': float(info.get('difficulty_level', 0.5)),
-                        'social_requirements': float(info.get('social_requirements', 0.5)),
-                        'creativity_requirements': float(info.get('creativity_requirements', 0.5)),
-                    }
-        else:
-            print("Warning: module_characteristics not found. Using estimation.")
-
         # Programme characteristics (keyed by programme_name)
         self._programme_chars = {}
         if pc_csv.exists():
@@ -150,48 +161,9 @@ class EngagementSystem:
     # Module / programme characteristics
     # ------------------------------------------------------------------
 
-    def get_module_characteristics(self, module_title: str) -> Dict[str, float]:
-        """Get characteristics for a specific module (from config or estimated)."""
-        title = str(module_title).strip()
-        if title in self._module_chars:
-            return self._module_chars[title].copy()
-        return self._estimate_module_characteristics(module_title)
-
-    def _estimate_module_characteristics(self, module_title: str) -> Dict[str, float]:
-        """
-        Estimate module characteristics based on title keywords.
-        Feminist-aware: domestic, applied, craft, and care work are NOT treated as easy.
-        """
-        title_lower = module_title.lower()
-        difficulty = 0.5
-        social_requirements = 0.5
-        creativity_requirements = 0.5
-
-        if any(word in title_lower for word in ['advanced', 'capstone', 'research']):
-            difficulty += 0.2
-        elif any(word in title_lower for word in ['epistemolog', 'theoretical', 'complex']):
-            difficulty += 0.15
-        elif any(word in title_lower for word in [
-            'embodied', 'somatic', 'fermentation', 'cultivation', 'harvest',
-            'care', 'healing', 'hospitality', 'ritual', 'ethics', 'indigenous'
-        ]):
-            difficulty += 0.05
-
-        if any(word in title_lower for word in ['group', 'team', 'collaboration', 'discussion', 'circle', 'listening']):
-            social_requirements += 0.25
-        elif any(word in title_lower for word in ['individual', 'independent', 'research']):
-            social_requirements -= 0.15
-
-        if any(word in title_lower for word in ['design', 'creative', 'innovation', 'art', 'craft', 'weaving']):
-            creativity_requirements += 0.25
-        elif any(word in title_lower for word in ['analysis', 'method', 'systematic', 'logic']):
-            creativity_requirements -= 0.1
-
-        return {
-            'difficulty': np.clip(difficulty, 0.25, 0.9),
-            'social_requirements': np.clip(social_requirements, 0.2, 0.9),
-            'creativity_requirements': np.clip(creativity_requirements, 0.2, 0.9)
-        }
+    def get_module_characteristics(self, module_title: str) -> Mapping[str, float]:
+        """Get characteristics for a specific module (from config or estimated), read-only."""
+        return self.modules.characteristics(module_title)
 
     def get_programme_characteristics(self, programme_name: str) -> Dict[str, float]:
         """Get characteristics for a specific programme (by programme name)."""
@@ -322,16 +294,21 @@ class EngagementSystem:
         """Return base engagement adjustments for SES rank."""
         return dict(self._ses_eng_mods.get(int(ses_rank), {}))
 
-    def _get_temporal_modifiers(self, week: int, personality: Dict[str, float]) -> Dict[str, float]:
-        """Return engagement adjustments for this point in the semester arc."""
+    def _get_temporal_modifiers(self, week: int, personality: Dict[str, float],
+                                n_weeks: int = 12) -> Dict[str, float]:
+        """
+        Return engagement adjustments for this point in the semester arc. Phases scale
+        with the semester: early = first sixth (weeks 1-2 of 12), midterm = after 5/12 up
+        to the end of the midterm window (6-8), exam = after 3/4 (10-12).
+        """
         arc = self._temporal_arc
         conscientiousness = personality.get('refined_conscientiousness', 0.5)
 
-        if week <= 2:
+        if 6 * week <= n_weeks:
             return dict(arc.get('early', {}))
-        elif 6 <= week <= 8:
+        elif 12 * week > 5 * n_weeks and week <= midterm_last_week(n_weeks):
             return dict(arc.get('midterm', {}))
-        elif week >= 10:
+        elif 4 * week > 3 * n_weeks:
             mods = dict(arc.get('exam_base', {}))
             if conscientiousness > 0.6:
                 for k, v in arc.get('exam_high_conscientiousness', {}).items():
@@ -342,6 +319,58 @@ class EngagementSystem:
             return mods
         return {}
 
+    def _period_temporal_modifiers(self, weeks: List[int], personality: Dict[str, float],
+                                   n_weeks: int = 12) -> Dict[str, float]:
+        """Temporal arc averaged over the teaching weeks a period covers."""
+        if len(weeks) == 1:
+            return self._get_temporal_modifiers(weeks[0], personality, n_weeks)
+        mods: Dict[str, float] = {}
+        for week in weeks:
+            for k, v in self._get_temporal_modifiers(week, personality, n_weeks).items():
+                mods[k] = mods.get(k, 0.0) + float(v) / len(weeks)
+        return mods
+
+    def _ar1_matrix(self, n: int, alpha: float) -> np.ndarray:
+        """A with d = scale * A z for the AR(1) in _generate_week_deviations: A[i, k] = alpha**(i - k), k <= i."""
+        lag = np.arange(n)[:, None] - np.arange(n)[None, :]
+        return np.where(lag >= 0, alpha ** np.maximum(lag, 0), 0.0)
+
+    def _resolution_calendar(self, n_weeks: int, resolution: str, alpha: float = 0.4):
+        """
+        Period calendar and rescaled noise for a temporal resolution.
+
+        Returns (period_weeks, alpha_r, dev_scale, module_noise_std):
+        - period_weeks: teaching weeks covered by each period (fortnight = 2 weeks,
+          teaching day = its week)
+        - alpha_r = alpha ** (1 / periods_per_week), so persistence per week is unchanged
+        - dev_scale multiplies noise_std so the semester mean of the deviations has the
+          same variance as at weekly resolution (AR(1) started at 0, as generated)
+        - module_noise_std = 0.05 * sqrt(periods_per_week): same variance of the
+          semester mean of module noise
+        """
+        if resolution not in self.RESOLUTIONS:
+            raise ValueError(f"Unknown engagement resolution: {resolution!r} (expected one of {list(self.RESOLUTIONS)})")
+        ppw = self.RESOLUTIONS[resolution]
+        if ppw >= 1:
+            per_week = int(ppw)
+            period_weeks = [[w] for w in range(1, n_weeks + 1) for _ in range(per_week)]
+        else:
+            span = int(round(1 / ppw))
+            if n_weeks % span:
+                raise ValueError(f"{resolution} resolution needs weeks_per_semester divisible by {span}")
+            if midterm_last_week(n_weeks) % span:
+                # A period straddling the end of the midterm window would carry a week past it
+                raise ValueError(f"{resolution} resolution needs the midterm window "
+                                 f"(weeks 1-{midterm_last_week(n_weeks)}) divisible by {span}")
+            period_weeks = [list(range(w, w + span)) for w in range(1, n_weeks + 1, span)]
+
+        def mean_dev_var(n: int, a: float) -> float:
+            return (1.0 - a ** 2) * float((self._ar1_matrix(n, a).sum(axis=0) ** 2).sum()) / n ** 2
+
+        alpha_r = alpha ** (1.0 / ppw)
+        dev_scale = float(np.sqrt(mean_dev_var(n_weeks, alpha) / mean_dev_var(len(period_weeks), alpha_r)))
+        return period_weeks, alpha_r, dev_scale, 0.05 * float(np.sqrt(ppw))
+
     def _generate_week_deviations(self, n_weeks: int, noise_std: float,
                                    alpha: float = 0.4) -> np.ndarray:
         """
@@ -361,6 +390,45 @@ class EngagementSystem:
     # Semester summary
     # ------------------------------------------------------------------
 
+    # Risk flags in reporting order: (flag, _METRIC_MAP index, threshold, raised above rather than below)
+    _RISK_FLAGS = (
+        ('low_attendance', 0, 0.7, False),
+        ('low_participation', 1, 0.5, False),
+        ('high_stress', 4, 0.7, True),
+        ('low_academic_engagement', 2, 0.5, False),
+    )
+
+    @classmethod
+    def _trends_and_risks(cls, averages: np.ndarray, first_half: np.ndarray,
+                          second_half: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Attendance trend (second vs first half) and risk flags for many students:
+        averages shape (students, metrics) in _METRIC_MAP order. Returns object arrays of
+        trends and comma-joined risk flags ('none' when no flag is raised).
+        """
+        trends = np.select([second_half > first_half + 0.05, second_half < first_half - 0.05],
+                           ['improving', 'declining'], 'stable').astype(object)
+        flags = np.stack([averages[:, k] > threshold if above else averages[:, k] < threshold
+                          for _, k, threshold, above in cls._RISK_FLAGS], axis=1)
+        names = [flag for flag, _, _, _ in cls._RISK_FLAGS]
+        labels = np.array([','.join(n for bit, n in enumerate(names) if code >> bit & 1) or 'none'
+                           for code in range(2 ** len(names))], dtype=object)
+        return trends, labels[flags @ (1 << np.arange(len(names)))]
+
+    @classmethod
+    def _trend_and_risk(cls, averages, first_half: float, second_half: float) -> Tuple[str, List[str]]:
+        """Attendance trend (second vs first half) and risk flags from semester averages (_METRIC_MAP order)."""
+        trends, risk_factors = cls._trends_and_risks(
+            np.asarray([averages], dtype=float), np.asarray([first_half]), np.asarray([second_half]))
+        return trends[0], [] if risk_factors[0] == 'none' else risk_factors[0].split(',')
+
+    def _summarise_semester(self, values: np.ndarray) -> Tuple[List[float], str, List[str]]:
+        """Semester averages, trend and risk flags from weekly values, shape (rows, metrics) in week order."""
+        averages = [float(np.mean(values[:, k])) for k in range(values.shape[1])]
+        mid = len(values) // 2
+        trend, risk_factors = self._trend_and_risk(averages, np.mean(values[:mid, 0]), np.mean(values[mid:, 0]))
+        return averages, trend, risk_factors
+
     def generate_semester_engagement(self, student_id: str, programme_year: int,
                                      weekly_engagements: List[WeeklyEngagement]
                                      ) -> Optional[SemesterEngagement]:
@@ -368,43 +436,19 @@ class EngagementSystem:
         if not weekly_engagements:
             return None
 
-        avg_attendance    = np.mean([w.attendance_rate for w in weekly_engagements])
-        avg_participation = np.mean([w.participation_score for w in weekly_engagements])
-        avg_academic      = np.mean([w.academic_engagement for w in weekly_engagements])
-        avg_social        = np.mean([w.social_engagement for w in weekly_engagements])
-        avg_stress        = np.mean([w.stress_level for w in weekly_engagements])
-
-        mid = len(weekly_engagements) // 2
-        first_half  = np.mean([w.attendance_rate for w in weekly_engagements[:mid]])
-        second_half = np.mean([w.attendance_rate for w in weekly_engagements[mid:]])
-
-        if second_half > first_half + 0.05:
-            trend = 'improving'
-        elif second_half < first_half - 0.05:
-            trend = 'declining'
-        else:
-            trend = 'stable'
-
-        risk_factors = []
-        if avg_attendance < 0.7:
-            risk_factors.append('low_attendance')
-        if avg_participation < 0.5:
-            risk_factors.append('low_participation')
-        if avg_stress > 0.7:
-            risk_factors.append('high_stress')
-        if avg_academic < 0.5:
-            risk_factors.append('low_academic_engagement')
-
+        values = np.array([[getattr(w, ok) for _, _, ok in self._METRIC_MAP] for w in weekly_engagements])
+        averages, trend, risk_factors = self._summarise_semester(values)
+        avg_attendance, avg_participation, avg_academic, avg_social, avg_stress = averages
         return SemesterEngagement(
             student_id=student_id,
             programme_year=programme_year,
             semester=0,  # summary mixes both teaching semesters
             program_code=weekly_engagements[0].program_code,
-            average_attendance=float(avg_attendance),
-            average_participation=float(avg_participation),
-            average_academic_engagement=float(avg_academic),
-            average_social_engagement=float(avg_social),
-            average_stress_level=float(avg_stress),
+            average_attendance=avg_attendance,
+            average_participation=avg_participation,
+            average_academic_engagement=avg_academic,
+            average_social_engagement=avg_social,
+            average_stress_level=avg_stress,
             engagement_trend=trend,
             risk_factors=risk_factors,
         )
@@ -471,7 +515,11 @@ class EngagementSystem:
         enrolled_students_df: pd.DataFrame,
         weeks_per_semester: int = 12,
         academic_year: str = "",
-    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        fidelity: str = "weekly",
+        grain: str = "module_week",
+        resolution: str = "weekly",
+        features: Optional[StudentFeatures] = None,
+    ) -> Tuple[pd.DataFrame, ...]:
         """
         Generate engagement data for all enrolled students.
 
@@ -484,10 +532,76 @@ class EngagementSystem:
           small independent module-level noise.
         - Stress is inverted relative to the week deviation (good week → less stress).
 
-        Returns: (weekly_engagement_df, semester_engagement_df)
+        fidelity: 'weekly' materialises one row per student per module per week;
+            'summary' skips the weeks and returns one row per student per module
+            (see generate_engagement_summary).
+
+        grain (weekly fidelity only): 'module_week' (default) returns the per-module
+            weekly rows; 'student_week' and 'both' also return one row per student per
+            week (per fortnight at fortnightly resolution; metrics averaged over the
+            modules taken that week, with n_modules),
+            accumulated during generation. With 'student_week' the per-module weekly
+            rows are not kept; the first frame instead holds per-module block means in
+            the generate_engagement_summary layout, computed from the generated weeks,
+            so AssessmentSystem and NSSSystem still get module-level engagement.
+
+        resolution (weekly fidelity only): 'weekly', 'fortnightly' or 'teaching_day'
+            (5 per week). One row per period; week_number stays the teaching week (the
+            last week a fortnight covers), plus a teaching_day column at day resolution.
+            alpha and the noise stds are rescaled so semester means keep the weekly
+            distribution, and the temporal arc is averaged over the weeks a period
+            covers, so weeks 1-8 / all-weeks means (assessment windows) are preserved.
+
+        features (summary fidelity only): StudentFeatures built from enrolled_students_df
+            (row-aligned); built here if None.
+
+        Returns: (weekly_engagement_df, semester_engagement_df) for grain='module_week',
+                 (module_df, semester_engagement_df, student_week_df) otherwise.
         """
-        weekly_data = []
-        semester_data = []
+        if grain not in self.GRAINS:
+            raise ValueError(f"Unknown engagement grain: {grain!r} (expected one of {self.GRAINS})")
+        if fidelity == "summary":
+            if grain != "module_week" or resolution != "weekly":
+                raise ValueError("Summary fidelity has no weekly rows; use grain='module_week', resolution='weekly'")
+            return self.generate_engagement_summary(
+                enrolled_students_df, weeks_per_semester=weeks_per_semester, academic_year=academic_year,
+                features=features,
+            )
+        if fidelity != "weekly":
+            raise ValueError(f"Unknown engagement fidelity: {fidelity!r} (expected 'weekly' or 'summary')")
+        keep_module_weeks = grain in ("module_week", "both")
+        keep_student_weeks = grain in ("student_week", "both")
+        period_weeks, alpha_r, dev_scale, module_noise_std = self._resolution_calendar(weeks_per_semester, resolution)
+        block_weeks = self._block_weeks(weeks_per_semester)
+        block_ends = list(range(block_weeks, weeks_per_semester + 1, block_weeks))
+        metric_cols = [ok for _, _, ok in self._METRIC_MAP]
+        base_keys = [bk for bk, _, _ in self._METRIC_MAP]
+        sign = np.array([-1.0 if sk == 'stress' else 1.0 for _, sk, _ in self._METRIC_MAP])
+        n_metrics = len(metric_cols)
+        has_year = bool(academic_year) or 'academic_year' in enrolled_students_df.columns
+
+        # --- Column batches (one preallocated array per output column) ---
+        year_col = {'academic_year': object} if has_year else {}
+        metric_schema = dict.fromkeys(metric_cols, np.float64)
+        weekly_schema = {'student_id': object, 'week_number': np.int64, 'program_code': object,
+                         'module_title': object, 'semester': np.int64}
+        if resolution == 'teaching_day':
+            weekly_schema['teaching_day'] = np.int64
+        weekly_schema.update(year_col)
+        weekly_schema.update(metric_schema)
+        weekly_schema.update(dict.fromkeys(self._ANALYSIS_COLS, np.float64))
+        weekly = RecordBatchBuilder(weekly_schema, capacity=len(enrolled_students_df) * len(period_weeks) * 6)
+        student_weeks = RecordBatchBuilder({
+            'student_id': object, 'week_number': np.int64, 'program_code': object,
+            **year_col, 'n_modules': np.int64, **metric_schema,
+        })
+        module_blocks = RecordBatchBuilder({
+            'student_id': object, 'week_number': np.int64, 'weeks_covered': np.int64,
+            'program_code': object, 'module_title': object, 'semester': np.int64,
+            **year_col, **metric_schema,
+        })
+        semesters = RecordBatchBuilder(self._SEMESTER_SCHEMA if not has_year
+                                       else {**self._SEMESTER_SCHEMA, **year_col})
 
         personality_cols = [c for c in enrolled_students_df.columns if c.startswith('refined_')]
         motivation_cols  = [c for c in enrolled_students_df.columns if c.startswith('motivation_')]
@@ -497,6 +611,7 @@ class EngagementSystem:
             sid_raw = student.get("student_id", idx)
             student_id = str(sid_raw.iloc[0]) if isinstance(sid_raw, pd.Series) else str(sid_raw)
             ay = academic_year or str(student.get('academic_year', ''))
+            year_val = {'academic_year': ay} if has_year else {}
 
             personality = {c: student[c] for c in personality_cols}
             motivation  = {c: student[c] for c in motivation_cols}
@@ -524,99 +639,353 @@ class EngagementSystem:
                     base_engagement[bk] = float(np.clip(base_engagement[bk] + adj, 0.05, 0.95))
 
             # --- Per-module base (module difficulty/social/creativity) ---
+            titles = [m for m in (module.strip() for module in modules) if m]
+            module_ids = self.modules.module_ids(titles)
             module_bases: Dict[str, Dict] = {}
-            for module in modules:
-                m = module.strip()
-                if m:
-                    module_chars = self.get_module_characteristics(m)
-                    module_bases[m] = self.apply_module_modifiers(dict(base_engagement), module_chars, personality)
+            for m in titles:
+                module_bases[m] = self.apply_module_modifiers(
+                    dict(base_engagement), self.modules.characteristics(m), personality)
+            n_mod = len(titles)
+            base = np.array([[module_bases[m].get(bk, 0.5) for bk in base_keys] for m in titles]).reshape(n_mod, n_metrics)
+            module_semesters = self.modules.semester[module_ids]
+            analysis = {
+                'module_difficulty':              self.modules.difficulty[module_ids],
+                'module_social_requirements':     self.modules.social_requirements[module_ids],
+                'module_creativity_requirements': self.modules.creativity_requirements[module_ids],
+                'personality_conscientiousness':  personality.get('refined_conscientiousness', 0.5),
+                'personality_extraversion':       personality.get('refined_extraversion', 0.5),
+                'motivation_academic_drive':      motivation.get('motivation_academic_drive', 0.5),
+                'motivation_social_connection':   motivation.get('motivation_social_connection', 0.5),
+            }
 
             # --- Autocorrelated week deviations ---
-            # Arc alignment: weeks 1-2 = early enthusiasm, 6-8 = midterm crunch, 10-12 = exam stress.
-            # The MIDTERM assessment component uses the weeks 1-8 engagement average (captures the crunch);
-            # the FINAL component uses all 12 weeks. This alignment is emergent from the temporal arc.
+            # Arc alignment (12 weeks; phases scale with the semester): weeks 1-2 = early enthusiasm,
+            # 6-8 = midterm crunch, 10-12 = exam stress. The MIDTERM assessment component uses the
+            # weeks 1-8 engagement average (captures the crunch); the FINAL component uses all weeks.
+            # This alignment is emergent from the temporal arc.
             noise_std = 0.12 + self._get_disability_std_extra(disabilities)
-            week_devs = self._generate_week_deviations(weeks_per_semester, noise_std)
-
-            # --- Generate weekly records ---
-            all_weekly: List[WeeklyEngagement] = []
-
-            for w_idx, week in enumerate(range(1, weeks_per_semester + 1)):
-                t_mods   = self._get_temporal_modifiers(week, personality)
-                week_dev = week_devs[w_idx]
-
-                for module in modules:
-                    m = module.strip()
-                    if not m:
-                        continue
-
-                    mod_base = module_bases.get(m, base_engagement)
-                    mod_semester = self._module_chars.get(m, {}).get('semester', 1)
-                    rec: Dict = {
-                        'student_id':   student_id,
-                        'week_number':  week,
-                        'program_code': program_code,
-                        'module_title': m,
-                        'semester':     mod_semester,
-                    }
-                    if ay:
-                        rec['academic_year'] = ay
-
-                    for bk, sk, ok in self._METRIC_MAP:
-                        base_val = mod_base.get(bk, 0.5)
-                        # Stress inverted: positive week_dev = good week = less stress
-                        if sk == 'stress':
-                            val = base_val - week_dev + t_mods.get('stress', 0.0)
-                        else:
-                            val = base_val + week_dev + t_mods.get(sk, 0.0)
-                        val += np.random.normal(0, 0.05)  # small module-specific noise
-                        rec[ok] = float(np.clip(val, 0.05, 0.95))
-
-                    # Analysis columns
-                    module_chars = self.get_module_characteristics(m)
-                    rec['module_difficulty']              = module_chars['difficulty']
-                    rec['module_social_requirements']     = module_chars['social_requirements']
-                    rec['module_creativity_requirements'] = module_chars['creativity_requirements']
-                    rec['personality_conscientiousness']  = personality.get('refined_conscientiousness', 0.5)
-                    rec['personality_extraversion']       = personality.get('refined_extraversion', 0.5)
-                    rec['motivation_academic_drive']      = motivation.get('motivation_academic_drive', 0.5)
-                    rec['motivation_social_connection']   = motivation.get('motivation_social_connection', 0.5)
-
-                    all_weekly.append(WeeklyEngagement(
-                        student_id=student_id,
-                        week_number=week,
-                        program_code=program_code,
-                        module_title=m,
-                        attendance_rate=rec['attendance_rate'],
-                        participation_score=rec['participation_score'],
-                        academic_engagement=rec['academic_engagement'],
-                        social_engagement=rec['social_engagement'],
-                        stress_level=rec['stress_level'],
-                        engagement_factors={},
-                    ))
-                    weekly_data.append(rec)
+            week_devs = self._generate_week_deviations(len(period_weeks), noise_std * dev_scale, alpha=alpha_r)
+
+            # --- Generate weekly records (one block of n_mod rows per period) ---
+            student_values: List[np.ndarray] = []   # per-period (n_mod, metrics), for the semester summary
+            # Per-module block sums (student_week grain keeps these instead of the weekly rows)
+            block_titles = list(dict.fromkeys(titles))
+            block_slot = np.array([block_titles.index(m) for m in titles], dtype=np.int64)
+            block_sums = np.zeros((len(block_titles), len(block_ends), n_metrics + 1))
+
+            for w_idx, covered in enumerate(period_weeks):
+                week     = covered[-1]
+                t_mods   = self._period_temporal_modifiers(covered, personality, weeks_per_semester)
+                if w_idx == 0 or period_weeks[w_idx - 1][-1] != week:
+                    week_values: List[np.ndarray] = []
+                if not n_mod:
+                    continue
+
+                # Stress inverted: positive week_dev = good week = less stress
+                t_vec  = np.array([t_mods.get(sk, 0.0) for _, sk, _ in self._METRIC_MAP])
+                noise  = np.random.normal(0, module_noise_std, size=(n_mod, n_metrics))  # small module-specific noise
+                values = np.clip(base + sign * week_devs[w_idx] + t_vec + noise, 0.05, 0.95)
+                student_values.append(values)
+
+                if keep_module_weeks:
+                    extra = {'teaching_day': w_idx + 1} if resolution == 'teaching_day' else {}
+                    weekly.extend(
+                        n_mod, student_id=student_id, week_number=week, program_code=program_code,
+                        module_title=titles, semester=module_semesters, **extra, **year_val,
+                        **{ok: values[:, k] for k, ok in enumerate(metric_cols)}, **analysis,
+                    )
+
+                if keep_student_weeks:
+                    week_values.append(values)
+                    if not keep_module_weeks:
+                        b = (week - 1) // block_weeks
+                        np.add.at(block_sums[:, b, :-1], block_slot, values)
+                        np.add.at(block_sums[:, b, -1], block_slot, 1)
+
+                week_done = w_idx == len(period_weeks) - 1 or period_weeks[w_idx + 1][-1] != week
+                if keep_student_weeks and week_done:
+                    week_mean = np.concatenate(week_values).sum(axis=0) / (n_mod * len(week_values))
+                    student_weeks.extend(
+                        1, student_id=student_id, week_number=week, program_code=program_code,
+                        **year_val, n_modules=n_mod, **dict(zip(metric_cols, week_mean)),
+                    )
+
+            if not keep_module_weeks and student_values:
+                n_blocks = len(block_ends)
+                block_means = block_sums[:, :, :-1] / block_sums[:, :, -1:]
+                module_blocks.extend(
+                    len(block_titles) * n_blocks, student_id=student_id,
+                    week_number=np.tile(block_ends, len(block_titles)), weeks_covered=block_weeks,
+                    program_code=program_code, module_title=np.repeat(np.array(block_titles, dtype=object), n_blocks),
+                    semester=np.repeat(self.modules.semester[self.modules.module_ids(block_titles)], n_blocks),
+                    **year_val, **{ok: block_means[:, :, k].ravel() for k, ok in enumerate(metric_cols)},
+                )
 
             # --- Semester summary ---
-            if all_weekly:
-                sem = self.generate_semester_engagement(student_id, prog_year, all_weekly)
-                if sem:
-                    d = {
-                        'student_id':                    sem.student_id,
-                        'programme_year':                sem.programme_year,
-                        'program_code':                  sem.program_code,
-                        'average_attendance':            sem.average_attendance,
-                        'average_participation':         sem.average_participation,
-                        'average_academic_engagement':   sem.average_academic_engagement,
-                        'average_social_engagement':     sem.average_social_engagement,
-                        'average_stress_level':          sem.average_stress_level,
-                        'engagement_trend':              sem.engagement_trend,
-                        'risk_factors': ','.join(sem.risk_factors) if sem.risk_factors else 'none',
-                    }
-                    if ay:
-                        d['academic_year'] = ay
-                    semester_data.append(d)
+            if student_values:
+                averages, trend, risk_factors = self._summarise_semester(np.concatenate(student_values))
+                semesters.extend(
+                    1, student_id=student_id, programme_year=prog_year, program_code=program_code,
+                    **dict(zip(self._SEMESTER_AVERAGES, averages)), engagement_trend=trend,
+                    risk_factors=','.join(risk_factors) if risk_factors else 'none', **year_val,
+                )
+
+        if grain == "module_week":
+            return weekly.to_frame(), semesters.to_frame()
+        module_df = weekly.to_frame() if keep_module_weeks else module_blocks.to_frame()
+        return module_df, semesters.to_frame(), student_weeks.to_frame()
+
+    # ------------------------------------------------------------------
+    # Summary-only generation (no weekly rows)
+    # ------------------------------------------------------------------
+
+    def _block_weeks(self, n_weeks: int) -> int:
+        """Widest equal block width that also divides the midterm window (12 weeks -> 4)."""
+        return int(np.gcd(midterm_last_week(n_weeks), n_weeks))
+
+    def _summary_segments(self, n_weeks: int, block_weeks: int) -> List[Tuple[int, int]]:
+        """Finest week partition summary mode needs: block edges plus the half-semester split."""
+        edges = sorted((set(range(block_weeks, n_weeks + 1, block_weeks)) | {n_weeks // 2}) - {0})
+        return list(zip([0] + edges[:-1], edges))  # 0-based, half-open
+
+    def _segment_deviation_factor(self, segments: List[Tuple[int, int]], n_weeks: int,
+                                  alpha: float = 0.4) -> np.ndarray:
+        """
+        Cholesky factor of the covariance of segment-mean week deviations (unit noise_std).
+
+        _generate_week_deviations gives d = scale * A z (see _ar1_matrix),
+        so segment means S d have covariance noise_std^2 * (1 - alpha^2) * S A A' S'.
+        """
+        A = self._ar1_matrix(n_weeks, alpha)
+        S = np.zeros((len(segments), n_weeks))
+        for j, (a, b) in enumerate(segments):
+            S[j, a:b] = 1.0 / (b - a)
+        return np.linalg.cholesky((1.0 - alpha ** 2) * S @ A @ A.T @ S.T)
+
+    def _segment_arc(self, segments: List[Tuple[int, int]], n_weeks: int = 12) -> np.ndarray:
+        """Temporal arc averaged per segment: shape (2, n_segments, n_metrics), [low, high] conscientiousness."""
+        arc = np.zeros((2, len(segments), len(self._METRIC_MAP)))
+        for g, consc in enumerate((0.0, 1.0)):
+            for j, (a, b) in enumerate(segments):
+                for week in range(a + 1, b + 1):
+                    t_mods = self._get_temporal_modifiers(week, {'refined_conscientiousness': consc}, n_weeks)
+                    for k, (_, sk, _) in enumerate(self._METRIC_MAP):
+                        arc[g, j, k] += t_mods.get(sk, 0.0) / (b - a)
+        return arc
+
+    def _base_engagement_arrays(self, features: StudentFeatures) -> np.ndarray:
+        """
+        calculate_base_engagement plus the disability and SES adjustments, for every
+        student at once: shape (students, metrics) in _METRIC_MAP order.
+        """
+        t = features.trait
+        base = np.stack([
+            np.clip(t('refined_conscientiousness') * 0.4 + t('motivation_academic_drive') * 0.3
+                    + t('refined_resilience') * 0.2 + t('motivation_practical_skills') * 0.1, 0.1, 0.95),
+            np.clip(t('refined_extraversion') * 0.4 + t('motivation_social_connection') * 0.3
+                    + t('refined_leadership_tendency') * 0.2 + t('refined_social_anxiety') * -0.1, 0.1, 0.95),
+            np.clip(t('refined_academic_curiosity') * 0.4 + t('motivation_intellectual_curiosity') * 0.3
+                    + t('refined_openness') * 0.2 + t('motivation_academic_drive') * 0.1, 0.1, 0.95),
+            np.clip(t('refined_extraversion') * 0.5 + t('motivation_social_connection') * 0.3
+                    + t('refined_leadership_tendency') * 0.2, 0.1, 0.95),
+            np.clip(t('refined_neuroticism') * 0.4 + t('refined_social_anxiety') * 0.3
+                    + (1 - t('refined_resilience')) * 0.2 + (1 - t('motivation_personal_growth')) * 0.1, 0.05, 0.9),
+        ], axis=1)
+
+        # Adjustments per distinct disabilities string / SES rank (0 for metrics a modifier leaves alone)
+        adjustments = (
+            ('disability', 'disabilities', lambda v: self._get_disability_base_mods(str(v))),
+            ('ses', 'socio_economic_rank', lambda v: self._get_ses_mods(int(v))),
+        )
+        for key, name, mods in adjustments:
+            for k, (_, sk, _) in enumerate(self._METRIC_MAP):
+                adj = features.modifier(f'engagement_{key}_{sk}', name, lambda v: float(mods(v).get(sk, 0.0)))
+                base[:, k] = np.clip(base[:, k] + adj, 0.05, 0.95)
+        return base
+
+    def _module_base_arrays(self, base: np.ndarray, module_ids: np.ndarray, conscientiousness: np.ndarray,
+                            extraversion: np.ndarray, openness: np.ndarray) -> np.ndarray:
+        """apply_module_modifiers for (student, module) pairs: base rows, module IDs and traits per pair."""
+        base = base.copy()
+        att, part, acad, soc, stress = range(len(self._METRIC_MAP))
+
+        difficulty = (self.modules.difficulty[module_ids] - 0.5) * 0.2
+        high = conscientiousness > 0.7
+        base[:, att] = np.where(high, base[:, att] + difficulty * 0.5, base[:, att] - difficulty * 0.3)
+        base[:, acad] = np.where(high, base[:, acad] + difficulty, base[:, acad] - difficulty * 0.5)
+
+        social = (self.modules.social_requirements[module_ids] - 0.5) * 0.3
+        high = extraversion > 0.6
+        base[:, part] = np.where(high, base[:, part] + social, base[:, part] - social * 0.5)
+        base[:, soc] = np.where(high, base[:, soc] + social, base[:, soc] - social * 0.3)
+        base[:, stress] = np.where(high, base[:, stress], base[:, stress] + social * 0.2)
+
+        creativity = (self.modules.creativity_requirements[module_ids] - 0.5) * 0.2
+        base[:, acad] = np.where(openness > 0.6, base[:, acad] + creativity, base[:, acad] - creativity * 0.5)
+
+        clip_max = np.array([0.9 if bk == 'base_stress' else 0.95 for bk, _, _ in self._METRIC_MAP])
+        return np.clip(base, 0.05, clip_max)
+
+    @staticmethod
+    def _clipped_moments(mean: np.ndarray, std: np.ndarray, low: float = 0.05,
+                         high: float = 0.95) -> Tuple[np.ndarray, np.ndarray]:
+        """For X ~ N(mean, std^2): E[clip(X, low, high)] - mean, and sd(clip(X)) / std."""
+        a, b = (low - mean) / std, (high - mean) / std
+        cdf_a, tail_b = ndtr(a), ndtr(-b)
+        pdf_a, pdf_b = np.exp(-0.5 * a * a) / np.sqrt(2 * np.pi), np.exp(-0.5 * b * b) / np.sqrt(2 * np.pi)
+        inside = 1.0 - cdf_a - tail_b
+        # Moments of Z = (clip(X) - mean) / std: a below, b above, standard normal in between
+        m1 = a * cdf_a + b * tail_b + (pdf_a - pdf_b)
+        m2 = a * a * cdf_a + b * b * tail_b + inside + (a * pdf_a - b * pdf_b)
+        return std * m1, np.sqrt(np.maximum(m2 - m1 * m1, 0.0))
+
+    def generate_engagement_summary(
+        self,
+        enrolled_students_df: pd.DataFrame,
+        weeks_per_semester: int = 12,
+        academic_year: str = "",
+        features: Optional[StudentFeatures] = None,
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Summary-only engagement: same model as generate_engagement_data, without weekly rows.
+
+        Per (student, module) the metric means over equal-width week blocks are drawn
+        directly from their joint distribution. Segment means of the AR(1) deviation
+        are Gaussian with a covariance that follows from alpha (shared by a student's
+        modules), the module noise mean over a segment is N(0, 0.05^2 / weeks), and the
+        temporal arc is deterministic. The block width divides the midterm window
+        (midterm_last_week: weeks 1-8 of 12), so with 12 weeks each module gets three rows
+        (weeks 1-4, 5-8, 9-12) with week_number = last week of the block.
+
+        Because blocks are equal width, the existing consumers read this frame unchanged:
+        AssessmentSystem's midterm-window / all-weeks means are the weeks 1-8 / 1-12 means,
+        and NSSSystem's per-student mean is the semester mean.
+
+        Clipping: weekly fidelity clips each week to [0.05, 0.95]. Each segment mean is
+        shifted by the mean over its weeks of E[clip(x)] - E[x] (x the Gaussian weekly
+        value), so block and semester means match weekly fidelity in expectation; their
+        spread is that of the unclipped means (slightly wider near the bounds), and the
+        shifted means are clipped to [0.05, 0.95]. Uses the global np.random stream, like
+        weekly fidelity (draws differ).
+
+        features: StudentFeatures built from enrolled_students_df (row-aligned); built
+            here if None.
+
+        Returns: (engagement_summary_df, semester_engagement_df)
+        """
+        n_weeks = weeks_per_semester
+        block_weeks = self._block_weeks(n_weeks)
+        segments = self._summary_segments(n_weeks, block_weeks)
+        seg_len = np.array([b - a for a, b in segments], dtype=float)
+        n_metrics = len(self._METRIC_MAP)
+        if features is None:
+            features = StudentFeatures(enrolled_students_df)
+
+        # --- Module lists: the programme year's column, parsed once per distinct list ---
+        df = enrolled_students_df
+        prog_years = features.programme_year
+        module_lists = np.full(len(features), '', dtype=object)
+        for year in np.unique(prog_years):
+            col = f'year{year}_modules' if f'year{year}_modules' in df.columns else 'year1_modules'
+            if col in df.columns:
+                in_year = prog_years == year
+                module_lists[in_year] = df[col].to_numpy(dtype=object)[in_year]
+        list_codes, list_values = pd.factorize(module_lists, use_na_sentinel=False)
+        list_ids = [self.modules.module_ids(_parse_module_list_csv(v)) for v in list_values]
+        rows = np.flatnonzero(np.array([len(ids) for ids in list_ids], dtype=np.int64)[list_codes])
+        if not len(rows):
+            return pd.DataFrame(), pd.DataFrame()
+
+        # --- Per-student and per-(student, module) bases ---
+        pair_module = np.concatenate([list_ids[c] for c in list_codes[rows]])
+        pair_student = np.repeat(np.arange(len(rows)), [len(list_ids[c]) for c in list_codes[rows]])
+        pair_rows = rows[pair_student]
+        base = self._module_base_arrays(
+            self._base_engagement_arrays(features)[pair_rows], pair_module,
+            features.trait('refined_conscientiousness', pair_rows), features.trait('refined_extraversion', pair_rows),
+            features.trait('refined_openness', pair_rows),
+        )                                                              # (pairs, metrics)
+        noise_stds = 0.12 + features.modifier(
+            'engagement_std_extra', 'disabilities', lambda v: self._get_disability_std_extra(str(v)))[rows]
+        high_consc = (features.trait('refined_conscientiousness', rows) > 0.6).astype(int)
+        sign = np.array([-1.0 if sk == 'stress' else 1.0 for _, sk, _ in self._METRIC_MAP])
+
+        # --- Joint draw of segment means ---
+        n_students, n_pairs, n_seg = len(rows), len(base), len(segments)
+        dev = noise_stds[:, None] * (
+            np.random.standard_normal((n_students, n_seg)) @ self._segment_deviation_factor(segments, n_weeks).T
+        )                                                              # (students, segments)
+        arc = self._segment_arc(segments, n_weeks)[high_consc]          # (students, segments, metrics)
+        module_noise = np.random.standard_normal((n_pairs, n_seg, n_metrics)) * (0.05 / np.sqrt(seg_len))[None, :, None]
+
+        # --- Weekly clipping: each week is N(base + arc, dev variance + 0.05^2) before the clip ---
+        alpha = 0.4
+        week_arc = self._segment_arc([(w, w + 1) for w in range(n_weeks)], n_weeks)[high_consc]
+        dev_var = (1.0 - alpha ** 2) * (self._ar1_matrix(n_weeks, alpha) ** 2).sum(axis=1)
+        week_std = np.sqrt(noise_stds[:, None] ** 2 * dev_var[None, :] + 0.05 ** 2)   # (students, weeks)
+        shift = np.zeros((n_pairs, n_seg, n_metrics))
+        scale = np.zeros((n_pairs, n_seg, n_metrics))
+        for j, (a, b) in enumerate(segments):
+            for w in range(a, b):
+                week_shift, week_scale = self._clipped_moments(
+                    base + week_arc[pair_student, w], week_std[pair_student, w, None])
+                shift[:, j] += week_shift / (b - a)
+                scale[:, j] += week_scale / (b - a)
+
+        seg_means = np.clip(
+            base[:, None, :]
+            + arc[pair_student]
+            + shift
+            + scale * (sign[None, None, :] * dev[pair_student][:, :, None] + module_noise),
+            0.05, 0.95,
+        )                                                              # (pairs, segments, metrics)
+
+        # --- Block rows (equal-width, length-weighted segment means) ---
+        block_ends = list(range(block_weeks, n_weeks + 1, block_weeks))
+        to_block = np.array([[(b - a) / block_weeks if end - block_weeks <= a and b <= end else 0.0
+                              for a, b in segments] for end in block_ends])
+        block_means = np.einsum('psk,bs->pbk', seg_means, to_block)    # (pairs, blocks, metrics)
+
+        n_blocks = len(block_ends)
+        pair_rep = np.repeat(np.arange(n_pairs), n_blocks)
+        student_ids = features.student_ids[rows]
+        program_codes = features.columns['program_code'][rows]
+        summary_df = pd.DataFrame({
+            'student_id':   student_ids[pair_student[pair_rep]],
+            'week_number':  np.tile(block_ends, n_pairs),
+            'weeks_covered': block_weeks,
+            'program_code': program_codes[pair_student[pair_rep]],
+            'module_title': np.asarray(self.modules.titles, dtype=object)[pair_module[pair_rep]],
+            'semester':     self.modules.semester[pair_module[pair_rep]],
+        })
+        if academic_year:
+            summary_df['academic_year'] = academic_year
+        for k, (_, _, ok) in enumerate(self._METRIC_MAP):
+            summary_df[ok] = block_means[:, :, k].ravel()
+
+        # --- Semester summary ---
+        semester_means = np.einsum('psk,s->pk', seg_means, seg_len / n_weeks)
+        in_first = np.array([b <= n_weeks // 2 for _, b in segments])
+        att_first = seg_means[:, in_first, 0] @ (seg_len[in_first] / seg_len[in_first].sum())
+        att_second = seg_means[:, ~in_first, 0] @ (seg_len[~in_first] / seg_len[~in_first].sum())
+        per_student = pd.DataFrame(semester_means, columns=[ok for _, _, ok in self._METRIC_MAP])
+        per_student['first_half'] = att_first
+        per_student['second_half'] = att_second
+        per_student = per_student.groupby(pair_student).mean()
+
+        averages = per_student[[ok for _, _, ok in self._METRIC_MAP]].to_numpy()
+        trends, risk_factors = self._trends_and_risks(
+            averages, per_student['first_half'].to_numpy(), per_student['second_half'].to_numpy())
+        year_col = {'academic_year': object} if academic_year else {}
+        semesters = RecordBatchBuilder({**self._SEMESTER_SCHEMA, **year_col}, capacity=len(per_student))
+        year_val = {'academic_year': academic_year} if academic_year else {}
+        semesters.extend(
+            len(per_student), student_id=student_ids, programme_year=prog_years[rows], program_code=program_codes,
+            **{name: averages[:, k] for k, name in enumerate(self._SEMESTER_AVERAGES)}, engagement_trend=trends,
+            risk_factors=risk_factors, **year_val,
+        )
 
-        return pd.DataFrame(weekly_data), pd.DataFrame(semester_data)
+        return summary_df, semesters.to_frame()
 
 
 def main():
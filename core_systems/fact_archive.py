@@ -0,0 +1,95 @@
+"""
+Stonegrove University Fact Archive
+
+Cold, on-disk tier for the longitudinal pipeline's per-year facts (enrollment,
+assessment, progression, students, graduate outcomes, NSS). Each year's frame is
+written to data/archive/<name>/<NNNN>.pkl as soon as the year is done, so nothing
+accumulates in memory across years. At the end of the run write_csv() streams a
+fact's parts, one at a time, into its output CSV.
+
+The CSV matches pd.concat over the parts: columns in order of first appearance, and
+each column's dtype unified across parts (an integer column missing from some part
+becomes float, as concat's NaN fill makes it; mixed non-numeric columns become
+object), so the text written is the same as concatenating in memory.
+"""
+
+import pickle
+import shutil
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def _common_dtype(dtypes: List, missing: bool):
+    """dtype pd.concat gives a column with these part dtypes (missing: absent from some part)."""
+    first = dtypes[0]
+    if all(d == first for d in dtypes) and not (missing and first.kind in 'iub'):
+        return first
+    if all(isinstance(d, np.dtype) and d.kind in 'iuf' for d in dtypes):
+        return np.result_type(*dtypes, *([np.float64] if missing else []))
+    return np.dtype(object)
+
+
+class FactArchive:
+    """Per-year fact frames on disk, concatenated into CSVs at the end of a run."""
+
+    __slots__ = ('directory', '_parts', '_columns', '_dtypes')
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._parts: Dict[str, List[Path]] = {}
+        self._columns: Dict[str, List[str]] = {}           # union, in order of first appearance
+        self._dtypes: Dict[str, List[Dict[str, object]]] = {}  # per part: column -> dtype
+
+    def append(self, name: str, df: Optional[pd.DataFrame]) -> None:
+        """Write one year's frame for fact `name` (skipped if None or empty)."""
+        if df is None or df.empty:
+            return
+        df = df.loc[:, ~df.columns.duplicated()]
+        parts = self._parts.setdefault(name, [])
+        path = self.directory / name / f"{len(parts):04d}.pkl"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_pickle(path, protocol=pickle.HIGHEST_PROTOCOL)
+        parts.append(path)
+        columns = self._columns.setdefault(name, [])
+        columns.extend(c for c in df.columns if c not in columns)
+        self._dtypes.setdefault(name, []).append(dict(df.dtypes.items()))
+
+    def __contains__(self, name: str) -> bool:
+        return bool(self._parts.get(name))
+
+    def dtypes(self, name: str) -> Dict[str, object]:
+        """Unified dtype of each column of fact `name`."""
+        part_dtypes = self._dtypes[name]
+        out = {}
+        for col in self._columns[name]:
+            present = [d[col] for d in part_dtypes if col in d]
+            out[col] = _common_dtype(present, missing=len(present) < len(part_dtypes))
+        return out
+
+    def write_csv(self, name: str, path, transform: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None) -> int:
+        """
+        Stream fact `name` into one CSV (parts in order). transform, if given, is applied
+        to each part after columns are aligned. Returns rows written.
+        """
+        columns = self._columns[name]
+        dtypes = self.dtypes(name)
+        rows = 0
+        with open(path, 'w', newline='') as f:
+            for i, part_path in enumerate(self._parts[name]):
+                part = pd.read_pickle(part_path).reindex(columns=columns)
+                for col, dtype in dtypes.items():
+                    if part[col].dtype != dtype:
+                        part[col] = part[col].astype(dtype)
+                if transform is not None:
+                    part = transform(part)
+                part.to_csv(f, header=(i == 0), index=False)
+                rows += len(part)
+        return rows
+
+    def clear(self) -> None:
+        """Remove the archive directory."""
+        shutil.rmtree(self.directory, ignore_errors=True)
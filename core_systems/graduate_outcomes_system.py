@@ -8,31 +8,133 @@ Outcome gaps emerge from: degree classification, SES, disability, programme, per
 No direct species/clan modifier — same design principle as the assessment system.
 """
 
+import sys
 import numpy as np
 import pandas as pd
 import yaml
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, Mapping, Optional
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core_systems.aggregation_cube import AggregationCube, faculties, subgroups
+from core_systems.assessment_storage import final_marks
+from core_systems.marks_ledger import MarksLedger
+from core_systems.student_features import StudentFeatures, ses_modifier
 
-def _log_odds(p: float) -> float:
+
+def _log_odds(p):
     p = np.clip(p, 1e-6, 1 - 1e-6)
-    return float(np.log(p / (1 - p)))
+    return np.log(p / (1 - p))
+
+
+def _inv_log_odds(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+# UK degree classification boundaries (weighted average mark), highest first
+DEGREE_BOUNDARIES = ((70, "First"), (60, "2:1"), (50, "2:2"))
+
+
+def _degree_classification(avg_marks) -> np.ndarray:
+    """UK degree classification per weighted average mark (below 50, or NaN: Third)."""
+    avg_marks = np.asarray(avg_marks, dtype=float)
+    return np.select(
+        [avg_marks >= bound for bound, _ in DEGREE_BOUNDARIES],
+        [label for _, label in DEGREE_BOUNDARIES],
+        default="Third",
+    ).astype(object)
+
 
+def _group_means(values: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    Mean of values per group code (NaN skipped; NaN for groups with no values), summed
+    in row order the way Series.mean sums one group: groups of equal size are
+    stacked as rows and summed along the row, so results match a per-group mean
+    to the last bit.
+    """
+    order = np.argsort(codes, kind='stable')
+    values = values[order]
+    valid = ~np.isnan(values)
+    values = np.where(valid, values, 0.0)
+    sizes = np.bincount(codes, minlength=n_groups)
+    counts = np.bincount(codes[order], weights=valid, minlength=n_groups)
+    starts = np.cumsum(sizes) - sizes
+    sums = np.zeros(n_groups)
+    for size in np.unique(sizes[sizes > 0]):
+        groups = np.flatnonzero(sizes == size)
+        sums[groups] = values[starts[groups][:, None] + np.arange(size)].sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+DEGREE_CLASSES = ("First", "2:1", "2:2", "Third")
+OUTCOME_TYPES = ("employed", "further_study", "unemployed", "unknown")
+_EMPLOYED = OUTCOME_TYPES.index("employed")
+_FURTHER_STUDY = OUTCOME_TYPES.index("further_study")
+
+
+class OutcomeTables:
+    """
+    graduate_outcomes.yaml compiled once for batch draws: outcome-type CDFs and
+    professional / salary offsets per degree class (DEGREE_CLASSES), triangular
+    time-to-outcome parameters per outcome type (OUTCOME_TYPES), and lookups
+    resolved once per distinct faculty or SES rank.
+    """
 
-def _inv_log_odds(x: float) -> float:
-    return float(1.0 / (1.0 + np.exp(-x)))
+    __slots__ = ('type_cdf', 'professional_log_odds', 'salary_base', 'time_params',
+                 'faculty_base', 'faculty_sectors', 'ses_professional', 'ses_salary',
+                 'disability_professional', 'extraversion_weight', 'conscientiousness_weight',
+                 'career_weight')
 
+    def __init__(self, config: Mapping):
+        base = config.get("base_outcome_probabilities", {
+            "employed": 0.65, "further_study": 0.20,
+            "unemployed": 0.10, "unknown": 0.05,
+        })
+        modifiers = config.get("degree_classification_modifiers", {})
+        employment = modifiers.get("employment_log_odds", {})
+        further_study = modifiers.get("further_study_log_odds", {})
+        professional = modifiers.get("professional_log_odds", {})
+
+        # Outcome type: employed / further_study shifted by degree class, then renormalised
+        probs = np.array([
+            [
+                np.clip(_inv_log_odds(_log_odds(base["employed"]) + employment.get(c, 0.0)), 0.05, 0.95),
+                np.clip(_inv_log_odds(_log_odds(base["further_study"]) + further_study.get(c, 0.0)), 0.02, 0.50),
+                base["unemployed"],
+                base["unknown"],
+            ]
+            for c in DEGREE_CLASSES
+        ], dtype=float)
+        probs /= probs.sum(axis=1, keepdims=True)
+        self.type_cdf = probs.cumsum(axis=1)
+        self.type_cdf /= self.type_cdf[:, -1:]
+
+        self.professional_log_odds = np.array([professional.get(c, 0.0) for c in DEGREE_CLASSES], dtype=float)
+        self.salary_base = np.array(
+            [config.get("salary_band_base", {}).get(c, 2) for c in DEGREE_CLASSES], dtype=float,
+        )
+        times = config.get("time_to_outcome_months", {})
+        default_time = {"min": 0, "mode": 6, "max": 18}
+        self.time_params = np.array([
+            [times.get(t, default_time)[k] for k in ("min", "mode", "max")] for t in OUTCOME_TYPES
+        ], dtype=float)
 
-def _degree_classification(avg_mark: float) -> str:
-    """UK degree classification from weighted average mark."""
-    if avg_mark >= 70:
-        return "First"
-    if avg_mark >= 60:
-        return "2:1"
-    if avg_mark >= 50:
-        return "2:2"
-    return "Third"
+        self.faculty_base = config.get("faculty_professional_base", {})
+        self.faculty_sectors = config.get("faculty_sectors", {})
+        self.ses_professional = ses_modifier(config.get("ses_professional_modifiers", {}))
+        self.ses_salary = ses_modifier(config.get("ses_salary_modifiers", {}))
+        self.disability_professional = float(config.get("disability_professional_modifier", -0.40))
+        self.extraversion_weight = float(config.get("extraversion_professional_weight", 0.25))
+        self.conscientiousness_weight = float(config.get("conscientiousness_professional_weight", 0.35))
+        self.career_weight = float(config.get("career_focus_weight", 0.30))
+
+    def faculty_log_odds(self, faculty: str) -> float:
+        """Log-odds of the faculty's base professional employment rate."""
+        return _log_odds(self.faculty_base.get(faculty, 0.55))
+
+    def sectors(self, faculty: str) -> list:
+        return [str(sector) for sector in self.faculty_sectors.get(faculty, ["general_employment"])]
 
 
 class GraduateOutcomesSystem:
@@ -54,6 +156,7 @@ class GraduateOutcomesSystem:
         self.seed = seed
         self.rng = np.random.default_rng(seed)
         self.config = self._load_config(config_path)
+        self.tables = OutcomeTables(self.config)
 
     def _load_config(self, path: str) -> dict:
         p = Path(path)
@@ -71,158 +174,186 @@ class GraduateOutcomesSystem:
         student_ids: list,
         assessment_df: Optional[pd.DataFrame],
         fallback_avg_marks: dict,
+        marks_ledger: Optional[MarksLedger] = None,
     ) -> dict:
         """
         Compute degree classification for each student from Y2+Y3 FINAL marks.
         Weights: Y1=0, Y2=1/3, Y3=2/3 (UK standard).
         Falls back to overall avg_mark from progression if no assessment data.
         Returns {student_id -> (degree_classification, weighted_avg)}
+
+        With marks_ledger, per-year averages are read from it (all years the students
+        were marked, O(graduates)); otherwise FINAL marks in assessment_df are mapped to
+        graduate codes once and averaged per module_year with array reductions.
         """
         year_weights = self.config.get("degree_year_weights", {1: 0.0, 2: 0.333, 3: 0.667})
-        result = {}
-
-        if assessment_df is not None and not assessment_df.empty:
-            finals = assessment_df[assessment_df.get('component_code', pd.Series(['FINAL'] * len(assessment_df))) == 'FINAL'].copy() \
-                if 'component_code' in assessment_df.columns else assessment_df.copy()
-            finals['mark'] = finals['combined_mark'].fillna(finals['assessment_mark']) \
-                if 'combined_mark' in finals.columns else finals['assessment_mark']
-            finals['student_id'] = finals['student_id'].astype(str)
-
-            for sid in student_ids:
-                sid = str(sid)
-                rows = finals[finals['student_id'] == sid]
-                if rows.empty:
-                    avg = fallback_avg_marks.get(sid, 50.0)
-                    result[sid] = (_degree_classification(avg), avg)
-                    continue
-
-                weighted_sum = 0.0
-                weight_total = 0.0
+        sids = pd.unique(pd.Series([str(sid) for sid in student_ids], dtype=object))
+        avg = np.array([fallback_avg_marks.get(sid, 50.0) for sid in sids], dtype=float)
+
+        # Per-year means and presence {year -> (mean, present)}, overall mean, any marks
+        year_means = {}
+        if marks_ledger is not None:
+            sums, counts = marks_ledger.year_marks(sids)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = sums / counts
+                overall = sums.sum(axis=1) / counts.sum(axis=1)
+            for col in range(sums.shape[1]):
+                year_means[col + 1] = (means[:, col], counts[:, col] > 0)
+            has_marks = counts.sum(axis=1) > 0
+        elif assessment_df is not None and not assessment_df.empty:
+            finals = final_marks(assessment_df)
+            student = pd.Index(sids).get_indexer(finals['student_id'].astype(str))
+            in_grads = student >= 0
+            student = student[in_grads]
+            marks = finals['mark'].to_numpy(dtype=float)[in_grads]
+
+            has_marks = np.bincount(student, minlength=len(sids)) > 0
+            overall = _group_means(marks, student, len(sids))
+            if 'module_year' in finals.columns:
+                module_year = finals['module_year'].to_numpy()[in_grads]
                 for yr, w in year_weights.items():
                     if w == 0.0:
                         continue
-                    yr_rows = rows[rows.get('module_year', pd.Series(dtype=int)) == yr] \
-                        if 'module_year' in rows.columns else pd.DataFrame()
-                    if len(yr_rows) > 0:
-                        weighted_sum += yr_rows['mark'].mean() * w
-                        weight_total += w
-
-                if weight_total > 0:
-                    weighted_avg = weighted_sum / weight_total
-                else:
-                    # Only Y1 data available — fall back to overall mean
-                    weighted_avg = rows['mark'].mean()
-
-                result[sid] = (_degree_classification(weighted_avg), round(float(weighted_avg), 1))
+                    in_year = module_year == yr
+                    year_means[yr] = (
+                        _group_means(marks[in_year], student[in_year], len(sids)),
+                        np.bincount(student[in_year], minlength=len(sids)) > 0,
+                    )
         else:
-            for sid in student_ids:
-                sid = str(sid)
-                avg = fallback_avg_marks.get(sid, 50.0)
-                result[sid] = (_degree_classification(avg), avg)
-
-        return result
+            has_marks = np.zeros(len(sids), dtype=bool)
+
+        weighted_sum = np.zeros(len(sids))
+        weight_total = np.zeros(len(sids))
+        for yr, w in year_weights.items():
+            if w == 0.0 or yr not in year_means:
+                continue
+            mean, present = year_means[yr]
+            weighted_sum = np.where(present, weighted_sum + mean * w, weighted_sum)
+            weight_total = np.where(present, weight_total + w, weight_total)
+
+        if has_marks.any():
+            # Only Y1 data available — fall back to overall mean
+            with np.errstate(invalid='ignore', divide='ignore'):
+                weighted_avg = np.where(weight_total > 0, weighted_sum / weight_total, overall)
+            avg = np.where(has_marks, weighted_avg, avg)
+
+        classes = _degree_classification(avg)
+        return {
+            sid: (cls, round(float(a), 1) if marked else a)   # weighted from marks: 1 dp
+            for sid, cls, a, marked in zip(sids, classes, avg.tolist(), has_marks)
+        }
 
     # ------------------------------------------------------------------
-    # Outcome helpers
+    # Outcome draws
     # ------------------------------------------------------------------
 
-    def _get_outcome_type(self, student: pd.Series, degree_class: str) -> str:
-        """Draw outcome type: employed / further_study / unemployed / unknown."""
-        base = self.config.get("base_outcome_probabilities", {
-            "employed": 0.65, "further_study": 0.20,
-            "unemployed": 0.10, "unknown": 0.05,
-        })
+    def _ses_modifiers(self, features: StudentFeatures, rows: np.ndarray, key: str, fn: Callable) -> np.ndarray:
+        """fn(socio_economic_rank) per graduate row (rank 4 where the row is missing)."""
+        values = features.modifier(key, 'socio_economic_rank', fn)
+        out = np.full(len(rows), fn(4))
+        found = rows >= 0
+        out[found] = values[rows[found]]
+        return out
 
-        # Adjust employed probability via log-odds
-        emp_mod = self.config.get("degree_classification_modifiers", {}) \
-            .get("employment_log_odds", {}).get(degree_class, 0.0)
-        p_employed = float(np.clip(
-            _inv_log_odds(_log_odds(base["employed"]) + emp_mod), 0.05, 0.95
-        ))
-
-        # Adjust further_study probability
-        fs_mod = self.config.get("degree_classification_modifiers", {}) \
-            .get("further_study_log_odds", {}).get(degree_class, 0.0)
-        p_further = float(np.clip(
-            _inv_log_odds(_log_odds(base["further_study"]) + fs_mod), 0.02, 0.50
-        ))
-
-        # Renormalise
-        p_unemployed = base["unemployed"]
-        p_unknown = base["unknown"]
-        total = p_employed + p_further + p_unemployed + p_unknown
-        probs = [p / total for p in [p_employed, p_further, p_unemployed, p_unknown]]
-        choices = ["employed", "further_study", "unemployed", "unknown"]
-        return str(self.rng.choice(choices, p=probs))
-
-    def _get_professional_level(self, student: pd.Series, degree_class: str,
-                                faculty: str) -> str:
-        """Determine professional / non_professional employment."""
-        fac_base = self.config.get("faculty_professional_base", {}).get(faculty, 0.55)
-        log_odds = _log_odds(fac_base)
-
-        # Degree classification
-        dc_mod = self.config.get("degree_classification_modifiers", {}) \
-            .get("professional_log_odds", {}).get(degree_class, 0.0)
-        log_odds += dc_mod
-
-        # SES — social capital / network effect
-        ses = int(student.get("socio_economic_rank", 4))
-        ses_mods = self.config.get("ses_professional_modifiers", {})
-        log_odds += float(ses_mods.get(ses, ses_mods.get(str(ses), 0.0)))
-
-        # Disability
-        disabilities = str(student.get("disabilities", "")).lower()
-        if disabilities and "no_known_disabilities" not in disabilities:
-            log_odds += float(self.config.get("disability_professional_modifier", -0.40))
-
-        # Personality
-        extrav = float(student.get("refined_extraversion", 0.5))
-        consc = float(student.get("refined_conscientiousness", 0.5))
-        career = float(student.get("motivation_career_focus", 0.5))
-        log_odds += (extrav - 0.5) * float(self.config.get("extraversion_professional_weight", 0.25))
-        log_odds += (consc - 0.5) * float(self.config.get("conscientiousness_professional_weight", 0.35))
-        log_odds += (career - 0.5) * float(self.config.get("career_focus_weight", 0.30))
-
-        p_professional = float(np.clip(_inv_log_odds(log_odds), 0.05, 0.95))
-        return "professional" if self.rng.random() < p_professional else "non_professional"
-
-    def _get_employment_sector(self, faculty: str, outcome_type: str) -> Optional[str]:
-        """Pick an employment sector from the faculty's sector list."""
-        if outcome_type == "further_study":
-            return "further_study"
-        if outcome_type in ("unemployed", "unknown"):
-            return None
-        sectors = self.config.get("faculty_sectors", {}).get(faculty, ["general_employment"])
-        return str(self.rng.choice(sectors))
-
-    def _get_salary_band(self, student: pd.Series, degree_class: str,
-                         professional_level: str, outcome_type: str) -> Optional[int]:
-        """Salary band 1-5. Only for employed students."""
-        if outcome_type != "employed":
-            return None
-        base = float(self.config.get("salary_band_base", {}).get(degree_class, 2))
-
-        # SES effect on salary
-        ses = int(student.get("socio_economic_rank", 4))
-        ses_mods = self.config.get("ses_salary_modifiers", {})
-        base += float(ses_mods.get(ses, ses_mods.get(str(ses), 0.0)))
-
-        # Professional role boosts salary
-        if professional_level == "professional":
-            base += 0.75
-
-        # Small random noise
-        base += float(self.rng.normal(0, 0.4))
-        return int(np.clip(round(base), 1, 5))
-
-    def _get_time_to_outcome(self, outcome_type: str) -> int:
-        """Months from graduation to outcome, triangular distribution."""
-        params = self.config.get("time_to_outcome_months", {}).get(
-            outcome_type, {"min": 0, "mode": 6, "max": 18}
-        )
-        val = self.rng.triangular(params["min"], params["mode"], params["max"])
-        return int(round(float(np.clip(val, 0, 24))))
+    def _draw_outcomes(
+        self,
+        degree_class: np.ndarray,
+        faculty: np.ndarray,
+        features: StudentFeatures,
+        rows: np.ndarray,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Draw outcome type, professional level, sector, salary band and time to outcome
+        for all graduates at once. degree_class: codes into DEGREE_CLASSES; faculty:
+        faculty number strings; rows: graduates' rows in features (-1: not present).
+
+        Each draw has the distribution of the per-graduate model: outcome type is one
+        uniform against the class's CDF (as Generator.choice with p), professional
+        level a Bernoulli on clipped log-odds, sector uniform over the faculty's list,
+        salary band the rounded base + SES + professional + N(0, 0.4) clipped to 1-5,
+        and months a triangular draw by outcome type, rounded and clipped to 0-24.
+        """
+        t = self.tables
+        n = len(degree_class)
+
+        # Outcome type
+        outcome = (self.rng.random(n)[:, None] >= t.type_cdf[degree_class]).sum(axis=1)
+        employed = np.flatnonzero(outcome == _EMPLOYED)
+        emp_rows = rows[employed]
+        emp_class = degree_class[employed]
+        fac_levels, fac_codes = np.unique(faculty[employed].astype(str), return_inverse=True)
+        fac_codes = fac_codes.reshape(-1)
+
+        # Professional level: faculty base, degree class, SES, disability, personality
+        log_odds = np.array([t.faculty_log_odds(f) for f in fac_levels], dtype=float)[fac_codes]
+        log_odds = log_odds + t.professional_log_odds[emp_class]
+        log_odds += self._ses_modifiers(features, emp_rows, 'graduate_ses_professional', t.ses_professional)
+        has_disability = np.zeros(len(employed), dtype=bool)
+        found = emp_rows >= 0
+        has_disability[found] = features.has_disability[emp_rows[found]]
+        log_odds += np.where(has_disability, t.disability_professional, 0.0)
+        log_odds += (features.trait('refined_extraversion', emp_rows) - 0.5) * t.extraversion_weight
+        log_odds += (features.trait('refined_conscientiousness', emp_rows) - 0.5) * t.conscientiousness_weight
+        log_odds += (features.trait('motivation_career_focus', emp_rows) - 0.5) * t.career_weight
+        p_professional = np.clip(_inv_log_odds(log_odds), 0.05, 0.95)
+        is_professional = self.rng.random(len(employed)) < p_professional
+
+        # Sector: uniform over the faculty's sectors (flattened, offset per faculty)
+        fac_sectors = [t.sectors(f) for f in fac_levels]
+        n_sectors = np.array([len(x) for x in fac_sectors], dtype=np.int64)
+        sector_table = np.array([x for sectors in fac_sectors for x in sectors], dtype=object)
+        offsets = np.cumsum(n_sectors) - n_sectors
+        picks = self.rng.integers(0, n_sectors[fac_codes]) if len(employed) else np.zeros(0, dtype=np.int64)
+        sectors = sector_table[offsets[fac_codes] + picks] if len(employed) else np.zeros(0, dtype=object)
+
+        # Salary band
+        salary = t.salary_base[emp_class]
+        salary = salary + self._ses_modifiers(features, emp_rows, 'graduate_ses_salary', t.ses_salary)
+        salary = salary + np.where(is_professional, 0.75, 0.0)
+        salary = salary + self.rng.normal(0, 0.4, len(employed))
+        salary_band = np.clip(np.round(salary), 1, 5).astype(np.int64)
+
+        # Months to outcome
+        params = t.time_params[outcome]
+        months = self.rng.triangular(params[:, 0], params[:, 1], params[:, 2]) if n else np.zeros(0)
+        months = np.round(np.clip(months, 0, 24)).astype(np.int64)
+
+        professional_level = np.full(n, None, dtype=object)
+        professional_level[employed] = np.where(is_professional, "professional", "non_professional")
+        employment_sector = np.full(n, None, dtype=object)
+        employment_sector[outcome == _FURTHER_STUDY] = "further_study"
+        employment_sector[employed] = sectors
+        salary_col = np.full(n, None, dtype=object)
+        salary_col[employed] = salary_band.tolist()
+        return {
+            "outcome_type": np.asarray(OUTCOME_TYPES, dtype=object)[outcome],
+            "professional_level": professional_level,
+            "employment_sector": employment_sector,
+            "salary_band": salary_col,
+            "time_to_outcome_months": months,
+        }
+
+    @staticmethod
+    def _cube_measures(degree_class_codes: np.ndarray, degree_avg, drawn: Dict[str, np.ndarray]) -> dict:
+        """
+        Aggregation cube measures: degree average, good degree (First or 2:1) and class
+        shares, outcome type shares, months to outcome, and, over employed graduates
+        only, professional level and salary band.
+        """
+        outcome = drawn["outcome_type"]
+        employed = outcome == "employed"
+        measures = {
+            "degree_weighted_avg": np.asarray(degree_avg, dtype=float),
+            "good_degree": degree_class_codes <= DEGREE_CLASSES.index("2:1"),
+        }
+        for k, degree_class in enumerate(DEGREE_CLASSES):
+            measures[f"degree_classification={degree_class}"] = degree_class_codes == k
+        for outcome_type in OUTCOME_TYPES:
+            measures[f"outcome_type={outcome_type}"] = outcome == outcome_type
+        measures["professional"] = np.where(employed, drawn["professional_level"] == "professional", np.nan)
+        measures["salary_band"] = pd.to_numeric(pd.Series(drawn["salary_band"], dtype=object)).to_numpy(dtype=float)
+        measures["time_to_outcome_months"] = drawn["time_to_outcome_months"]
+        return measures
 
     def _outcome_recorded_at(self, academic_year: str) -> str:
         """ISO date ~15 months after end of graduation year."""
@@ -247,6 +378,9 @@ class GraduateOutcomesSystem:
         graduates_enrolled_df: pd.DataFrame,
         academic_year: str,
         all_assessment_df: Optional[pd.DataFrame] = None,
+        features: Optional[StudentFeatures] = None,
+        marks_ledger: Optional[MarksLedger] = None,
+        cube: Optional[AggregationCube] = None,
     ) -> pd.DataFrame:
         """
         Generate graduate outcomes for all students who graduated in academic_year.
@@ -258,6 +392,13 @@ class GraduateOutcomesSystem:
             all_assessment_df: full assessment history (all years) for degree classification.
                 Uses Y2+Y3 FINAL combined_mark weighted 1/3 : 2/3. If None, falls back
                 to avg_mark from enrolled_df.
+            features: StudentFeatures containing the graduates (e.g. built for the whole
+                year's enrolment); built from graduates_enrolled_df if None.
+            marks_ledger: running FINAL marks per student and programme year
+                (core_systems/marks_ledger.py). When given, degree classification reads
+                Y2 and Y3 averages from it and all_assessment_df is not needed.
+            cube: aggregation cube (core_systems/aggregation_cube.py); the graduates'
+                degree and outcome measures are added to it by faculty, programme and subgroup
 
         Returns:
             DataFrame with one row per graduate.
@@ -276,47 +417,44 @@ class GraduateOutcomesSystem:
         # Compute degree classifications
         student_ids = grads['student_id'].tolist()
         classifications = self._compute_degree_classifications(
-            student_ids, all_assessment_df, fallback_marks
+            student_ids, all_assessment_df, fallback_marks, marks_ledger=marks_ledger,
         )
 
         recorded_at = self._outcome_recorded_at(academic_year)
-
-        records = []
-        for _, student in grads.iterrows():
-            sid = str(student['student_id'])
-            degree_class, weighted_avg = classifications.get(sid, ("2:2", 50.0))
-            faculty = str(student.get('program_code', student.get('programme_code', '1.1.1'))).split('.')[0]
-
-            outcome_type = self._get_outcome_type(student, degree_class)
-
-            if outcome_type == "employed":
-                professional_level = self._get_professional_level(student, degree_class, faculty)
-                employment_sector = self._get_employment_sector(faculty, outcome_type)
-                salary_band = self._get_salary_band(student, degree_class, professional_level, outcome_type)
-            elif outcome_type == "further_study":
-                professional_level = None
-                employment_sector = "further_study"
-                salary_band = None
-            else:
-                professional_level = None
-                employment_sector = None
-                salary_band = None
-
-            time_to_outcome = self._get_time_to_outcome(outcome_type)
-
-            records.append({
-                "student_id": sid,
-                "academic_year_graduated": academic_year,
-                "programme_code": student.get('program_code', student.get('programme_code')),
-                "faculty": faculty,
-                "degree_classification": degree_class,
-                "degree_weighted_avg": weighted_avg,
-                "outcome_type": outcome_type,
-                "professional_level": professional_level,
-                "employment_sector": employment_sector,
-                "salary_band": salary_band,
-                "time_to_outcome_months": time_to_outcome,
-                "outcome_recorded_at": recorded_at,
-            })
-
-        return pd.DataFrame(records)
+        if features is None:
+            features = StudentFeatures(grads)
+        rows = features.rows(student_ids)
+        found = rows >= 0
+
+        degree = [classifications.get(sid, ("2:2", 50.0)) for sid in student_ids]
+        degree_class = np.array([c for c, _ in degree], dtype=object)
+        class_codes = pd.Index(DEGREE_CLASSES).get_indexer(degree_class)
+
+        # Programme code, and faculty = its first digit ("1" where unknown)
+        codes = features.columns.get('program_code', features.columns.get('programme_code'))
+        programme_code = np.full(len(rows), None, dtype=object)
+        if codes is not None:
+            programme_code[found] = codes[rows[found]]
+        faculty_source = np.where(found & (codes is not None), programme_code, '1.1.1')
+        faculty = np.array([str(code).split('.')[0] for code in faculty_source], dtype=object)
+
+        drawn = self._draw_outcomes(class_codes, faculty, features, rows)
+        degree_avg = [avg for _, avg in degree]
+        if cube is not None:
+            cube.add("graduate_outcomes", academic_year, programme_code, faculties(features, rows),
+                     subgroups(features, rows), self._cube_measures(class_codes, degree_avg, drawn))
+
+        return pd.DataFrame({
+            "student_id": student_ids,
+            "academic_year_graduated": [academic_year] * len(student_ids),
+            "programme_code": programme_code.tolist(),
+            "faculty": faculty.tolist(),
+            "degree_classification": degree_class.tolist(),
+            "degree_weighted_avg": degree_avg,
+            "outcome_type": drawn["outcome_type"].tolist(),
+            "professional_level": drawn["professional_level"].tolist(),
+            "employment_sector": drawn["employment_sector"].tolist(),
+            "salary_band": drawn["salary_band"].tolist(),
+            "time_to_outcome_months": drawn["time_to_outcome_months"].tolist(),
+            "outcome_recorded_at": [recorded_at] * len(student_ids),
+        })
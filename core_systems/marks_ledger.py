@@ -0,0 +1,110 @@
+"""
+Stonegrove University Marks Ledger
+
+Running per-student ledger of FINAL module marks by programme year, updated by the
+assessment stage as each year is marked (AssessmentSystem.generate_assessment_data)
+and read by degree classification (GraduateOutcomesSystem). Graduates' Y2 and Y3
+averages come from the ledger, so no prior year's assessment frame has to be kept
+or rescanned.
+
+For each student and programme year 1..N_YEARS the ledger holds the sum and count
+of FINAL marks (combined_mark, else the FINAL component mark; NaN marks skipped).
+A year's cells are replaced, not added to, each time the student is marked in that
+programme year, so a repeated year counts its latest attempt.
+
+Rows are found through a StudentIndex and added as new IDs appear; keep() drops
+every student not listed, as ProgressionHistory does.
+"""
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from core_systems.assessment_storage import final_marks
+from core_systems.progression_history import StudentIndex, _student_ids, moved
+
+N_YEARS = 3
+
+
+class MarksLedger:
+    """FINAL mark sums and counts per (student, programme year), indexed by student ID."""
+
+    __slots__ = ('index', 'sums', 'counts')
+
+    def __init__(self):
+        self.index = StudentIndex()
+        self.sums = np.zeros((0, N_YEARS), dtype=np.float64)
+        self.counts = np.zeros((0, N_YEARS), dtype=np.int16)
+
+    def __len__(self) -> int:
+        """Number of students held with at least one mark."""
+        return int((self.counts.sum(axis=1) > 0).sum())
+
+    def keep(self, student_ids) -> None:
+        """Hold only these students (the others get no further updates or lookups)."""
+        rows = self.index.keep(student_ids)
+        self.sums = self.sums[rows]
+        self.counts = self.counts[rows]
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def record(self, student_ids, programme_years, marks) -> None:
+        """
+        Record one academic year's FINAL marks: one entry per (student, module).
+        Each (student, programme year) present replaces that cell; programme years
+        outside 1..N_YEARS are ignored.
+        """
+        ids = _student_ids(student_ids)
+        years = np.asarray(programme_years, dtype=np.int64)
+        marks = np.asarray(marks, dtype=float)
+        keep = (years >= 1) & (years <= N_YEARS)
+        ids, years, marks = ids[keep], years[keep], marks[keep]
+        if ids.size == 0:
+            return
+        added = self.index.add(ids)
+        if added is not None:
+            n = len(self.index)
+            self.sums = moved(self.sums, added, n, 0.0)
+            self.counts = moved(self.counts, added, n, 0)
+        rows = self.index.find(ids)
+
+        cells, cell_index = np.unique(rows * N_YEARS + (years - 1), return_inverse=True)
+        valid = ~np.isnan(marks)
+        sums = np.bincount(cell_index, weights=np.where(valid, marks, 0.0), minlength=len(cells))
+        counts = np.bincount(cell_index, weights=valid, minlength=len(cells))
+        self.sums.ravel()[cells] = sums
+        self.counts.ravel()[cells] = counts
+
+    def record_frame(self, assessment_df: pd.DataFrame) -> None:
+        """record() from one academic year's assessment events (either layout)."""
+        if assessment_df is None or assessment_df.empty or 'module_year' not in assessment_df.columns:
+            return
+        finals = final_marks(assessment_df)
+        self.record(finals['student_id'], finals['module_year'], finals['mark'])
+
+    @classmethod
+    def from_frame(cls, assessment_df: pd.DataFrame) -> "MarksLedger":
+        """Ledger from assessment events of any number of academic years, year by year."""
+        ledger = cls()
+        if assessment_df is None or assessment_df.empty:
+            return ledger
+        for _, rows in assessment_df.groupby('academic_year', sort=True, observed=True):
+            ledger.record_frame(rows)
+        return ledger
+
+    # ------------------------------------------------------------------
+    # Lookups (IDs not held: no marks)
+    # ------------------------------------------------------------------
+
+    def year_marks(self, student_ids) -> Tuple[np.ndarray, np.ndarray]:
+        """(sums, counts), each (students, N_YEARS): column y is programme year y + 1."""
+        rows = self.index.find(student_ids)
+        known = rows >= 0
+        sums = np.zeros((len(rows), N_YEARS))
+        counts = np.zeros((len(rows), N_YEARS), dtype=np.int16)
+        sums[known] = self.sums[rows[known]]
+        counts[known] = self.counts[rows[known]]
+        return sums, counts
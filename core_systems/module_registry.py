@@ -0,0 +1,252 @@
+"""
+Stonegrove University Module Registry
+
+One load of module characteristics (config/module_characteristics.csv, or the YAML
+fallback) shared by the engagement and assessment systems and the relational builder.
+
+Characteristics are held as struct-of-arrays columns indexed by module ID (position in
+`titles`). Titles not in config are registered on first lookup: their keyword-based
+fallbacks (difficulty/social/creativity estimate, assessment type, mark modifier) are
+resolved once and appended, so repeat lookups are an index read.
+
+Use load_module_registry() to get the process-wide instance for a config path.
+"""
+
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping
+
+import numpy as np
+import pandas as pd
+import yaml
+
+
+# ---------------------------------------------------------------------------
+# Fallbacks for modules not in config (keyword scans of the title)
+# ---------------------------------------------------------------------------
+
+def _estimate_module_characteristics(module_title: str) -> Dict[str, float]:
+    """
+    Estimate module characteristics based on title keywords.
+    Feminist-aware: domestic, applied, craft, and care work are NOT treated as easy.
+    """
+    title_lower = module_title.lower()
+    difficulty = 0.5
+    social_requirements = 0.5
+    creativity_requirements = 0.5
+
+    if any(word in title_lower for word in ['advanced', 'capstone', 'research']):
+        difficulty += 0.2
+    elif any(word in title_lower for word in ['epistemolog', 'theoretical', 'complex']):
+        difficulty += 0.15
+    elif any(word in title_lower for word in [
+        'embodied', 'somatic', 'fermentation', 'cultivation', 'harvest',
+        'care', 'healing', 'hospitality', 'ritual', 'ethics', 'indigenous'
+    ]):
+        difficulty += 0.05
+
+    if any(word in title_lower for word in ['group', 'team', 'collaboration', 'discussion', 'circle', 'listening']):
+        social_requirements += 0.25
+    elif any(word in title_lower for word in ['individual', 'independent', 'research']):
+        social_requirements -= 0.15
+
+    if any(word in title_lower for word in ['design', 'creative', 'innovation', 'art', 'craft', 'weaving']):
+        creativity_requirements += 0.25
+    elif any(word in title_lower for word in ['analysis', 'method', 'systematic', 'logic']):
+        creativity_requirements -= 0.1
+
+    return {
+        'difficulty': float(np.clip(difficulty, 0.25, 0.9)),
+        'social_requirements': float(np.clip(social_requirements, 0.2, 0.9)),
+        'creativity_requirements': float(np.clip(creativity_requirements, 0.2, 0.9)),
+    }
+
+
+def _difficulty_to_mark_modifier(difficulty: float) -> float:
+    """Convert difficulty (0.25-0.9) to mark modifier. Higher difficulty = lower marks.
+    Slope tuned to create a clear negative difficulty–mark correlation (~-0.10 to -0.20).
+    Range: ~1.03 (diff=0.29) down to ~0.86 (diff=0.88)."""
+    if difficulty <= 0.5:
+        return 1.0 + (0.5 - difficulty) * 0.15  # 0.5->1.0, 0.3->1.03
+    return 1.0 - (difficulty - 0.5) * 0.37       # 0.7->0.926, 0.9->0.852
+
+
+def _get_module_difficulty_modifier_fallback(module_title: str) -> float:
+    """Fallback: infer from module title when not in config. Feminist-aware."""
+    title_lower = module_title.lower()
+    if any(w in title_lower for w in ['advanced', 'capstone', 'research']):
+        return 0.9
+    if any(w in title_lower for w in ['epistemolog', 'theoretical', 'complex']):
+        return 0.95
+    return 1.0
+
+
+def _get_assessment_type_fallback(module_title: str) -> str:
+    """Fallback: infer assessment type from module title when not in config."""
+    title_lower = module_title.lower()
+    if any(w in title_lower for w in ['practical', 'hands', 'craft', 'practice']):
+        return 'practical'
+    if any(w in title_lower for w in ['project', 'design', 'praxis']):
+        return 'project'
+    if any(w in title_lower for w in ['essay', 'theory', 'critical']):
+        return 'essay'
+    return 'mixed'
+
+
+# ---------------------------------------------------------------------------
+# Registry
+# ---------------------------------------------------------------------------
+
+class ModuleRegistry:
+    """
+    Module characteristics as arrays indexed by module ID.
+
+    Columns (one entry per module ID):
+      difficulty, social_requirements, creativity_requirements  float64 (engagement)
+      semester         int64, teaching semester (1 if unknown)
+      assessment_type  object (assessment)
+      mark_modifier    float64, config mark_modifier, else from difficulty_level,
+                       else the title fallback (assessment)
+      in_config        bool, False for titles registered with fallbacks
+    """
+
+    _COLUMNS = {
+        'difficulty': np.float64,
+        'social_requirements': np.float64,
+        'creativity_requirements': np.float64,
+        'semester': np.int64,
+        'assessment_type': object,
+        'mark_modifier': np.float64,
+        'in_config': bool,
+    }
+
+    def __init__(self, csv_path='config/module_characteristics.csv',
+                 yaml_path='config/module_characteristics.yaml'):
+        self.frame = pd.DataFrame()   # raw CSV rows (all columns), for dim_modules
+        self.titles: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._records: List[Mapping] = []
+
+        csv_path, yaml_path = Path(csv_path), Path(yaml_path)
+        if csv_path.exists():
+            self.frame = pd.read_csv(csv_path)
+            columns = self._columns_from_frame(self.frame)
+        elif yaml_path.exists():
+            columns = self._columns_from_yaml(yaml_path)
+        else:
+            print("Warning: module_characteristics not found. Using estimation.")
+            columns = {name: [] for name in self._COLUMNS}
+            columns['title'] = []
+
+        for title in columns.pop('title'):
+            self._ids[title] = len(self.titles)
+            self.titles.append(title)
+        for name, dtype in self._COLUMNS.items():
+            setattr(self, name, np.asarray(columns[name], dtype=dtype))
+        self._records = [self._make_record(i) for i in range(len(self.titles))]
+
+    @staticmethod
+    def _columns_from_frame(df: pd.DataFrame) -> Dict[str, list]:
+        df = df.assign(module_title=df['module_title'].astype(str).str.strip())
+        df = df[df['module_title'] != ''].drop_duplicates('module_title', keep='last')
+
+        def col(name, default):
+            return df[name] if name in df.columns else pd.Series(default, index=df.index)
+
+        difficulty = col('difficulty_level', 0.5).astype(float)
+        raw_mod = col('mark_modifier', np.nan).astype(float)
+        mark_modifier = [m if pd.notna(m) else _difficulty_to_mark_modifier(d)
+                         for m, d in zip(raw_mod, difficulty)]
+        assessment_type = [str(a).strip() or 'mixed' for a in col('assessment_type', 'mixed')]
+        return {
+            'title': df['module_title'].tolist(),
+            'difficulty': difficulty.tolist(),
+            'social_requirements': col('social_requirements', 0.5).astype(float).tolist(),
+            'creativity_requirements': col('creativity_requirements', 0.5).astype(float).tolist(),
+            'semester': col('semester', 1).astype(int).tolist(),
+            'assessment_type': assessment_type,
+            'mark_modifier': mark_modifier,
+            'in_config': [True] * len(df),
+        }
+
+    @staticmethod
+    def _columns_from_yaml(path: Path) -> Dict[str, list]:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+        rows = {str(t).strip(): info for t, info in (data.get('modules') or {}).items() if isinstance(info, dict)}
+        difficulty = [float(info.get('difficulty_level', 0.5)) for info in rows.values()]
+        return {
+            'title': list(rows),
+            'difficulty': difficulty,
+            'social_requirements': [float(info.get('social_requirements', 0.5)) for info in rows.values()],
+            'creativity_requirements': [float(info.get('creativity_requirements', 0.5)) for info in rows.values()],
+            'semester': [1] * len(rows),
+            'assessment_type': [str(info.get('assessment_type', 'mixed')).strip() or 'mixed' for info in rows.values()],
+            'mark_modifier': [_difficulty_to_mark_modifier(d) for d in difficulty],
+            'in_config': [True] * len(rows),
+        }
+
+    def _make_record(self, module_id: int) -> Mapping:
+        return MappingProxyType({
+            'difficulty': float(self.difficulty[module_id]),
+            'social_requirements': float(self.social_requirements[module_id]),
+            'creativity_requirements': float(self.creativity_requirements[module_id]),
+            'semester': int(self.semester[module_id]),
+        })
+
+    def _register(self, module_title: str) -> int:
+        """Add a title not in config, resolving its fallbacks once."""
+        title = str(module_title).strip()
+        est = _estimate_module_characteristics(title)
+        values = {
+            'difficulty': est['difficulty'],
+            'social_requirements': est['social_requirements'],
+            'creativity_requirements': est['creativity_requirements'],
+            'semester': 1,
+            'assessment_type': _get_assessment_type_fallback(title),
+            'mark_modifier': _get_module_difficulty_modifier_fallback(title),
+            'in_config': False,
+        }
+        for name, dtype in self._COLUMNS.items():
+            setattr(self, name, np.append(getattr(self, name), np.asarray([values[name]], dtype=dtype)))
+        module_id = len(self.titles)
+        self._ids[title] = module_id
+        self.titles.append(title)
+        self._records.append(self._make_record(module_id))
+        return module_id
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def module_id(self, module_title: str) -> int:
+        """Module ID for a title (registered with fallbacks if not in config)."""
+        module_id = self._ids.get(module_title)
+        if module_id is None:
+            module_id = self._ids.get(str(module_title).strip())
+            if module_id is None:
+                module_id = self._register(module_title)
+        return module_id
+
+    def module_ids(self, module_titles: Iterable[str]) -> np.ndarray:
+        """Module IDs for a sequence of titles, as an int array for column indexing."""
+        return np.fromiter((self.module_id(t) for t in module_titles), dtype=np.int64)
+
+    def characteristics(self, module_title: str) -> Mapping:
+        """Read-only {difficulty, social_requirements, creativity_requirements, semester} for a title."""
+        return self._records[self.module_id(module_title)]
+
+
+@lru_cache(maxsize=None)
+def _load_registry(csv_path: Path, yaml_path: Path) -> ModuleRegistry:
+    return ModuleRegistry(csv_path, yaml_path)
+
+
+def load_module_registry(csv_path='config/module_characteristics.csv',
+                         yaml_path='config/module_characteristics.yaml') -> ModuleRegistry:
+    """Process-wide registry for the given config files (loaded on first call)."""
+    return _load_registry(Path(csv_path).resolve(), Path(yaml_path).resolve())
@@ -11,11 +11,17 @@ species/clan modifier.
 Output: stonegrove_nss_responses.csv
 """
 
+import sys
 import numpy as np
 import pandas as pd
 import yaml
 from pathlib import Path
-from typing import Optional
+from typing import Mapping, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core_systems.aggregation_cube import AggregationCube, faculties, subgroups
+from core_systems.assessment_storage import final_marks
+from core_systems.student_features import StudentFeatures, ses_modifier
 
 
 THEMES = [
@@ -28,6 +34,74 @@ THEMES = [
     'student_voice',
 ]
 
+# Columns of the adjustment matrices: the themes, then overall satisfaction
+SCORED = THEMES + ['overall_satisfaction']
+
+# Personality traits applied to every scored column
+_ALL_THEME_TRAITS = {
+    'refined_agreeableness': ('agreeableness_all_themes', 0.30),
+    'refined_neuroticism': ('neuroticism_all_themes', -0.35),
+}
+
+
+class NSSWeights:
+    """
+    nss_modifiers.yaml compiled into arrays over THEMES (base scores, engagement
+    drivers, mark sensitivity) and SCORED (SES-free adjustments shared with overall
+    satisfaction: disability, significant-disability extra, personality, repeat year):
+
+    - engagement: (metric x theme), applied to (engagement - 0.5)
+    - personality: (trait x scored column), applied to (trait - 0.5); the all-theme
+      agreeableness and neuroticism weights are folded in with theme drivers
+    - overall: theme weights of the overall-satisfaction blend, divided by their total
+    """
+
+    __slots__ = ('base', 'base_overall', 'engagement_metrics', 'engagement', 'mark',
+                 'ses', 'disability', 'significant_extra', 'traits', 'personality', 'repeat',
+                 'overall', 'overall_constant', 'student_bias_std', 'theme_noise_std')
+
+    def __init__(self, config: Mapping):
+        bases = config.get('base_scores', {})
+        self.base = np.array([float(bases.get(t, 3.5)) for t in THEMES])
+        self.base_overall = float(bases.get('overall_satisfaction', 3.6))
+
+        # Engagement and marks move the themes only (not the overall blend's own terms)
+        drivers = config.get('engagement_drivers', {})
+        self.engagement_metrics = list(dict.fromkeys(m for t in THEMES for m in drivers.get(t, {})))
+        self.engagement = np.zeros((len(self.engagement_metrics), len(THEMES)))
+        for j, theme in enumerate(THEMES):
+            for metric, weight in drivers.get(theme, {}).items():
+                self.engagement[self.engagement_metrics.index(metric), j] = float(weight)
+        mark_mods = config.get('mark_modifier_per_10pp', {})
+        self.mark = np.array([float(mark_mods.get(t, 0.0)) for t in THEMES])
+
+        self.ses = ses_modifier(config.get('ses_modifiers', {}).get('all_themes', {}))
+        self.disability = np.array([float(config.get('disability_modifiers', {}).get(t, 0.0)) for t in SCORED])
+        self.significant_extra = np.array(
+            [float(config.get('significant_disability_extra', {}).get(t, 0.0)) for t in SCORED]
+        )
+        self.repeat = np.array([float(config.get('repeat_year_modifier', {}).get(t, 0.0)) for t in SCORED])
+
+        theme_drivers = config.get('personality_theme_drivers', {})
+        self.traits = list(dict.fromkeys(
+            [*_ALL_THEME_TRAITS, *(trait for t in SCORED for trait in theme_drivers.get(t, {}))]
+        ))
+        self.personality = np.zeros((len(self.traits), len(SCORED)))
+        for trait, (key, default) in _ALL_THEME_TRAITS.items():
+            self.personality[self.traits.index(trait)] += float(config.get(key, default))
+        for j, theme in enumerate(SCORED):
+            for trait, weight in theme_drivers.get(theme, {}).items():
+                self.personality[self.traits.index(trait), j] += float(weight)
+
+        # Overall blend: weights on theme raws; weights on anything else count a raw of 3.5
+        weights = config.get('overall_weights', {})
+        total_w = sum(weights.values()) or 1.0
+        self.overall = np.array([float(weights.get(t, 0.0)) for t in THEMES]) / total_w
+        self.overall_constant = sum(3.5 * w for t, w in weights.items() if t not in THEMES) / total_w
+
+        self.student_bias_std = float(config.get('student_bias_std', 0.28))
+        self.theme_noise_std = float(config.get('theme_noise_std', 0.38))
+
 
 class NSSSystem:
     """
@@ -51,6 +125,11 @@ class NSSSystem:
 
     Overall satisfaction is a weighted blend of theme raw scores plus independent noise,
     not a simple average (mirrors real NSS behaviour).
+
+    All respondents are scored together: the config is compiled once into NSSWeights,
+    the adjustments are matrix products over (student x driver) arrays, and the noise
+    is one (student x 9) standard-normal draw in the per-student order bias, seven
+    themes, overall.
     """
 
     def __init__(self, seed: int = 42,
@@ -58,6 +137,7 @@ class NSSSystem:
         self.seed = seed
         self.rng = np.random.default_rng(seed)
         self.config = self._load_config(config_path)
+        self.weights = NSSWeights(self.config)
 
     def _load_config(self, path: str) -> dict:
         p = Path(path)
@@ -70,7 +150,7 @@ class NSSSystem:
     # Engagement aggregation
     # ------------------------------------------------------------------
 
-    def _aggregate_engagement(self, weekly_df: pd.DataFrame,
+    def aggregate_engagement(self, weekly_df: pd.DataFrame,
                                academic_year: str) -> pd.DataFrame:
         """
         Return per-student mean engagement metrics for the given academic year.
@@ -107,129 +187,79 @@ class NSSSystem:
         df['student_id'] = df['student_id'].astype(str)
         if 'academic_year' in df.columns:
             df = df[df['academic_year'] == academic_year]
-        if 'component_code' in df.columns:
-            df = df[df['component_code'] == 'FINAL']
-        df['mark'] = df['combined_mark'].fillna(df['assessment_mark']) \
-            if 'combined_mark' in df.columns else df['assessment_mark']
+        df = final_marks(df)
 
         agg = df.groupby('student_id')['mark'].mean().reset_index()
         agg.columns = ['student_id', 'avg_mark']
         return agg
 
-    # ------------------------------------------------------------------
-    # Modifier helpers
-    # ------------------------------------------------------------------
-
-    def _has_significant_disability(self, disabilities: str) -> bool:
-        raw = str(disabilities).lower()
-        if not raw or 'no_known_disabilities' in raw:
-            return False
-        significant = ['requires_personal_care', 'wheelchair_user',
-                       'blind_or_visually_impaired', 'communication_difficulties']
-        if any(d in raw for d in significant):
-            return True
-        parts = [p.strip() for p in raw.split(',') if p.strip() and 'no_known' not in p]
-        return len(parts) >= 2
-
-    def _ses_adjustment(self, ses_rank: int) -> float:
-        mods = self.config.get('ses_modifiers', {}).get('all_themes', {})
-        return float(mods.get(int(ses_rank), mods.get(str(ses_rank), 0.0)))
-
-    def _disability_adjustment(self, theme: str, disabilities: str,
-                               sig_disability: bool) -> float:
-        if not disabilities or 'no_known_disabilities' in str(disabilities).lower():
-            return 0.0
-        adj = float(self.config.get('disability_modifiers', {}).get(theme, 0.0))
-        if sig_disability:
-            adj += float(self.config.get('significant_disability_extra', {}).get(theme, 0.0))
-        return adj
-
-    def _personality_adjustment(self, theme: str, student: pd.Series) -> float:
-        adj = 0.0
-        agr = float(student.get('refined_agreeableness', 0.5))
-        neur = float(student.get('refined_neuroticism', 0.5))
-        adj += (agr - 0.5) * float(self.config.get('agreeableness_all_themes', 0.30))
-        adj += (neur - 0.5) * float(self.config.get('neuroticism_all_themes', -0.35))
-        # Theme-specific
-        theme_drivers = self.config.get('personality_theme_drivers', {}).get(theme, {})
-        for trait, weight in theme_drivers.items():
-            adj += (float(student.get(trait, 0.5)) - 0.5) * float(weight)
-        return adj
-
-    def _engagement_adjustment(self, theme: str,
-                                eng_row: Optional[pd.Series]) -> float:
-        if eng_row is None:
-            return 0.0
-        drivers = self.config.get('engagement_drivers', {}).get(theme, {})
-        adj = 0.0
-        for metric, weight in drivers.items():
-            val = float(eng_row.get(metric, 0.5))
-            adj += (val - 0.5) * float(weight)
-        return adj
-
-    def _mark_adjustment(self, theme: str, avg_mark: float) -> float:
-        mod = float(self.config.get('mark_modifier_per_10pp', {}).get(theme, 0.0))
-        return mod * (avg_mark - 60.0) / 10.0
-
-    def _repeat_adjustment(self, theme: str, is_repeat: bool) -> float:
-        if not is_repeat:
-            return 0.0
-        return float(self.config.get('repeat_year_modifier', {}).get(theme, 0.0))
-
     # ------------------------------------------------------------------
     # Score generation
     # ------------------------------------------------------------------
 
-    def _generate_theme_scores(self, student: pd.Series,
-                                eng_row: Optional[pd.Series],
-                                avg_mark: float,
-                                is_repeat: bool,
-                                student_bias: float) -> dict:
-        """Generate raw float scores for all 7 themes."""
-        bases = self.config.get('base_scores', {})
-        theme_noise_std = float(self.config.get('theme_noise_std', 0.38))
-
-        ses = int(student.get('socio_economic_rank', 4))
-        disabilities = str(student.get('disabilities', 'no_known_disabilities'))
-        sig_dis = self._has_significant_disability(disabilities)
-        ses_adj = self._ses_adjustment(ses)
-
-        scores = {}
-        for theme in THEMES:
-            raw = float(bases.get(theme, 3.5))
-            raw += self._engagement_adjustment(theme, eng_row)
-            raw += self._mark_adjustment(theme, avg_mark)
-            raw += ses_adj
-            raw += self._disability_adjustment(theme, disabilities, sig_dis)
-            raw += self._personality_adjustment(theme, student)
-            raw += self._repeat_adjustment(theme, is_repeat)
-            raw += student_bias                                    # correlated noise
-            raw += float(self.rng.normal(0, theme_noise_std))     # independent noise
-            scores[theme] = raw
-        return scores
-
-    def _generate_overall(self, theme_raw_scores: dict,
-                           student: pd.Series, is_repeat: bool,
-                           student_bias: float) -> float:
-        """Overall satisfaction: weighted blend of theme raws + own noise."""
-        weights = self.config.get('overall_weights', {})
-        total_w = sum(weights.values()) or 1.0
-        weighted = sum(theme_raw_scores.get(t, 3.5) * w for t, w in weights.items()) / total_w
-
-        # Own base, SES, disability, personality
-        base_overall = float(self.config.get('base_scores', {}).get('overall_satisfaction', 3.6))
-        ses = int(student.get('socio_economic_rank', 4))
-        disabilities = str(student.get('disabilities', 'no_known_disabilities'))
-        sig_dis = self._has_significant_disability(disabilities)
-
-        overall = base_overall + 0.5 * (weighted - base_overall)   # blend base with theme signal
-        overall += self._ses_adjustment(ses)
-        overall += self._disability_adjustment('overall_satisfaction', disabilities, sig_dis)
-        overall += self._personality_adjustment('overall_satisfaction', student)
-        overall += self._repeat_adjustment('overall_satisfaction', is_repeat)
+    def _score(
+        self,
+        features: StudentFeatures,
+        rows: np.ndarray,
+        engagement: np.ndarray,
+        avg_mark: np.ndarray,
+        is_repeat: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Raw theme scores (students x THEMES) and raw overall satisfaction (students,)
+        for the given feature rows. engagement: (students x NSSWeights.engagement_metrics),
+        already centred at 0.5 (0 where a student has no engagement).
+        """
+        w = self.weights
+        n = len(rows)
+
+        # Adjustments shared by the themes and overall satisfaction (students x SCORED)
+        ses = features.modifier('nss_ses', 'socio_economic_rank', w.ses)[rows]
+        significant = features.significant_disability[rows][:, None]
+        disability = np.where(
+            features.has_disability[rows][:, None],
+            w.disability + np.where(significant, w.significant_extra, 0.0),
+            0.0,
+        )
+        traits = np.column_stack([features.trait(t, rows) for t in w.traits]) - 0.5
+        personality = traits @ w.personality
+        repeat = np.where(is_repeat[:, None], w.repeat, 0.0)
+
+        # One draw per student: bias (correlated), seven theme noises, overall noise
+        noise = self.rng.standard_normal((n, len(THEMES) + 2))
+        student_bias = noise[:, 0] * w.student_bias_std
+        theme_noise = noise[:, 1:len(THEMES) + 1] * w.theme_noise_std
+        overall_noise = noise[:, -1] * w.theme_noise_std
+
+        k = len(THEMES)
+        raw = w.base + engagement @ w.engagement
+        raw = raw + w.mark * (avg_mark - 60.0)[:, None] / 10.0
+        raw += ses[:, None]
+        raw += disability[:, :k]
+        raw += personality[:, :k]
+        raw += repeat[:, :k]
+        raw += student_bias[:, None]                               # correlated noise
+        raw += theme_noise                                         # independent noise
+
+        # Overall: blend base with the weighted theme signal, then its own adjustments
+        weighted = raw @ w.overall + w.overall_constant
+        overall = w.base_overall + 0.5 * (weighted - w.base_overall)
+        overall += ses
+        overall += disability[:, k]
+        overall += personality[:, k]
+        overall += repeat[:, k]
         overall += student_bias
-        overall += float(self.rng.normal(0, float(self.config.get('theme_noise_std', 0.38))))
-        return overall
+        overall += overall_noise
+        return raw, overall
+
+    @staticmethod
+    def _cube_measures(scores: np.ndarray) -> dict:
+        """Aggregation cube measures per scored column: the score and % positive (4 or 5)."""
+        measures = {}
+        for j, name in enumerate(SCORED):
+            measures[name] = scores[:, j]
+            measures[f'{name}_positive'] = scores[:, j] >= 4
+        return measures
 
     # ------------------------------------------------------------------
     # Main entry point
@@ -241,6 +271,9 @@ class NSSSystem:
         academic_year: str,
         weekly_engagement_df: Optional[pd.DataFrame] = None,
         assessment_df: Optional[pd.DataFrame] = None,
+        features: Optional[StudentFeatures] = None,
+        engagement_agg: Optional[pd.DataFrame] = None,
+        cube: Optional[AggregationCube] = None,
     ) -> pd.DataFrame:
         """
         Generate NSS responses for all programme_year == 3 students in academic_year.
@@ -252,54 +285,71 @@ class NSSSystem:
             academic_year: current academic year
             weekly_engagement_df: weekly engagement data for the year
             assessment_df: assessment events for the year (FINAL rows used for marks)
+            features: StudentFeatures built from enrolled_df (row-aligned); built here if None
+            engagement_agg: a precomputed aggregate_engagement() result for the year;
+                when given, weekly_engagement_df is not read
+            cube: aggregation cube (core_systems/aggregation_cube.py); the responses'
+                scores and % positive are added to it by faculty, programme and subgroup
 
         Returns:
             DataFrame with one row per Yr3 student.
         """
         # Filter to Yr3 students
-        yr3 = enrolled_df[enrolled_df['programme_year'].astype(int) == 3].copy()
-        yr3['student_id'] = yr3['student_id'].astype(str)
-        if yr3.empty:
+        if features is None:
+            features = StudentFeatures(enrolled_df)
+        yr3_rows = np.flatnonzero(features.programme_year == 3)
+        if not len(yr3_rows):
             return pd.DataFrame()
 
-        # Aggregate engagement and marks
-        eng_agg = self._aggregate_engagement(weekly_engagement_df, academic_year)
-        eng_agg['student_id'] = eng_agg['student_id'].astype(str)
-        eng_lookup = eng_agg.set_index('student_id') if not eng_agg.empty else pd.DataFrame()
-
+        sids = features.student_ids[yr3_rows]
+        w = self.weights
+
+        # Engagement per respondent, centred at 0.5 (0 for students without engagement)
+        eng_agg = engagement_agg.copy() if engagement_agg is not None \
+            else self.aggregate_engagement(weekly_engagement_df, academic_year)
+        engagement = np.zeros((len(sids), len(w.engagement_metrics)))
+        if not eng_agg.empty:
+            pos = pd.Index(eng_agg['student_id'].astype(str)).get_indexer(sids)
+            found = pos >= 0
+            for j, metric in enumerate(w.engagement_metrics):
+                if metric in eng_agg.columns:
+                    engagement[found, j] = eng_agg[metric].to_numpy(dtype=float)[pos[found]] - 0.5
+
+        # This year's mean FINAL mark, else the carried avg_mark (55 where unset)
+        carried = features.columns.get('avg_mark')
+        if carried is None:
+            avg_mark = np.full(len(sids), 55.0)
+        else:
+            carried = carried[yr3_rows]
+            avg_mark = np.array(pd.to_numeric(pd.Series(carried, dtype=object), errors='coerce'), dtype=float)
+            avg_mark[np.equal(carried, None) | (avg_mark == 0)] = 55.0
         mark_agg = self._aggregate_marks(assessment_df, academic_year)
-        mark_agg['student_id'] = mark_agg['student_id'].astype(str)
-        mark_lookup = mark_agg.set_index('student_id')['avg_mark'].to_dict() \
-            if not mark_agg.empty else {}
-
-        student_bias_std = float(self.config.get('student_bias_std', 0.28))
-
-        records = []
-        for _, student in yr3.iterrows():
-            sid = str(student['student_id'])
-            is_repeat = str(student.get('status', '')).lower() == 'repeating'
-            avg_mark = float(mark_lookup.get(sid, student.get('avg_mark', 55.0) or 55.0))
-            eng_row = eng_lookup.loc[sid] if (not eng_lookup.empty and sid in eng_lookup.index) else None
-
-            # One student-level bias (systematic over/under-rater)
-            student_bias = float(self.rng.normal(0, student_bias_std))
-
-            theme_raws = self._generate_theme_scores(
-                student, eng_row, avg_mark, is_repeat, student_bias
-            )
-            overall_raw = self._generate_overall(theme_raws, student, is_repeat, student_bias)
-
-            rec = {
-                'student_id': sid,
-                'academic_year': academic_year,
-                'programme_code': student.get('program_code', student.get('programme_code')),
-                'programme_year': 3,
-                'is_repeat_year': is_repeat,
-            }
-            for theme in THEMES:
-                rec[theme] = int(np.clip(round(theme_raws[theme]), 1, 5))
-            rec['overall_satisfaction'] = int(np.clip(round(overall_raw), 1, 5))
-
-            records.append(rec)
-
-        return pd.DataFrame(records)
+        if not mark_agg.empty:
+            pos = pd.Index(mark_agg['student_id'].astype(str)).get_indexer(sids)
+            found = pos >= 0
+            avg_mark[found] = mark_agg['avg_mark'].to_numpy(dtype=float)[pos[found]]
+
+        status = features.columns.get('status')
+        if status is None:
+            is_repeat = np.zeros(len(sids), dtype=bool)
+        else:
+            is_repeat = pd.Series(status[yr3_rows], dtype=object).astype(str).str.lower().to_numpy() == 'repeating'
+        codes = features.columns.get('program_code', features.columns.get('programme_code'))
+        programme_code = codes[yr3_rows] if codes is not None else np.full(len(sids), None, dtype=object)
+
+        theme_raws, overall_raw = self._score(features, yr3_rows, engagement, avg_mark, is_repeat)
+        scores = np.clip(np.round(np.column_stack([theme_raws, overall_raw])), 1, 5).astype(np.int64)
+        if cube is not None:
+            cube.add('nss', academic_year, programme_code, faculties(features, yr3_rows),
+                     subgroups(features, yr3_rows), self._cube_measures(scores))
+
+        responses = {
+            'student_id': sids.tolist(),
+            'academic_year': [academic_year] * len(sids),
+            'programme_code': programme_code.tolist(),
+            'programme_year': np.full(len(sids), 3, dtype=np.int64),
+            'is_repeat_year': is_repeat,
+        }
+        for j, name in enumerate(SCORED):
+            responses[name] = scores[:, j]
+        return pd.DataFrame(responses)
@@ -1,10 +1,15 @@
 import csv
 import io
+import sys
 import pandas as pd
 import numpy as np
 import yaml
 from typing import Dict, List, Tuple, Optional
 from dataclasses import dataclass
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from supporting_systems.record_batch import RecordBatchBuilder
 
 
 def _format_module_list_csv(modules: List[str]) -> str:
@@ -16,7 +21,9 @@ def _format_module_list_csv(modules: List[str]) -> str:
 
 @dataclass
 class ProgramEnrollment:
-    """Container for program enrollment data"""
+    """Container for program enrollment data (single-record API; batches use RecordBatchBuilder)"""
+    __slots__ = ('student_id', 'program_code', 'program_name', 'faculty', 'department',
+                 'year_modules', 'enrollment_factors')
     student_id: str
     program_code: str
     program_name: str
@@ -30,6 +37,15 @@ class ProgramEnrollmentSystem:
     System to enroll students in programs and assign Year 1 modules
     based on clan affinities, personality, and other characteristics.
     """
+
+    # Enrollment columns merged onto the student frame (one row per student)
+    _ENROLLMENT_SCHEMA = {
+        'student_id': object, 'program_code': object, 'program_name': object,
+        'faculty': object, 'department': object, 'programme_year': np.int64, 'status': object,
+        'year1_modules': object, 'year2_modules': object, 'year3_modules': object,
+        'num_year1_modules': np.int64, 'num_year2_modules': np.int64, 'num_year3_modules': np.int64,
+        'clan_affinity': np.float64, 'selection_probability': np.float64,
+    }
     
     def __init__(self, curriculum_file: str = "curriculum-and-lore/Stonegrove_University_Curriculum.xlsx"):
         """Initialize the enrollment system with curriculum data"""
@@ -182,11 +198,9 @@ class ProgramEnrollmentSystem:
         """Get list of Year 1 modules for a given program"""
         return self.get_modules_for_programme_year(program_code, 1)
         
-    def enroll_student(self, student_id: str, clan: str, personality: Dict[str, float], 
-                      motivation: Dict[str, float]) -> ProgramEnrollment:
-        """
-        Enroll a student in a program and assign Year 1 modules.
-        """
+    def _select_enrollment(self, clan: str, personality: Dict[str, float],
+                           motivation: Dict[str, float]) -> Tuple[str, str, str, str, Dict[str, float]]:
+        """Select a program: (program_code, program_name, faculty, department, enrollment_factors)."""
         # Select program
         program_code, program_name, selection_prob = self.select_program_for_student(
             clan, personality, motivation
@@ -197,9 +211,6 @@ class ProgramEnrollmentSystem:
         faculty = program_info['Faculty']
         department = program_info['Department']
         
-        # Get Year 1 modules
-        year1_modules = self.get_year1_modules_for_program(program_code)
-        
         # Create enrollment factors for analysis
         enrollment_factors = {
             'clan_affinity': self.get_program_affinity(clan, program_name),
@@ -207,7 +218,17 @@ class ProgramEnrollmentSystem:
             'personality_modifier': selection_prob - self.get_program_affinity(clan, program_name),
             'motivation_modifier': 0.0  # Could be calculated more precisely
         }
-        
+        return program_code, program_name, faculty, department, enrollment_factors
+
+    def enroll_student(self, student_id: str, clan: str, personality: Dict[str, float], 
+                      motivation: Dict[str, float]) -> ProgramEnrollment:
+        """
+        Enroll a student in a program and assign Year 1 modules.
+        """
+        program_code, program_name, faculty, department, enrollment_factors = self._select_enrollment(
+            clan, personality, motivation
+        )
+        year1_modules = self.get_year1_modules_for_program(program_code)
         return ProgramEnrollment(
             student_id=student_id,
             program_code=program_code,
@@ -217,6 +238,17 @@ class ProgramEnrollmentSystem:
             year_modules=year1_modules,
             enrollment_factors=enrollment_factors
         )
+
+    def _append_enrollment(self, batch: RecordBatchBuilder, student_id: str, program_code: str,
+                           program_name: str, faculty: str, department: str, programme_year: int,
+                           status: str, clan_affinity: float, selection_probability: float) -> None:
+        """Append one enrollment row (module lists for all three programme years) to batch."""
+        y1, y2, y3 = (self.get_modules_for_programme_year(program_code, y) for y in (1, 2, 3))
+        batch.append(
+            student_id, program_code, program_name, faculty, department, programme_year, status,
+            _format_module_list_csv(y1), _format_module_list_csv(y2), _format_module_list_csv(y3),
+            len(y1), len(y2), len(y3), clan_affinity, selection_probability,
+        )
         
     def enroll_students_batch(
         self,
@@ -228,7 +260,7 @@ class ProgramEnrollmentSystem:
         Enroll a batch of students in programs.
         Returns DataFrame with enrollment information added.
         """
-        enrollments = []
+        enrollments = RecordBatchBuilder(self._ENROLLMENT_SCHEMA, capacity=len(students_df))
         
         for idx, student in students_df.iterrows():
             # Use student_id from input (pipeline assigns before calling)
@@ -242,36 +274,20 @@ class ProgramEnrollmentSystem:
             motivation = {col: student[col] for col in motivation_cols}
             
             # Enroll student
-            enrollment = self.enroll_student(
-                student_id=sid,
+            program_code, program_name, faculty, department, factors = self._select_enrollment(
                 clan=student['clan'],
                 personality=personality,
                 motivation=motivation
             )
-            
-            y1 = enrollment.year_modules
-            y2 = self.get_modules_for_programme_year(enrollment.program_code, 2)
-            y3 = self.get_modules_for_programme_year(enrollment.program_code, 3)
-            enrollments.append({
-                'student_id': enrollment.student_id,
-                'program_code': enrollment.program_code,
-                'program_name': enrollment.program_name,
-                'faculty': enrollment.faculty,
-                'department': enrollment.department,
-                'programme_year': 1,
-                'status': 'enrolled',
-                'year1_modules': _format_module_list_csv(y1),
-                'year2_modules': _format_module_list_csv(y2),
-                'year3_modules': _format_module_list_csv(y3),
-                'num_year1_modules': len(y1),
-                'num_year2_modules': len(y2),
-                'num_year3_modules': len(y3),
-                'clan_affinity': enrollment.enrollment_factors['clan_affinity'],
-                'selection_probability': enrollment.enrollment_factors['selection_probability']
-            })
+            self._append_enrollment(
+                enrollments, sid, program_code, program_name, faculty, department,
+                programme_year=1, status='enrolled',
+                clan_affinity=factors['clan_affinity'],
+                selection_probability=factors['selection_probability'],
+            )
             
         # Create enrollment DataFrame
-        enrollment_df = pd.DataFrame(enrollments)
+        enrollment_df = enrollments.to_frame()
         # Align dtypes for merge (students_df may have int, enrollment_df has str)
         students_df = students_df.copy()
         if "student_id" not in students_df.columns:
@@ -300,7 +316,7 @@ class ProgramEnrollmentSystem:
         Students must already have program_code, program_name, faculty, department.
         If programme_year/status columns exist, use per-row; else use scalar args.
         """
-        records = []
+        records = RecordBatchBuilder(self._ENROLLMENT_SCHEMA, capacity=len(students_df))
         for idx, row in students_df.iterrows():
             sid_raw = row.get("student_id", idx)
             sid = str(sid_raw.iloc[0]) if isinstance(sid_raw, pd.Series) else str(sid_raw)
@@ -310,27 +326,12 @@ class ProgramEnrollmentSystem:
             dept = row["department"]
             py = int(row.get("programme_year", programme_year or 1))
             st = str(row.get("status", status or "enrolled"))
-            y1 = self.get_modules_for_programme_year(pc, 1)
-            y2 = self.get_modules_for_programme_year(pc, 2)
-            y3 = self.get_modules_for_programme_year(pc, 3)
-            records.append({
-                "student_id": sid,
-                "program_code": pc,
-                "program_name": pn,
-                "faculty": faculty,
-                "department": dept,
-                "programme_year": py,
-                "status": st,
-                "year1_modules": _format_module_list_csv(y1),
-                "year2_modules": _format_module_list_csv(y2),
-                "year3_modules": _format_module_list_csv(y3),
-                "num_year1_modules": len(y1),
-                "num_year2_modules": len(y2),
-                "num_year3_modules": len(y3),
-                "clan_affinity": row.get("clan_affinity", 0.5),
-                "selection_probability": row.get("selection_probability", 0.5),
-            })
-        enroll_df = pd.DataFrame(records)
+            self._append_enrollment(
+                records, sid, pc, pn, faculty, dept, py, st,
+                clan_affinity=row.get("clan_affinity", 0.5),
+                selection_probability=row.get("selection_probability", 0.5),
+            )
+        enroll_df = records.to_frame()
         result = students_df.copy()
         # Drop enrollment cols if present, then merge
         drop_cols = [c for c in result.columns if c in enroll_df.columns and c != "student_id"]
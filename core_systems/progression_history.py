@@ -0,0 +1,178 @@
+"""
+Stonegrove University Progression History
+
+Per-student progression history across academic years, updated by the progression
+stage as each year is decided (ProgressionSystem.compute_progression). It replaces
+re-concatenating every prior year's progression outcomes to find who has repeated:
+each student-year is recorded once, and lookups are array indexing.
+
+Arrays have one row per student held, found through a StudentIndex (sorted integer
+student IDs, searched with searchsorted); rows are added as new IDs appear. keep()
+drops every student not listed, so a long run holds only the students still active
+(run_longitudinal_pipeline keeps those continuing into the next year):
+  - repeat_count: years with status 'repeating'
+  - last_status: code into STATUSES of the most recent status (-1 = never recorded)
+  - first_year: starting calendar year of the first recorded academic year, e.g.
+    1046 for 1046-47 (-1 = never recorded)
+"""
+
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+STATUSES = ('enrolled', 'repeating', 'withdrawn', 'graduated')
+
+_STATUS_INDEX = pd.Index(STATUSES)
+_REPEATING = STATUSES.index('repeating')
+
+
+def _student_ids(student_ids) -> np.ndarray:
+    """Integer student IDs (from ints or their string form)."""
+    ids = np.asarray(student_ids)
+    if ids.dtype.kind not in 'iu':
+        ids = pd.Series(ids.ravel(), dtype=object).astype(np.int64).to_numpy()
+    ids = ids.astype(np.int64, copy=False)
+    if ids.size and ids.min() < 0:
+        raise ValueError("student IDs must be non-negative integers")
+    return ids
+
+
+def _start_year(academic_year: str) -> int:
+    return int(str(academic_year).split('-')[0])
+
+
+class StudentIndex:
+    """
+    Sorted integer student IDs with one row each, for per-student arrays that hold an
+    arbitrary set of students (ProgressionHistory, MarksLedger, StudentStateTable).
+    """
+
+    __slots__ = ('ids',)
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def find(self, student_ids) -> np.ndarray:
+        """Row of each student ID (-1 where the ID is not held)."""
+        ids = _student_ids(student_ids)
+        rows = np.searchsorted(self.ids, ids)
+        found = rows < len(self.ids)
+        found[found] = self.ids[rows[found]] == ids[found]
+        return np.where(found, rows, -1)
+
+    def add(self, student_ids) -> Optional[np.ndarray]:
+        """
+        Hold these IDs too. Returns the new row of each row held before (for moving the
+        owner's arrays with moved()), or None if every ID was already held.
+        """
+        ids = _student_ids(student_ids)
+        new = np.unique(ids[self.find(ids) < 0])
+        if not len(new):
+            return None
+        held = self.ids
+        self.ids = np.union1d(held, new)
+        return np.searchsorted(self.ids, held)
+
+    def keep(self, student_ids) -> np.ndarray:
+        """Hold only these IDs (those already held). Returns the kept rows, in row order."""
+        rows = np.unique(self.find(student_ids))
+        rows = rows[rows >= 0]
+        self.ids = self.ids[rows]
+        return rows
+
+
+def moved(values: np.ndarray, rows: np.ndarray, n: int, fill) -> np.ndarray:
+    """values with row i moved to rows[i] of n rows (StudentIndex.add); other rows hold fill."""
+    out = np.full((n,) + values.shape[1:], fill, dtype=values.dtype)
+    out[rows] = values
+    return out
+
+
+class ProgressionHistory:
+    """Repeat counts, last status and first year per student, indexed by student ID."""
+
+    __slots__ = ('index', 'repeat_count', 'last_status', 'first_year')
+
+    def __init__(self):
+        self.index = StudentIndex()
+        self.repeat_count = np.zeros(0, dtype=np.int16)
+        self.last_status = np.full(0, -1, dtype=np.int8)
+        self.first_year = np.full(0, -1, dtype=np.int16)
+
+    def __len__(self) -> int:
+        """Number of students held with at least one recorded year."""
+        return int((self.last_status >= 0).sum())
+
+    def _add(self, student_ids) -> None:
+        """Rows for IDs not yet held (0 repeats, status and first year -1)."""
+        rows = self.index.add(student_ids)
+        if rows is None:
+            return
+        n = len(self.index)
+        self.repeat_count = moved(self.repeat_count, rows, n, 0)
+        self.last_status = moved(self.last_status, rows, n, -1)
+        self.first_year = moved(self.first_year, rows, n, -1)
+
+    def keep(self, student_ids) -> None:
+        """Hold only these students (the others get no further updates or lookups)."""
+        rows = self.index.keep(student_ids)
+        self.repeat_count = self.repeat_count[rows]
+        self.last_status = self.last_status[rows]
+        self.first_year = self.first_year[rows]
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def record(self, student_ids: Iterable, academic_year: str, statuses: Iterable) -> None:
+        """Record one academic year's status for each student (one row per student)."""
+        ids = _student_ids(student_ids)
+        if ids.size == 0:
+            return
+        self._add(ids)
+        ids = self.index.find(ids)
+        codes = _STATUS_INDEX.get_indexer(np.asarray(statuses, dtype=object)).astype(np.int8)
+        self.repeat_count[ids] += (codes == _REPEATING)
+        self.last_status[ids] = codes
+        first = self.first_year[ids] < 0
+        self.first_year[ids[first]] = _start_year(academic_year)
+
+    @classmethod
+    def from_frame(cls, progression_df: pd.DataFrame) -> "ProgressionHistory":
+        """History from progression outcome rows (student_id, academic_year, status), year by year."""
+        history = cls()
+        if progression_df is None or progression_df.empty:
+            return history
+        for academic_year, rows in progression_df.groupby('academic_year', sort=True):
+            history.record(rows['student_id'], academic_year, rows['status'])
+        return history
+
+    # ------------------------------------------------------------------
+    # Lookups (IDs not held: 0 repeats, status -1 / None, first year -1)
+    # ------------------------------------------------------------------
+
+    def _gather(self, values: np.ndarray, student_ids, missing) -> np.ndarray:
+        rows = self.index.find(student_ids)
+        known = rows >= 0
+        out = np.full(len(rows), missing, dtype=values.dtype)
+        out[known] = values[rows[known]]
+        return out
+
+    def repeats(self, student_ids) -> np.ndarray:
+        return self._gather(self.repeat_count, student_ids, 0)
+
+    def has_repeated(self, student_ids) -> np.ndarray:
+        """True for students who have had status 'repeating' in any recorded year."""
+        return self.repeats(student_ids) > 0
+
+    def last_statuses(self, student_ids) -> np.ndarray:
+        codes = self._gather(self.last_status, student_ids, -1)
+        return np.asarray((None,) + STATUSES, dtype=object)[codes + 1]
+
+    def first_years(self, student_ids) -> np.ndarray:
+        return self._gather(self.first_year, student_ids, -1)
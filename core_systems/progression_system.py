@@ -8,11 +8,17 @@ Uses config/year_progression_rules.yaml for base probabilities and modifiers.
 Output: progression_outcomes.csv (student_id, academic_year, year_outcome, status, status_change_at)
 """
 
+import sys
 import pandas as pd
 import numpy as np
 import yaml
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, Mapping, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from core_systems.assessment_storage import final_marks, read_assessment_events
+from core_systems.progression_history import ProgressionHistory
+from core_systems.student_features import StudentFeatures, _significant_disability
 
 
 def _log_odds(p: float) -> float:
@@ -26,6 +32,10 @@ def _inv_log_odds(x: float) -> float:
     return 1.0 / (1.0 + np.exp(-x))
 
 
+# _decide_outcomes result codes
+_OUTCOMES = np.array(["enrolled", "repeating", "withdrawn"], dtype=object)
+
+
 class ProgressionSystem:
     """
     Determines year outcomes (pass/fail) and next-year status (progress/repeat/withdraw)
@@ -57,22 +67,13 @@ class ProgressionSystem:
         mods = self.config.get("modifiers", {})
         return mods.get(key, default)
 
-    def _has_significant_disability(self, student: pd.Series) -> bool:
-        """True if student has significant burden: requires_personal_care, wheelchair, blind, communication difficulties, or 2+ disabilities."""
-        raw = str(student.get("disabilities", "") or "").lower()
-        if not raw or "no_known_disabilities" in raw:
-            return False
-        significant = [
-            "requires_personal_care",
-            "wheelchair_user",
-            "blind_or_visually_impaired",
-            "communication_difficulties",
-        ]
-        if any(d in raw for d in significant):
-            return True
-        # 2+ disabilities (comma-separated)
-        parts = [p.strip() for p in raw.split(",") if p.strip() and "no_known" not in p]
-        return len(parts) >= 2
+    def _has_significant_disability(self, student: Mapping) -> bool:
+        """True if student has significant burden: requires_personal_care, wheelchair, blind, communication difficulties, or 2+ disabilities.
+        Uses the precomputed StudentFeatures flag when student is a feature row."""
+        flag = student.get("significant_disability")
+        if flag is not None:
+            return bool(flag)
+        return _significant_disability(student.get("disabilities", "") or "")
 
     def _compute_year_outcome(self, student_marks: pd.Series) -> Tuple[bool, float]:
         """
@@ -90,7 +91,7 @@ class ProgressionSystem:
     def _apply_modifiers(
         self,
         base_prob: float,
-        student: pd.Series,
+        student: Mapping,
         passed: bool,
         avg_mark: float,
         outcome_type: str,
@@ -140,10 +141,120 @@ class ProgressionSystem:
 
         return float(np.clip(_inv_log_odds(log_odds), 0.01, 0.99))
 
+    def _apply_modifiers_batch(
+        self,
+        base_prob: float,
+        outcome_type: str,
+        consc: np.ndarray,
+        acad: np.ndarray,
+        neur: np.ndarray,
+        avg_mark: np.ndarray,
+        significant_disability: np.ndarray,
+        passed: np.ndarray,
+        programme_year: np.ndarray,
+        has_prior_repeat: np.ndarray,
+    ) -> np.ndarray:
+        """
+        _apply_modifiers for arrays of students (same terms, added in the same order).
+        Returns one clipped probability per student.
+        """
+        mods = self.config.get("modifiers", {})
+        scale = float(self.config.get("trait_modifier_scale", 10))
+        log_odds = np.full(len(consc), _log_odds(base_prob))
+
+        if outcome_type == "progression":
+            log_odds += mods.get("conscientiousness_progression", 0) * (consc - 0.5) * scale
+            log_odds += mods.get("academic_drive_progression", 0) * (acad - 0.5) * scale
+            log_odds += mods.get("performance_progression", 0) * np.maximum(0, avg_mark - 50)
+            log_odds = np.where(significant_disability,
+                                log_odds + mods.get("significant_disability_progression", 0), log_odds)
+        elif outcome_type == "repeat":
+            log_odds += mods.get("conscientiousness_repeat", 0) * (consc - 0.5) * scale
+            log_odds += mods.get("academic_drive_repeat", 0) * (acad - 0.5) * scale
+        elif outcome_type == "withdrawal":
+            log_odds += mods.get("conscientiousness_withdrawal", 0) * (consc - 0.5) * scale
+            log_odds += mods.get("academic_drive_withdrawal", 0) * (acad - 0.5) * scale
+            log_odds += mods.get("neuroticism_withdrawal", 0) * (neur - 0.5) * scale
+            log_odds += mods.get("performance_withdrawal", 0) * np.maximum(0, avg_mark - 50)
+            log_odds = np.where(significant_disability,
+                                log_odds + mods.get("significant_disability_withdrawal", 0), log_odds)
+            # Investment effect (after fail), one lookup per distinct programme year
+            yr_mods = self.config.get("year_withdrawal_after_fail", {})
+            years, year_idx = np.unique(programme_year, return_inverse=True)
+            year_shift = np.array([float(yr_mods.get(int(y), yr_mods.get(str(int(y)), 0.0))) for y in years])
+            log_odds = np.where(passed, log_odds, log_odds + year_shift[year_idx])
+            # Discouragement: having already repeated and failed again
+            log_odds = np.where(has_prior_repeat & ~passed,
+                                log_odds + float(self.config.get("prior_repeat_withdrawal", 0.0)), log_odds)
+
+        return np.clip(_inv_log_odds(log_odds), 0.01, 0.99)
+
+    def outcome_probabilities(
+        self,
+        passed: np.ndarray,
+        consc: np.ndarray,
+        acad: np.ndarray,
+        neur: np.ndarray,
+        avg_mark: np.ndarray,
+        significant_disability: np.ndarray,
+        programme_year: np.ndarray,
+        has_prior_repeat: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Probability of the first outcome for each student: progress ('enrolled') if the
+        year was passed, 'repeating' if failed; the rest is 'withdrawn'. Year 3 passers
+        graduate without a roll and are not special-cased here.
+        """
+        common = (consc, acad, neur, avg_mark, significant_disability, passed, programme_year, has_prior_repeat)
+        p_progress = self._apply_modifiers_batch(
+            self.config.get("base_progression_probability", 0.90), "progression", *common)
+        p_withdraw_pass = self._apply_modifiers_batch(
+            self.config.get("base_withdrawal_after_pass", 0.10), "withdrawal", *common)
+        p_repeat = self._apply_modifiers_batch(
+            self.config.get("base_repeat_probability", 0.60), "repeat", *common)
+        p_withdraw_fail = self._apply_modifiers_batch(
+            self.config.get("base_withdrawal_after_fail", 0.40), "withdrawal", *common)
+
+        p_first = np.where(passed, p_progress, p_repeat)
+        p_second = np.where(passed, p_withdraw_pass, p_withdraw_fail)
+        total = p_first + p_second
+        p_first = p_first / total
+        p_second = p_second / total
+        return p_first / (p_first + p_second)
+
+    def _decide_outcomes(
+        self,
+        passed: np.ndarray,
+        features: StudentFeatures,
+        student_rows: np.ndarray,
+        avg_mark: np.ndarray,
+        programme_year: np.ndarray,
+        has_prior_repeat: np.ndarray,
+    ) -> np.ndarray:
+        """
+        _decide_outcome for arrays of students, with one uniform draw per student.
+
+        Generator.choice over two outcomes draws one uniform u and takes the first when
+        u < p_first / (p_first + p_second); the same comparison on rng.random(n) gives
+        the same outcomes, from the same stream, as n calls of _decide_outcome.
+        """
+        p_first = self.outcome_probabilities(
+            passed,
+            features.trait("refined_conscientiousness", student_rows),
+            features.trait("motivation_academic_drive", student_rows),
+            features.trait("refined_neuroticism", student_rows),
+            avg_mark,
+            np.where(student_rows >= 0, features.significant_disability[student_rows], False),
+            programme_year,
+            has_prior_repeat,
+        )
+        first = self.rng.random(len(passed)) < p_first
+        return _OUTCOMES[np.where(first, np.where(passed, 0, 1), 2)]
+
     def _decide_outcome(
         self,
         passed: bool,
-        student: pd.Series,
+        student: Mapping,
         avg_mark: float,
         programme_year: int = 1,
         has_prior_repeat: bool = False,
@@ -186,6 +297,8 @@ class ProgressionSystem:
         academic_year: str = "1046-47",
         status_change_at: str = "1047-09-01",
         prior_progression_df: Optional[pd.DataFrame] = None,
+        features: Optional[StudentFeatures] = None,
+        history: Optional[ProgressionHistory] = None,
     ) -> pd.DataFrame:
         """
         Compute progression outcomes for all students.
@@ -198,109 +311,92 @@ class ProgressionSystem:
             prior_progression_df: all progression outcomes from prior years (for repeat history).
                 If provided, students who have ever had status='repeating' get a higher
                 withdrawal probability on subsequent fails (discouragement effect).
+                Ignored if history is given. Student IDs may be any strings here; history
+                needs integer IDs.
+            features: StudentFeatures for enrolled_df (traits and disability flags);
+                built from enrolled_df if None.
+            history: ProgressionHistory of prior years (repeat history lookup). This
+                year's outcomes are recorded into it, so the caller passes the same
+                history every year.
 
         Returns:
             DataFrame with: student_id, academic_year, year_outcome, status, status_change_at,
             programme_year (for next year), avg_mark, modules_passed, modules_total
         """
-        # Build prior repeat lookup: student_id -> has ever had status='repeating' before this year
-        prior_repeat_sids: set = set()
-        if prior_progression_df is not None and not prior_progression_df.empty:
-            repeaters = prior_progression_df[
-                prior_progression_df['status'] == 'repeating'
-            ]['student_id'].astype(str).unique()
-            prior_repeat_sids = set(repeaters)
         if assessment_df.empty:
             return pd.DataFrame()
 
-        # Progression uses FINAL rows only (combined_mark = 0.4*MIDTERM + 0.6*FINAL).
+        # Progression uses FINAL marks only (combined_mark = 0.4*MIDTERM + 0.6*FINAL).
         # Backward compatible: if component_code absent or combined_mark null, falls back to assessment_mark.
-        if 'component_code' in assessment_df.columns:
-            finals = assessment_df[assessment_df['component_code'] == 'FINAL'].copy()
-        else:
-            finals = assessment_df.copy()
-        if 'combined_mark' in finals.columns:
-            finals['mark_for_progression'] = finals['combined_mark'].fillna(finals['assessment_mark'])
+        # Either assessment layout (long or wide) is accepted.
+        finals = final_marks(assessment_df).rename(columns={'mark': 'mark_for_progression'})
+
+        # Aggregate marks per student: student_id factorized once (sorted, as groupby would),
+        # modules counted as distinct (student, module) pairs
+        sid_codes, sid_levels = pd.factorize(finals["student_id"], sort=True)
+        mod_codes = pd.factorize(finals["module_code"])[0]
+        marks = finals["mark_for_progression"].to_numpy(dtype=float)
+        keep = sid_codes >= 0
+        sid_codes, mod_codes, marks = sid_codes[keep], mod_codes[keep], marks[keep]
+        n_students = len(sid_levels)
+
+        by_student = pd.Series(marks).groupby(sid_codes)
+        avg_mark = by_student.mean().to_numpy()
+        min_mark = by_student.min().to_numpy()
+        pairs = pd.Series(sid_codes.astype(np.int64) * (mod_codes.max(initial=0) + 1) + mod_codes)
+        first_pair = (mod_codes >= 0) & ~pairs.duplicated().to_numpy()
+        modules_total = np.bincount(sid_codes[first_pair], minlength=n_students)
+        passed_rows = np.flatnonzero((marks >= self.pass_threshold) & (mod_codes >= 0))
+        passed_rows = passed_rows[~pairs.iloc[passed_rows].duplicated().to_numpy()]
+        modules_passed = np.bincount(sid_codes[passed_rows], minlength=n_students)
+
+        # Student features (traits, disability flags) by row; -1 = not in enrolled_df
+        if features is None:
+            features = StudentFeatures(enrolled_df)
+        student_ids = np.asarray(sid_levels).astype(str).astype(object)
+        student_rows = features.rows(student_ids)
+        # programme_year from enrolled (needed for Year 3 graduation)
+        programme_year = np.where(student_rows >= 0, features.programme_year[student_rows], 1)
+
+        passed = min_mark >= self.pass_threshold
+        # Prior repeat history (students who have ever had status='repeating' before this year)
+        if history is not None:
+            has_prior_repeat = history.has_repeated(student_ids)
+        elif prior_progression_df is not None and not prior_progression_df.empty:
+            repeaters = prior_progression_df[
+                prior_progression_df['status'] == 'repeating'
+            ]['student_id'].astype(str).unique()
+            has_prior_repeat = pd.Index(student_ids).isin(repeaters)
         else:
-            finals['mark_for_progression'] = finals['assessment_mark']
-
-        # Aggregate marks per student
-        agg = (
-            finals.groupby("student_id")
-            .agg(
-                avg_mark=("mark_for_progression", "mean"),
-                modules_total=("module_code", "nunique"),
-                min_mark=("mark_for_progression", "min"),
-            )
-            .reset_index()
-        )
-        agg["year_outcome"] = agg["min_mark"].apply(
-            lambda m: "pass" if m >= self.pass_threshold else "fail"
+            has_prior_repeat = np.zeros(n_students, dtype=bool)
+
+        # Year 3 pass → graduated (no roll); everyone else gets one draw, in student order
+        graduated = (programme_year == 3) & passed
+        decide = ~graduated
+        status = np.full(n_students, "graduated", dtype=object)
+        status[decide] = self._decide_outcomes(
+            passed[decide], features, student_rows[decide], avg_mark[decide],
+            programme_year[decide], has_prior_repeat[decide],
         )
-        passed_modules = finals[finals["mark_for_progression"] >= self.pass_threshold]
-        modules_passed = passed_modules.groupby("student_id")["module_code"].nunique()
-        agg["modules_passed"] = agg["student_id"].map(modules_passed).fillna(0).astype(int)
-
-        # Build student lookup for traits (enrolled has student_id as index or column)
-        enrolled_df = enrolled_df.copy()
-        if "student_id" not in enrolled_df.columns and enrolled_df.index.name != "student_id":
-            enrolled_df["student_id"] = enrolled_df.index.astype(str)
-        enrolled_df["student_id"] = enrolled_df["student_id"].astype(str)
-        agg["student_id"] = agg["student_id"].astype(str)
-
-        student_lookup = enrolled_df.set_index("student_id")
-
-        # Merge programme_year from enrolled (needed for Year 3 graduation)
-        if "programme_year" in enrolled_df.columns:
-            prog_year_map = enrolled_df.drop_duplicates("student_id").set_index("student_id")["programme_year"].to_dict()
-            agg["programme_year"] = agg["student_id"].map(lambda s: prog_year_map.get(s, 1))
-        else:
-            agg["programme_year"] = 1
-
-        # Deduplicate columns to avoid Series values in row
-        agg = agg.loc[:, ~agg.columns.duplicated()]
-
-        records = []
-        for row in agg.itertuples(index=False):
-            sid = str(row.student_id)  # itertuples returns scalars, avoids Series
-            passed = row.year_outcome == "pass"
-            avg_mark = row.avg_mark
-            programme_year = int(getattr(row, "programme_year", 1))
-            has_prior_repeat = sid in prior_repeat_sids
-
-            student = student_lookup.loc[sid] if sid in student_lookup.index else pd.Series()
-
-            # Year 3 pass → graduated (no roll)
-            if programme_year == 3 and passed:
-                status = "graduated"
-            else:
-                status = self._decide_outcome(passed, student, avg_mark,
-                                              programme_year=programme_year,
-                                              has_prior_repeat=has_prior_repeat)
-
-            # programme_year for next year: 2 if progressed, 1 if repeating, None if withdrawn/graduated
-            if status == "graduated":
-                next_prog_year = None
-            elif status == "enrolled":
-                next_prog_year = programme_year + 1  # progressed to next year (1→2 or 2→3)
-            elif status == "repeating":
-                next_prog_year = programme_year  # same year, repeating
-            else:
-                next_prog_year = None  # withdrawn
-
-            records.append({
-                "student_id": sid,
-                "academic_year": academic_year,
-                "year_outcome": row.year_outcome,
-                "status": status,
-                "status_change_at": status_change_at,
-                "programme_year_next": next_prog_year,
-                "avg_mark": round(avg_mark, 2),
-                "modules_passed": int(row.modules_passed),
-                "modules_total": int(row.modules_total),
-            })
-
-        return pd.DataFrame(records)
+
+        # programme_year for next year: +1 if progressed, same if repeating, None if withdrawn/graduated
+        next_prog_year = np.where(status == "enrolled", programme_year + 1,
+                                  np.where(status == "repeating", programme_year, np.nan))
+
+        if history is not None:
+            history.record(student_ids, academic_year, status)
+
+        return pd.DataFrame({
+            "student_id": student_ids,
+            "academic_year": academic_year,
+            "year_outcome": np.where(passed, "pass", "fail").astype(object),
+            "status": status,
+            "status_change_at": status_change_at,
+            "programme_year_next": next_prog_year,
+            "avg_mark": np.round(avg_mark, 2),
+            "modules_passed": modules_passed,
+            "modules_total": modules_total,
+        })
 
     def run(
         self,
@@ -313,7 +409,7 @@ class ProgressionSystem:
         """
         Load data, compute progression, save and return outcomes.
         """
-        assessment_df = pd.read_csv(assessment_path)
+        assessment_df = read_assessment_events(assessment_path, layout=None)
         enrolled_df = pd.read_csv(enrolled_path)
 
         outcomes = self.compute_progression(
@@ -0,0 +1,123 @@
+"""
+Stonegrove University Student Sharding
+
+Partition of a year's enrolled students into ID ranges (shards) for running the
+per-student stages (engagement, assessment, progression, graduate outcomes, NSS)
+shard by shard in worker processes (run_longitudinal_pipeline.py, SHARDS > 1):
+  - Shards: n contiguous student ID ranges holding equal numbers of the enrolled
+    students; shard_of() / take() select any frame's rows by student_id
+  - shard_seed(): each shard's random stream, from the year seed and the shard
+    number, so a shard's draws do not depend on which process runs it
+  - map_shards(): fn(shard, *args) for every shard, in a pool of forked workers,
+    results in shard order
+  - join_csv_parts(): one CSV from per-shard CSVs (header once), so large shard
+    outputs are written by the workers instead of sent back
+
+Outputs depend on the number of shards but not on the number of workers: with one
+worker (or where processes cannot be forked) the shards run one after another in
+the calling process and produce the same results. Workers are forked after the
+stage's inputs are in memory, so they read them without pickling; only each
+shard's results are sent back.
+"""
+
+import multiprocessing
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from core_systems.progression_history import _student_ids
+
+
+class Shards:
+    """n student ID ranges, each with an equal share of the enrolled students."""
+
+    __slots__ = ('n', 'bounds')
+
+    def __init__(self, student_ids, n: int):
+        ids = np.unique(_student_ids(pd.unique(pd.Series(student_ids, dtype=object).astype(str))))
+        n = max(1, min(int(n), len(ids))) if len(ids) else 1
+        self.n = n
+        # Lower bound of each range (the first covers every ID below the second)
+        self.bounds = np.array([part[0] for part in np.array_split(ids, n)], dtype=np.int64) \
+            if len(ids) else np.zeros(1, dtype=np.int64)
+        self.bounds[0] = np.iinfo(np.int64).min
+
+    def __len__(self) -> int:
+        return self.n
+
+    def shard_of(self, student_ids) -> np.ndarray:
+        """Shard number of each student ID."""
+        codes, uniques = pd.factorize(pd.Series(student_ids, dtype=object).astype(str))
+        shard = np.searchsorted(self.bounds, _student_ids(np.asarray(uniques, dtype=object)), side='right') - 1
+        return shard[codes]
+
+    def take(self, df: pd.DataFrame, shard: int) -> pd.DataFrame:
+        """Rows of df whose student_id is in the shard, in their original order."""
+        if df is None or df.empty or 'student_id' not in df.columns:
+            return df
+        column = df['student_id']
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            by_code = self.shard_of(column.cat.categories)
+            codes = column.cat.codes.to_numpy()
+            mask = (codes >= 0) & (by_code[np.maximum(codes, 0)] == shard)
+        else:
+            mask = self.shard_of(column) == shard
+        return df[mask]
+
+
+def shard_seed(seed: int, shard: int) -> np.random.SeedSequence:
+    """The shard's random stream for a stage seeded with `seed` (accepted wherever a seed is)."""
+    return np.random.SeedSequence([int(seed), int(shard)])
+
+
+def seed_global_rng(seed) -> None:
+    """Reset the global numpy stream (used by engagement) to a seed or SeedSequence."""
+    np.random.set_state(np.random.RandomState(np.random.MT19937(seed)).get_state())
+
+
+# ---------------------------------------------------------------------------
+# Execution
+# ---------------------------------------------------------------------------
+
+_task = None   # (fn, args) of the running map_shards call, inherited by forked workers
+
+
+def _run_shard(shard: int):
+    fn, args = _task
+    return fn(shard, *args)
+
+
+def can_fork() -> bool:
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def map_shards(fn: Callable, n_shards: int, *args, workers: int = 1) -> List:
+    """
+    [fn(shard, *args) for shard in range(n_shards)]. With workers > 1, shards run in
+    that many forked processes, which inherit fn and args; results come back in
+    shard order. Results must be picklable.
+    """
+    global _task
+    if workers <= 1 or n_shards <= 1 or not can_fork():
+        return [fn(shard, *args) for shard in range(n_shards)]
+    _task = (fn, args)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, n_shards),
+                                 mp_context=multiprocessing.get_context('fork')) as pool:
+            return list(pool.map(_run_shard, range(n_shards)))
+    finally:
+        _task = None
+
+
+def join_csv_parts(parts: Sequence, path) -> None:
+    """Concatenate CSV files with the same columns into path, keeping the first header only."""
+    with open(Path(path), 'wb') as out:
+        for i, part in enumerate(parts):
+            with open(part, 'rb') as f:
+                if i:
+                    f.readline()
+                shutil.copyfileobj(f, out)
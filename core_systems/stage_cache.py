@@ -0,0 +1,214 @@
+"""
+Stonegrove University Stage Cache
+
+Content-addressed cache of the longitudinal pipeline's per-year stage outputs
+(run_longitudinal_pipeline.py). Each stage is declared with the code and config
+files it reads (Stage); its outputs for a year are stored under a key hashing:
+  - the stage version: its function's source (and that of the helpers it calls)
+    and the contents of its code and config files
+  - its inputs: seed, settings, and the output hashes of the stages (and carried
+    state) it reads
+
+A rerun loads every stage whose key is unchanged from data/cache/<stage>/<key>.pkl
+and executes only the rest. Editing config/nss_modifiers.yaml, say, reruns NSS
+alone; editing config/assessment_modifiers.yaml reruns assessment and, where its
+marks change, the stages downstream of them. Downstream keys use upstream output
+hashes, not upstream keys, so a stage that reruns and produces the same output
+leaves its dependants cached.
+
+Students, enrollment and engagement draw from the global numpy/random streams in
+turn; the first two return the stream state after them as part of their output,
+so the next stage starts from the state a full run would have.
+
+The run's manifest (per year and stage: key, output hash, whether it was loaded
+from the cache) is recorded in data/metadata.json under "stage_cache".
+
+A disabled cache (enabled=False, the default for library callers of run_year)
+neither loads nor writes anything; refresh=True (--no-cache) executes every stage
+and overwrites its entry. Entries are never removed on their own: prune() deletes
+those the current run did not use (--prune-cache).
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import random
+from pathlib import Path
+from typing import Callable, Dict, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Enrolled-student columns that come from the previous year's progression outcome.
+# Engagement does not read them, so they are left out of engagement_key.
+PROGRESSION_COLUMNS = (
+    'academic_year', 'status', 'status_change_at', 'year_outcome',
+    'programme_year_next', 'avg_mark', 'modules_passed', 'modules_total',
+)
+
+
+# ---------------------------------------------------------------------------
+# Fingerprints
+# ---------------------------------------------------------------------------
+
+def _update(h, value) -> None:
+    """Feed a value's content into hash h (frames, arrays, containers, scalars)."""
+    if value is None:
+        h.update(b'N')
+    elif isinstance(value, pd.DataFrame):
+        h.update(json.dumps(['F', [str(c) for c in value.columns], [str(d) for d in value.dtypes]]).encode())
+        if len(value.columns):
+            frame = value.astype({c: str for c, d in value.dtypes.items() if d == object})
+            h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(json.dumps(['A', str(value.dtype), value.shape]).encode())
+        h.update(pickle.dumps(value.tolist()) if value.dtype == object else np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (tuple, list)):
+        h.update(f'T{len(value)}'.encode())
+        for item in value:
+            _update(h, item)
+    elif isinstance(value, dict):
+        h.update(f'D{len(value)}'.encode())
+        for k in sorted(value, key=str):
+            _update(h, str(k))
+            _update(h, value[k])
+    else:
+        h.update(repr(value).encode())
+
+
+def fingerprint(value) -> str:
+    """Content hash of a stage output (or any frame/array/container of them)."""
+    h = hashlib.sha1()
+    _update(h, value)
+    return h.hexdigest()
+
+
+def engagement_key(enrolled_df: pd.DataFrame, settings: Dict) -> str:
+    """Fingerprint of engagement's inputs: enrolled students (row order included) and settings."""
+    cols = sorted(c for c in enrolled_df.columns if c not in PROGRESSION_COLUMNS)
+    h = hashlib.sha1(json.dumps({'settings': settings, 'columns': cols}, sort_keys=True).encode())
+    frame = enrolled_df[cols].astype({c: str for c in cols if enrolled_df[c].dtype == object})
+    h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def chain(previous: str, output_hash: str) -> str:
+    """Hash of carried state after one more year's output (e.g. the marks ledger)."""
+    return hashlib.sha1(f"{previous}:{output_hash}".encode()).hexdigest()
+
+
+def capture_rng_state() -> tuple:
+    """Global numpy and random module states."""
+    return np.random.get_state(), random.getstate()
+
+
+def restore_rng_state(state: tuple) -> None:
+    np_state, py_state = state
+    np.random.set_state(np_state)
+    random.setstate(py_state)
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+class Stage:
+    """
+    A cacheable step of a pipeline year: function, code files and config files it reads,
+    and any other functions it calls whose source should count as part of it.
+    """
+
+    __slots__ = ('name', 'fn', 'code', 'config', 'calls', '_version')
+
+    def __init__(self, name: str, fn: Callable, code: Sequence[str] = (), config: Sequence[str] = (),
+                 calls: Sequence[Callable] = ()):
+        self.name = name
+        self.fn = fn
+        self.code = tuple(code)
+        self.config = tuple(config)
+        self.calls = tuple(calls)
+        self._version: Optional[str] = None
+
+    def version(self, root) -> str:
+        """Hash of the function sources and the code and config files (paths relative to root)."""
+        if self._version is None:
+            h = hashlib.sha1(inspect.getsource(self.fn).encode())
+            for fn in self.calls:
+                h.update(inspect.getsource(fn).encode())
+            for rel in self.code + self.config:
+                path = Path(root) / rel
+                h.update(rel.encode())
+                h.update(path.read_bytes() if path.exists() else b'<missing>')
+            self._version = h.hexdigest()
+        return self._version
+
+
+class StageCache:
+    """
+    Stage outputs on disk by key, and the manifest of the current run.
+    enabled=False: every stage runs and nothing is written. refresh: every stage runs
+    and its entry is overwritten.
+    """
+
+    __slots__ = ('directory', 'root', 'enabled', 'refresh', 'manifest')
+
+    def __init__(self, directory, root, enabled: bool = True, refresh: bool = False):
+        self.directory = Path(directory)
+        self.root = Path(root)
+        self.enabled = enabled
+        self.refresh = refresh
+        self.manifest: Dict[str, Dict[str, Dict[str, object]]] = {}   # label -> stage -> entry
+
+    def key(self, stage: Stage, inputs: Mapping) -> str:
+        payload = json.dumps({'stage': stage.name, 'version': stage.version(self.root), 'inputs': inputs},
+                             sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def run(self, stage: Stage, label: str, inputs: Mapping, *args, force: bool = False) -> Tuple[object, str, bool]:
+        """
+        stage.fn(*args), or its cached output when a run with the same version and inputs
+        is on disk. inputs identifies args: seed, settings and upstream output hashes
+        (JSON-serialisable). force=True executes and overwrites. Returns (output, output
+        hash, loaded from cache). A disabled cache executes and writes nothing.
+        """
+        key = self.key(stage, inputs)
+        path = self.directory / stage.name / f"{key}.pkl"
+        cached = self.enabled and not self.refresh and not force and path.exists()
+        if cached:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            output, output_hash = entry['output'], entry['output_hash']
+        else:
+            output = stage.fn(*args)
+            output_hash = fingerprint(output)
+        if self.enabled and not cached:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                pickle.dump({'output': output, 'output_hash': output_hash}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        self.manifest.setdefault(label, {})[stage.name] = {
+            'key': key, 'output': output_hash, 'cached': cached,
+        }
+        return output, output_hash, cached
+
+    def prune(self) -> int:
+        """
+        Delete the entries the current run's manifest does not use (other code, config,
+        seeds or inputs) and any half-written ones. Returns the number of files removed.
+        """
+        used = {(name, entry['key']) for stages in self.manifest.values() for name, entry in stages.items()}
+        removed = 0
+        for path in list(self.directory.glob('*/*.pkl')) + list(self.directory.glob('*/*.tmp')):
+            if path.suffix == '.tmp' or (path.parent.name, path.stem) not in used:
+                path.unlink()
+                removed += 1
+        return removed
+
+    def summary(self) -> str:
+        """'<loaded> of <total> stage runs loaded from cache'."""
+        entries = [e for stages in self.manifest.values() for e in stages.values()]
+        return f"{sum(e['cached'] for e in entries)} of {len(entries)} stage runs loaded from cache"
@@ -0,0 +1,198 @@
+"""
+Stonegrove University Student Features
+
+One typed, column-oriented copy of the student attributes read by the assessment,
+progression, NSS and graduate outcomes systems. The year runner builds it once per
+academic year (run_longitudinal_pipeline.run_year) and passes it to all four, so the
+attributes are prepared once instead of read from a pandas row in every system.
+
+- traits: refined_* and motivation_* columns as float32 arrays (trait() gathers float64)
+- categoricals: clan, disabilities, education, socio_economic_rank as integer codes
+  into their distinct values
+- flags: has_disability, significant_disability (parsed once per distinct string)
+- modifier(): a per-student modifier column from a function of one categorical,
+  evaluated once per distinct value and cached by name; ses_modifier() makes that
+  function from a {rank: modifier} config block
+
+Arrays are aligned with the rows of the frame the features were built from. rows()
+maps student IDs to row positions; row() gives a read-only mapping for one student
+with the same .get() interface as a pandas row.
+"""
+
+from collections.abc import Mapping
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+
+TRAIT_PREFIXES = ('refined_', 'motivation_')
+
+# Categorical columns and the value used when a column is absent
+CATEGORICALS = {
+    'clan': '',
+    'disabilities': '',
+    'education': '',
+    'socio_economic_rank': 4,
+}
+
+# Other per-student columns carried as-is (absent columns are omitted)
+PASSTHROUGH = ('program_code', 'programme_code', 'program_name', 'status', 'avg_mark', 'species')
+
+# Reporting subgroups: socio_economic_rank bands (upper bounds, inclusive; the last band is open)
+SES_BANDS = (3, 6)
+
+_SIGNIFICANT_DISABILITIES = (
+    'requires_personal_care',
+    'wheelchair_user',
+    'blind_or_visually_impaired',
+    'communication_difficulties',
+)
+
+
+def _has_disability(disabilities) -> bool:
+    raw = str(disabilities).lower()
+    return bool(raw) and 'no_known_disabilities' not in raw
+
+
+def _significant_disability(disabilities) -> bool:
+    """requires_personal_care, wheelchair, blind, communication difficulties, or 2+ disabilities."""
+    raw = str(disabilities).lower()
+    if not raw or 'no_known_disabilities' in raw:
+        return False
+    if any(d in raw for d in _SIGNIFICANT_DISABILITIES):
+        return True
+    parts = [p.strip() for p in raw.split(',') if p.strip() and 'no_known' not in p]
+    return len(parts) >= 2
+
+
+def ses_modifier(mods: Mapping) -> Callable:
+    """fn(socio_economic_rank) -> value of a {rank: modifier} config block (int or str keys), for modifier()."""
+    def fn(rank) -> float:
+        ses = int(rank)
+        return float(mods.get(ses, mods.get(str(ses), 0.0)))
+    return fn
+
+
+class StudentFeatures:
+    """Per-year student feature arrays, one entry per row of the source frame."""
+
+    def __init__(self, df: pd.DataFrame):
+        df = df.loc[:, ~df.columns.duplicated()]
+        n = len(df)
+        ids = df['student_id'] if 'student_id' in df.columns else pd.Series(df.index, index=df.index)
+        self.student_ids = ids.astype(str).to_numpy(dtype=object)
+        if 'programme_year' in df.columns:
+            self.programme_year = df['programme_year'].fillna(1).astype(int).to_numpy()
+        else:
+            self.programme_year = np.ones(n, dtype=np.int64)
+
+        # First row per student ID (rows() lookup)
+        first = ~pd.Index(self.student_ids).duplicated()
+        self._lookup = pd.Index(self.student_ids[first])
+        self._lookup_rows = np.flatnonzero(first)
+
+        self.traits: Dict[str, np.ndarray] = {
+            c: df[c].to_numpy(dtype=np.float32)
+            for c in df.columns if c.startswith(TRAIT_PREFIXES)
+        }
+
+        self._codes: Dict[str, np.ndarray] = {}
+        self._levels: Dict[str, np.ndarray] = {}
+        for name, default in CATEGORICALS.items():
+            values = df[name] if name in df.columns else pd.Series(default, index=df.index, dtype=object)
+            codes, levels = pd.factorize(values, use_na_sentinel=False)
+            self._codes[name] = codes.astype(np.int32)
+            self._levels[name] = np.asarray(levels, dtype=object)
+
+        self.columns: Dict[str, np.ndarray] = {
+            c: df[c].to_numpy(dtype=object) for c in PASSTHROUGH if c in df.columns
+        }
+        self.has_disability = self._map_levels('disabilities', _has_disability, bool)
+        self.significant_disability = self._map_levels('disabilities', _significant_disability, bool)
+        self._modifiers: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.student_ids)
+
+    def _map_levels(self, name: str, fn: Callable, dtype=float) -> np.ndarray:
+        return np.array([fn(v) for v in self._levels[name]], dtype=dtype)[self._codes[name]]
+
+    # ------------------------------------------------------------------
+    # Column access
+    # ------------------------------------------------------------------
+
+    def rows(self, student_ids: Iterable) -> np.ndarray:
+        """Row position for each student ID (first occurrence); -1 if not present."""
+        ids = pd.Index(np.asarray([str(s) for s in student_ids], dtype=object))
+        pos = self._lookup.get_indexer(ids)
+        return np.where(pos >= 0, self._lookup_rows[pos], -1)
+
+    def trait(self, name: str, rows: Optional[np.ndarray] = None, default: float = 0.5) -> np.ndarray:
+        """float64 trait values (all rows, or the given rows; default where missing or rows == -1)."""
+        values = self.traits.get(name)
+        if rows is None:
+            return np.full(len(self), default) if values is None else values.astype(np.float64)
+        rows = np.asarray(rows)
+        out = np.full(len(rows), default)
+        if values is not None:
+            found = rows >= 0
+            out[found] = values[rows[found]]
+        return out
+
+    def category(self, name: str) -> np.ndarray:
+        """Original values of a categorical column, one per row."""
+        return self._levels[name][self._codes[name]]
+
+    def modifier(self, key: str, name: str, fn: Callable) -> np.ndarray:
+        """
+        fn(value) for categorical `name`, per row, evaluated once per distinct value.
+        Cached under key, so each system's modifier is computed once per year.
+        """
+        if key not in self._modifiers:
+            self._modifiers[key] = self._map_levels(name, fn)
+        return self._modifiers[key]
+
+    def value(self, name: str, row: int):
+        """One student's value of any column; KeyError if absent."""
+        if row < 0:
+            raise KeyError(name)
+        if name in self.traits:
+            return float(self.traits[name][row])
+        if name in self._codes:
+            return self._levels[name][self._codes[name][row]]
+        if name in self.columns:
+            return self.columns[name][row]
+        if name == 'student_id':
+            return self.student_ids[row]
+        if name == 'programme_year':
+            return int(self.programme_year[row])
+        if name in ('has_disability', 'significant_disability'):
+            return bool(getattr(self, name)[row])
+        raise KeyError(name)
+
+    def row(self, row: int) -> 'StudentRow':
+        return StudentRow(self, row)
+
+
+class StudentRow(Mapping):
+    """Read-only view of one student's features; row -1 is an empty row."""
+
+    __slots__ = ('_features', '_row')
+
+    def __init__(self, features: StudentFeatures, row: int):
+        self._features = features
+        self._row = int(row)
+
+    def __getitem__(self, name: str):
+        return self._features.value(name, self._row)
+
+    def __iter__(self) -> Iterator[str]:
+        if self._row < 0:
+            return iter(())
+        f = self._features
+        return iter(['student_id', 'programme_year', *f.traits, *f._codes, *f.columns,
+                     'has_disability', 'significant_disability'])
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
@@ -0,0 +1,239 @@
+"""
+Stonegrove University Student State
+
+Longitudinal carry-over between academic years (run_longitudinal_pipeline.main).
+
+StudentStateTable is the hot tier of a run: a struct of arrays with one row per
+student held (rows found by a StudentIndex of sorted integer IDs), holding only
+students who may still enroll:
+  - student columns: generated attributes and programme enrollment, written once
+    when a student first enrolls (everything in the enrolled frame except
+    CARRIED_COLUMNS); programme_year is rewritten each year the student is enrolled
+  - progression columns: the student's latest progression outcome (status,
+    programme_year_next, avg_mark, ...), rewritten each year they are assessed
+  - history: ProgressionHistory (repeat counts, last status, first year), updated
+    by the progression stage
+  - marks: MarksLedger (FINAL mark sums and counts by programme year), updated by
+    the assessment stage and read for degree classification
+
+Year transitions are index updates over the students of that year: advance() writes
+new students' rows and the year's programme years and outcomes, and keeps the row
+indices of the students who continue. continuing_enrolled() gathers those rows once,
+already enrolled for the next year (programme year and status from their outcome,
+programme and module lists as first enrolled), as the continuing part of that
+year's enrolled frame. That frame is the year's enrollment fact and what the stages
+read, so it is the one wide copy a year makes. continuing_students() gives the
+rows before enrollment (ProgramEnrollmentSystem.enroll_continuing_students input).
+
+Students who graduate or withdraw do not come back, so after each year advance()
+keeps only the continuing students' rows (table, history and marks); everyone else
+is dropped, whatever their ID. Their rows are already in the year's archived facts
+(core_systems/fact_archive.py); memory follows the number of active students rather
+than the length of the run.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from core_systems.marks_ledger import MarksLedger
+from core_systems.progression_history import ProgressionHistory, StudentIndex, _student_ids, moved
+
+
+# Enrolled-frame columns that change from year to year; not stored as student columns
+CARRIED_COLUMNS = (
+    'status', 'status_change_at', 'academic_year',
+    'year_outcome', 'modules_passed', 'avg_mark', 'modules_total', 'programme_year_next',
+)
+
+# Statuses that continue into the next academic year
+CONTINUING_STATUSES = ('enrolled', 'repeating')
+
+# Columns of an enrollment record (ProgramEnrollmentSystem._ENROLLMENT_SCHEMA), in order
+ENROLLMENT_COLUMNS = (
+    'student_id', 'program_code', 'program_name', 'faculty', 'department', 'programme_year', 'status',
+    'year1_modules', 'year2_modules', 'year3_modules',
+    'num_year1_modules', 'num_year2_modules', 'num_year3_modules',
+    'clan_affinity', 'selection_probability',
+)
+
+
+def _moved(values: np.ndarray, rows: np.ndarray, n: int) -> np.ndarray:
+    """
+    values with row i moved to rows[i] of n rows (missing: NaN for floats, 0 for ints
+    and bools, None otherwise).
+    """
+    if values.dtype.kind == 'f':
+        return moved(values, rows, n, np.nan)
+    if values.dtype.kind in 'iub':
+        return moved(values, rows, n, 0)
+    return moved(values.astype(object), rows, n, None)
+
+
+class StudentStateTable:
+    """Per-student columns across years for the active students, indexed by integer student ID."""
+
+    __slots__ = ('student_columns', 'progression_columns', 'columns', 'outcomes', 'known',
+                 'history', 'marks', 'continuing', 'index')
+
+    def __init__(self):
+        self.index = StudentIndex()                # row of each student ID held
+        self.student_columns: List[str] = []       # column order of the enrolled frame
+        self.progression_columns: List[str] = []   # column order of the progression frame
+        self.columns: Dict[str, np.ndarray] = {}    # student columns
+        self.outcomes: Dict[str, np.ndarray] = {}   # latest progression outcome columns
+        self.known = np.zeros(0, dtype=bool)       # student columns written
+        self.history = ProgressionHistory()
+        self.marks = MarksLedger()
+        self.continuing = np.zeros(0, dtype=np.int64)  # IDs carried into the next year, in order
+
+    def __len__(self) -> int:
+        return int(self.known.sum())
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def _add(self, ids: np.ndarray) -> None:
+        """Rows for student IDs not yet held, in every column."""
+        rows = self.index.add(ids)
+        if rows is None:
+            return
+        n = len(self.index)
+        self.known = moved(self.known, rows, n, False)
+        for store in (self.columns, self.outcomes):
+            for name, values in store.items():
+                store[name] = _moved(values, rows, n)
+
+    def _write(self, store: Dict[str, np.ndarray], name: str, ids: np.ndarray, values) -> None:
+        """store[name][ids] = values, adding the column or widening its dtype as needed."""
+        values = np.asarray(values)
+        if name not in store:
+            store[name] = _moved(values[:0], np.zeros(0, dtype=np.int64), len(self.index))
+        column = store[name]
+        if column.dtype != values.dtype and not np.can_cast(values.dtype, column.dtype, 'same_kind'):
+            column = store[name] = column.astype(object)
+        column[ids] = values
+
+    def _rows(self, ids: np.ndarray) -> np.ndarray:
+        """Row indices of student IDs (IDs not held are an error: they have left)."""
+        rows = self.index.find(ids)
+        if rows.size and rows.min() < 0:
+            raise ValueError("student IDs not held: they have left and been dropped")
+        return rows
+
+    def _keep(self, ids: np.ndarray) -> None:
+        """Drop the rows (and history and marks) of every student not in ids."""
+        rows = self.index.keep(ids)
+        self.known = self.known[rows]
+        for store in (self.columns, self.outcomes):
+            for name, values in store.items():
+                store[name] = values[rows]
+        self.history.keep(ids)
+        self.marks.keep(ids)
+
+    # ------------------------------------------------------------------
+    # Year transitions
+    # ------------------------------------------------------------------
+
+    def advance(self, enrolled_df: pd.DataFrame, progression_df: Optional[pd.DataFrame]) -> None:
+        """
+        Record one academic year: student columns for students seen for the first time,
+        programme_year for everyone enrolled, and the year's progression outcomes.
+        """
+        # First occurrence of each column name; only the columns written are read
+        first = ~enrolled_df.columns.duplicated()
+        positions = dict(zip(enrolled_df.columns[first], np.flatnonzero(first)))
+        ids = _student_ids(enrolled_df.iloc[:, positions['student_id']])
+        self._add(ids)
+        rows = self._rows(ids)
+        if not self.student_columns:
+            self.student_columns = [c for c in positions if c not in CARRIED_COLUMNS]
+
+        new = np.flatnonzero(~self.known[rows])
+        if len(new):
+            for name in self.student_columns:
+                if name not in positions:
+                    continue
+                values = enrolled_df.iloc[:, positions[name]].to_numpy()[new]
+                if name == 'student_id':
+                    values = values.astype(str).astype(object)
+                self._write(self.columns, name, rows[new], values)
+            self.known[rows[new]] = True
+        if 'programme_year' in positions:
+            self._write(self.columns, 'programme_year', rows, enrolled_df.iloc[:, positions['programme_year']].to_numpy())
+
+        if progression_df is None or progression_df.empty:
+            self.continuing = np.zeros(0, dtype=np.int64)
+        else:
+            outcome_ids = _student_ids(progression_df['student_id'])
+            self._add(outcome_ids)
+            outcome_rows = self._rows(outcome_ids)
+            self.progression_columns = list(progression_df.columns)
+            for name in self.progression_columns:
+                if name != 'student_id':
+                    self._write(self.outcomes, name, outcome_rows, progression_df[name].to_numpy())
+            self.continuing = outcome_ids[progression_df['status'].isin(CONTINUING_STATUSES).to_numpy()]
+
+        # Everyone else has graduated or withdrawn
+        self._keep(self.continuing)
+
+    def continuing_students(self) -> Optional[pd.DataFrame]:
+        """
+        Students continuing into the next year (last outcome enrolled or repeating), in
+        progression order: their outcome columns, then their student columns. None if
+        nobody continues.
+        """
+        if len(self.continuing) == 0 or not self.progression_columns:
+            return None
+        rows = self._rows(self.continuing)
+        frame = {'student_id': self.columns['student_id'][rows]}
+        for name in self.progression_columns:
+            if name != 'student_id':
+                frame[name] = self.outcomes[name][rows]
+        for name in self.student_columns:
+            if name not in frame and name in self.columns:
+                frame[name] = self.columns[name][rows]
+        return pd.DataFrame(frame, copy=False)
+
+    def continuing_enrolled(self, academic_year: str = "", status_change_at: str = "") -> Optional[pd.DataFrame]:
+        """
+        Continuing students enrolled for the next academic year, gathered in one pass: the
+        frame ProgramEnrollmentSystem.enroll_continuing_students gives for
+        continuing_students() with programme_year advanced, with the same columns and
+        order. Module lists are the programme's, as stored when the student first
+        enrolled. None if nobody continues.
+        """
+        if len(self.continuing) == 0 or not self.progression_columns:
+            return None
+        rows = self._rows(self.continuing)
+        if 'programme_year_next' in self.outcomes:
+            next_year = self.outcomes['programme_year_next'][rows]
+            programme_year = np.where(pd.isna(next_year), 1, next_year).astype(np.int64)
+        elif 'programme_year' in self.columns:
+            current = self.columns['programme_year'][rows]
+            programme_year = np.where(pd.isna(current), 1, current).astype(np.int64)
+            programme_year += (self.outcomes['status'][rows].astype(str) == 'enrolled')
+        else:
+            programme_year = np.ones(len(rows), dtype=np.int64)
+        enrollment = {
+            'programme_year': programme_year,
+            'status': self.outcomes['status'][rows].astype(str).astype(object),
+        }
+
+        # continuing_students() columns, less the enrollment record's, then the record's
+        frame = {'student_id': self.columns['student_id'][rows]}
+        for name in self.progression_columns:
+            if name not in ENROLLMENT_COLUMNS:
+                frame[name] = self.outcomes[name][rows]
+        for name in self.student_columns:
+            if name not in frame and name not in ENROLLMENT_COLUMNS and name in self.columns:
+                frame[name] = self.columns[name][rows]
+        for name in ENROLLMENT_COLUMNS[1:]:
+            frame[name] = enrollment[name] if name in enrollment else self.columns[name][rows]
+        if academic_year:
+            frame['academic_year'] = np.full(len(rows), academic_year, dtype=object)
+        if status_change_at:
+            frame['status_change_at'] = np.full(len(rows), status_change_at, dtype=object)
+        return pd.DataFrame(frame, copy=False)
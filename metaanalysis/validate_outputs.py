@@ -8,17 +8,27 @@ Reads from data/relational/ and checks:
   4. Awarding gaps: species, clan, SES, gender
   5. Engagement–mark correlation
   6. Module difficulty–mark correlation
+  7. Aggregation cube: NSS means by year and faculty against fact_nss_responses
 
-Run from project root: py metaanalysis/validate_outputs.py
+metrics() returns the headline figures of the checks (rates, mark moments, gaps,
+correlations) as numbers; run_replicates.py summarises them across seeds.
+
+Run from project root: py metaanalysis/validate_outputs.py [data/relational]
 """
 
 import sys
 from pathlib import Path
+from typing import Dict
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 import pandas as pd
 import numpy as np
 
+from core_systems.aggregation_cube import AggregationCube
+from core_systems.assessment_storage import read_assessment_events
+from core_systems.build_relational_outputs import load_weekly_engagement
+from core_systems.nss_system import SCORED
+
 RELATIONAL = Path("data/relational")
 
 # Expected ranges for flagging
@@ -46,18 +56,122 @@ def section(title):
     print(f"{'='*60}")
 
 
-def load():
+def load(relational: Path = RELATIONAL):
     tables = {}
     for name in ["dim_students", "dim_modules", "dim_programmes", "dim_academic_years",
-                 "fact_enrollment", "fact_weekly_engagement", "fact_assessment", "fact_progression"]:
-        path = RELATIONAL / f"{name}.csv"
+                 "fact_enrollment", "fact_assessment", "fact_progression"]:
+        path = relational / f"{name}.csv"
         if not path.exists():
             print(f"MISSING: {path}")
             sys.exit(1)
-        tables[name] = pd.read_csv(path)
+        # fact_assessment may be in the wide layout; checks use one row per component
+        tables[name] = read_assessment_events(path) if name == "fact_assessment" else pd.read_csv(path)
+    tables["engagement_means"] = load_engagement_means(relational, tables["dim_academic_years"]["academic_year"])
     return tables
 
 
+def load_engagement_means(relational: Path, years) -> pd.DataFrame:
+    """
+    Mean engagement per student, year and module from the per-year weekly splits
+    (fact_weekly_engagement_YYYY-YY), read one year at a time. Empty if there are none.
+    Rows with a missing module_code keep it missing, for the completeness check.
+    """
+    means = []
+    for year in years:
+        eng = load_weekly_engagement(year, relational)
+        if eng.empty:
+            continue
+        means.append(
+            eng.groupby(["student_id", "academic_year", "module_code"], dropna=False)
+            [["attendance_rate", "participation_score", "academic_engagement"]]
+            .mean()
+            .mean(axis=1)
+            .reset_index(name="avg_engagement")
+        )
+    if not means:
+        return pd.DataFrame(columns=["student_id", "academic_year", "module_code", "avg_engagement"])
+    return pd.concat(means, ignore_index=True)
+
+
+# ---------------------------------------------------------------------------
+# Metrics shared by the report and the replicate summary
+
+def progression_records(t) -> pd.DataFrame:
+    """fact_progression with programme_year joined from enrollment."""
+    py = t["fact_enrollment"][["student_id", "academic_year", "programme_year"]].drop_duplicates()
+    return t["fact_progression"].merge(py, on=["student_id", "academic_year"], how="left")
+
+
+def marks_by_student(t) -> pd.DataFrame:
+    """fact_assessment with species, clan, SES rank and gender."""
+    students = t["dim_students"][["student_id", "species", "clan", "socio_economic_rank", "gender"]]
+    return t["fact_assessment"].merge(students, on="student_id", how="left")
+
+
+def elf_dwarf_gap(df: pd.DataFrame):
+    """Elf minus Dwarf mean mark (None without both)."""
+    sp = df.groupby("species")["assessment_mark"].mean()
+    if "Elf" in sp.index and "Dwarf" in sp.index:
+        return sp["Elf"] - sp["Dwarf"]
+    return None
+
+
+def ses_gap(df: pd.DataFrame):
+    """Highest minus lowest mean mark by SES rank (None with fewer than two ranks)."""
+    ses = df.groupby("socio_economic_rank")["assessment_mark"].mean()
+    return ses.max() - ses.min() if len(ses) >= 2 else None
+
+
+def engagement_mark_pairs(t) -> pd.DataFrame:
+    return t["fact_assessment"].merge(
+        t["engagement_means"], on=["student_id", "academic_year", "module_code"], how="inner",
+    )
+
+
+def difficulty_mark_pairs(t) -> pd.DataFrame:
+    mods = t["dim_modules"][["module_code", "difficulty_level"]].dropna()
+    return t["fact_assessment"].merge(mods, on="module_code", how="inner")
+
+
+def metrics(t) -> Dict[str, float]:
+    """
+    Headline figures of one run: progression rates (overall and by programme year),
+    mark mean and std, Elf–Dwarf and SES gaps, engagement and difficulty correlations
+    with marks. NaN where a figure cannot be computed.
+    """
+    prog = progression_records(t)
+    total = len(prog)
+    outcomes = prog["year_outcome"].value_counts()
+    statuses = prog["status"].value_counts()
+    out = {
+        "progression_pass_rate": outcomes.get("pass", 0) / total if total else np.nan,
+        "withdrawal_rate":       statuses.get("withdrawn", 0) / total if total else np.nan,
+        "repeat_rate":           statuses.get("repeating", 0) / total if total else np.nan,
+        "graduate_rate":         statuses.get("graduated", 0) / total if total else np.nan,
+    }
+    for yr in sorted(prog["programme_year"].dropna().unique()):
+        sub = prog[prog["programme_year"] == yr]
+        out[f"pass_rate_year_{int(yr)}"] = (sub["year_outcome"] == "pass").mean()
+
+    marks = t["fact_assessment"]["assessment_mark"].dropna()
+    out["overall_mean_mark"] = marks.mean()
+    out["overall_std_mark"] = marks.std()
+
+    df = marks_by_student(t)
+    gap = elf_dwarf_gap(df)
+    out["elf_dwarf_gap_pp"] = np.nan if gap is None else gap
+    gap = ses_gap(df)
+    out["ses_gap_pp"] = np.nan if gap is None else gap
+
+    merged = engagement_mark_pairs(t)
+    out["engagement_mark_corr"] = (merged["avg_engagement"].corr(merged["assessment_mark"])
+                                   if len(merged) > 100 else np.nan)
+    assess_d = difficulty_mark_pairs(t)
+    out["difficulty_mark_corr"] = (assess_d["difficulty_level"].corr(assess_d["assessment_mark"])
+                                   if len(assess_d) > 100 else np.nan)
+    return {k: float(v) for k, v in out.items()}
+
+
 # ---------------------------------------------------------------------------
 
 def check_shapes(t):
@@ -84,7 +198,8 @@ def check_shapes(t):
         ("fact_progression",       "year_outcome"),
     ]
     for tbl, col in checks:
-        n_null = t[tbl][col].isna().sum()
+        # weekly engagement is only loaded as per-module means
+        n_null = t["engagement_means" if tbl == "fact_weekly_engagement" else tbl][col].isna().sum()
         ok = "  OK " if n_null == 0 else " WARN"
         print(f"{ok}  {tbl}.{col}: {n_null} nulls")
 
@@ -93,12 +208,8 @@ def check_shapes(t):
 
 def check_progression(t):
     section("2. PROGRESSION RATES")
-    prog = t["fact_progression"]
-    enr  = t["fact_enrollment"]
-
-    # Join programme_year onto progression via enrollment
-    py = enr[["student_id", "academic_year", "programme_year"]].drop_duplicates()
-    prog = prog.merge(py, on=["student_id", "academic_year"], how="left")
+    # programme_year joined onto progression via enrollment
+    prog = progression_records(t)
 
     total = len(prog)
     print(f"  Total progression records: {total}")
@@ -172,9 +283,7 @@ def check_marks(t):
 
 def check_awarding_gaps(t):
     section("4. AWARDING GAPS")
-    assess  = t["fact_assessment"]
-    students = t["dim_students"][["student_id", "species", "clan", "socio_economic_rank", "gender"]]
-    df = assess.merge(students, on="student_id", how="left")
+    df = marks_by_student(t)
 
     # Species
     print("  Mean mark by species:")
@@ -182,10 +291,8 @@ def check_awarding_gaps(t):
     for species, row in sp.iterrows():
         print(f"    {species:<10}  {row['mean']:.1f}  (n={int(row['count'])})")
 
-    elf_mean   = sp.loc["Elf",   "mean"] if "Elf"   in sp.index else None
-    dwarf_mean = sp.loc["Dwarf", "mean"] if "Dwarf" in sp.index else None
-    if elf_mean and dwarf_mean:
-        gap = elf_mean - dwarf_mean
+    gap = elf_dwarf_gap(df)
+    if gap is not None:
         lo, hi = TARGETS["elf_dwarf_gap_pp"]
         print(f"\n{flag(gap, lo, hi, 'Elf–Dwarf gap (pp)')}")
 
@@ -195,10 +302,10 @@ def check_awarding_gaps(t):
     ses = df.groupby("socio_economic_rank")["assessment_mark"].mean().sort_index()
     for rank, mean in ses.items():
         print(f"    SES {int(rank)}: {mean:.1f}")
-    if len(ses) >= 2:
-        ses_gap = ses.max() - ses.min()
+    gap = ses_gap(df)
+    if gap is not None:
         lo, hi = TARGETS["ses_gap_pp"]
-        print(f"\n{flag(ses_gap, lo, hi, 'SES gap rank 8 vs rank 1 (pp)')}")
+        print(f"\n{flag(gap, lo, hi, 'SES gap rank 8 vs rank 1 (pp)')}")
 
     # Gender
     print()
@@ -224,17 +331,7 @@ def check_correlations(t):
     section("5. ENGAGEMENT AND DIFFICULTY CORRELATIONS")
 
     # Engagement -> mark
-    eng   = t["fact_weekly_engagement"]
-    assess = t["fact_assessment"]
-
-    eng_avg = (
-        eng.groupby(["student_id", "academic_year", "module_code"])
-        [["attendance_rate", "participation_score", "academic_engagement"]]
-        .mean()
-        .mean(axis=1)
-        .reset_index(name="avg_engagement")
-    )
-    merged = assess.merge(eng_avg, on=["student_id", "academic_year", "module_code"], how="inner")
+    merged = engagement_mark_pairs(t)
     if len(merged) > 100:
         corr = merged["avg_engagement"].corr(merged["assessment_mark"])
         lo, hi = TARGETS["engagement_mark_corr"]
@@ -245,8 +342,7 @@ def check_correlations(t):
 
     # Difficulty -> mark
     print()
-    mods = t["dim_modules"][["module_code", "difficulty_level"]].dropna()
-    assess_d = assess.merge(mods, on="module_code", how="inner")
+    assess_d = difficulty_mark_pairs(t)
     if len(assess_d) > 100:
         corr_d = assess_d["difficulty_level"].corr(assess_d["assessment_mark"])
         lo, hi = TARGETS["difficulty_mark_corr"]
@@ -256,18 +352,46 @@ def check_correlations(t):
         print("  WARN  Not enough matched difficulty–mark rows")
 
 
+def check_cube(t, relational: Path):
+    section("6. AGGREGATION CUBE")
+    cube_path = relational.parent / "stonegrove_aggregation_cube.csv"
+    nss_path = relational / "fact_nss_responses.csv"
+    if not cube_path.exists() or not nss_path.exists():
+        print("  SKIP  No aggregation cube or NSS responses")
+        return
+
+    # NSS means by academic year and faculty: fact_nss_responses joined to dim_programmes
+    nss = pd.read_csv(nss_path).merge(t["dim_programmes"][["programme_code", "faculty"]],
+                                      on="programme_code", how="left")
+    nss["faculty"] = nss["faculty"].fillna("unknown")
+    expected = nss.groupby(["academic_year", "faculty"])[SCORED].mean().stack()
+    expected.index.names = ["academic_year", "faculty", "measure"]
+
+    cube = (AggregationCube.read_csv(cube_path)
+            .summary("nss", SCORED, by=["academic_year", "faculty"])
+            .set_index(["academic_year", "faculty", "measure"])["mean"])
+    diff = (cube - expected).abs()
+    if diff.isna().any():
+        print(f"  WARN  Cube and responses disagree on (year, faculty, measure) groups: {int(diff.isna().sum())}")
+    else:
+        status = "  OK " if diff.max() < 1e-9 else " WARN"
+        print(f"{status}  NSS means by year and faculty, cube vs responses: "
+              f"max |difference| {diff.max():.2e} over {len(diff)} groups")
+
+
 # ---------------------------------------------------------------------------
 
-def main():
+def main(relational: Path = RELATIONAL):
     print("\nStonegrove University — Output Validation Report")
-    print(f"Reading from: {RELATIONAL.resolve()}")
+    print(f"Reading from: {relational.resolve()}")
 
-    t = load()
+    t = load(relational)
     check_shapes(t)
     check_progression(t)
     check_marks(t)
     check_awarding_gaps(t)
     check_correlations(t)
+    check_cube(t, relational)
 
     print(f"\n{'='*60}")
     print("  END OF REPORT")
@@ -275,4 +399,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(Path(sys.argv[1]) if len(sys.argv) > 1 else RELATIONAL)
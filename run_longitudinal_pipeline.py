@@ -2,10 +2,17 @@
 """
 Run the Stonegrove University longitudinal simulation (7 years, 5 graduating cohorts).
 
-Loops over academic years 1046-47 to 1052-53:
+Loops over academic years 1046-47 to 1052-53 (--years N for a longer horizon):
 - Year 1: New cohort (500) + progressing/repeating from previous year
 - Runs: student gen (new only) → enrollment → engagement → assessment → progression
-- Appends outputs per year to CSVs
+  → graduate outcomes → NSS, loading each stage from data/cache/ when its code, config
+  and inputs are unchanged since a previous run (--no-cache to execute everything)
+- Archives each year's outputs to data/archive/ as it goes; CSVs are assembled at the end
+- Checkpoints the carried state after each year (data/archive/checkpoint.pkl); --resume
+  continues an interrupted run from the last completed year
+- NSS and graduate outcomes update an aggregation cube (data/stonegrove_aggregation_cube.csv)
+- --shards N splits each year's students into N ID ranges for the per-student stages,
+  run in --workers processes; outputs depend on N but not on the number of workers
 
 Execute from project root.
 """
@@ -15,12 +22,62 @@ from pathlib import Path
 
 PROJECT_ROOT = Path(__file__).resolve().parent
 
+FIRST_ACADEMIC_YEAR = 1046
+
+
+def academic_years(n_years: int, first_year: int = FIRST_ACADEMIC_YEAR) -> list:
+    """n_years consecutive academic year labels from first_year: 1046-47, 1047-48, ..."""
+    return [f"{y}-{(y + 1) % 100:02d}" for y in range(first_year, first_year + n_years)]
+
+
 # Academic years: 7 years, 5 cohorts (first graduates year 3)
-ACADEMIC_YEARS_FULL = ["1046-47", "1047-48", "1048-49", "1049-50", "1050-51", "1051-52", "1052-53"]
+ACADEMIC_YEARS_FULL = academic_years(7)
 ACADEMIC_YEARS = ACADEMIC_YEARS_FULL
 COHORT_SIZE = 5000
 BASE_SEED = 42
 
+# Output directory: CSVs, metadata.json, relational/, archive/ and cache/ (run_replicates.py
+# points each replicate at its own)
+DATA_DIR = PROJECT_ROOT / "data"
+
+# Weekly engagement output: "csv" (fact_weekly_engagement_YYYY-YY.csv),
+# "quantized" (fact_weekly_engagement_YYYY-YY.npz, fixed-point metrics) and/or
+# "tensor" (fact_weekly_engagement_YYYY-YY.tensor/, memory-mapped per-student
+# array) — see core_systems/engagement_storage.py. ENGAGEMENT_QUANT_BITS is 8 or 16.
+ENGAGEMENT_FORMATS = ["csv"]
+ENGAGEMENT_QUANT_BITS = 8
+
+# Engagement fidelity: "weekly" (one row per student/module/week) or "summary"
+# (block means drawn analytically, no weekly rows; fact_weekly_engagement is not
+# written). Marks and NSS consume either — see EngagementSystem.generate_engagement_summary.
+ENGAGEMENT_FIDELITY = "weekly"
+
+# Engagement output grain: "module_week" (default), "student_week" (one row per
+# student per week -> fact_student_week_engagement_YYYY-YY.csv; module-week splits
+# are not generated or written) or "both".
+ENGAGEMENT_GRAIN = "module_week"
+
+# Engagement calendar: teaching weeks per semester and row resolution — "weekly",
+# "fortnightly" (half the rows) or "teaching_day" (5 per week). Noise and the
+# temporal arc are rescaled so semester means, and marks, keep their distribution. The
+# arc phases and the MIDTERM window (first two thirds) scale with SEMESTER_WEEKS.
+SEMESTER_WEEKS = 12
+ENGAGEMENT_RESOLUTION = "weekly"
+
+# Assessment output layout: "long" (one row per student/module/component, MIDTERM
+# and FINAL) or "wide" (one row per student/module with midterm_mark, final_mark,
+# combined_mark; dates and MIDTERM grades are derived on read). Applies to
+# stonegrove_assessment_events.csv and fact_assessment — see
+# core_systems/assessment_storage.py.
+ASSESSMENT_LAYOUT = "long"
+
+# Intra-year sharding: with SHARDS > 1 the per-student stages (engagement, assessment,
+# progression, graduate outcomes, NSS) run on SHARDS student ID ranges, each with its
+# own random stream, in WORKERS processes (None: one per CPU) — see core_systems/sharding.py.
+# Outputs depend on SHARDS (1, the default, runs each stage whole) but not on WORKERS.
+SHARDS = 1
+WORKERS = None
+
 
 def _status_change_at(academic_year: str) -> str:
     """Start of year when status takes effect. e.g. 1047-48 -> 1047-09-01"""
@@ -34,42 +91,507 @@ def _assessment_date(academic_year: str) -> str:
     return f"{first_year + 1}-05-15"
 
 
+# ---------------------------------------------------------------------------
+# Stages (core_systems/stage_cache.py). A year runs them in this order; each is
+# declared with the code and config files it reads, and its output is cached under
+# a hash of those, its seed and settings, and the output hashes of its inputs.
+# ---------------------------------------------------------------------------
+
+def _generate_cohort(cohort_size: int, seed: int, academic_year: str, year_index: int):
+    """New Year 1 cohort with student IDs, and the global RNG state after generating it."""
+    from core_systems.student_generation_pipeline import generate_students
+    from core_systems.stage_cache import capture_rng_state
+    students = generate_students(n=cohort_size, seed=seed)
+    students["academic_year"] = academic_year
+    students["student_id"] = range(year_index * cohort_size, (year_index + 1) * cohort_size)
+    return students, capture_rng_state()
+
+
+def _enroll_cohort(cohort, academic_year: str, status_change_at: str):
+    """The new cohort enrolled on programmes, drawing on from the cohort's RNG state; and the state after."""
+    from core_systems.program_enrollment_system import ProgramEnrollmentSystem
+    from core_systems.stage_cache import capture_rng_state, restore_rng_state
+    students, rng_state = cohort
+    restore_rng_state(rng_state)
+    enrolled = ProgramEnrollmentSystem().enroll_students_batch(
+        students.copy(), academic_year=academic_year, status_change_at=status_change_at,
+    )
+    return enrolled, capture_rng_state()
+
+
+def _engagement_files(academic_year: str, relational_dir: Path, settings: dict) -> list:
+    """Engagement files the engagement stage writes for a year under these settings."""
+    files = []
+    if settings["fidelity"] == "weekly" and settings["grain"] != "student_week":
+        suffixes = {"csv": ".csv", "quantized": ".npz", "tensor": ".tensor"}
+        files += [relational_dir / f"fact_weekly_engagement_{academic_year}{suffixes[f]}"
+                  for f in settings["formats"] if f in suffixes]
+    if settings["fidelity"] == "weekly" and settings["grain"] in ("student_week", "both"):
+        files.append(relational_dir / f"fact_student_week_engagement_{academic_year}.csv")
+    return files
+
+
+def _write_engagement_files(weekly_df, student_week_df, academic_year: str, settings: dict, relational_dir: Path,
+                            csv_parts=None):
+    """
+    Write the year's engagement files for these settings, removing those it does not
+    produce. csv_parts: the weekly CSV already written in pieces (sharded engagement),
+    joined in order instead of writing weekly_df.
+    """
+    import shutil
+    from core_systems.engagement_storage import EngagementTensor, QuantizedEngagement
+    from core_systems.sharding import join_csv_parts
+
+    if settings["fidelity"] == "weekly" and settings["grain"] != "student_week":
+        if "csv" in settings["formats"]:
+            path = relational_dir / f"fact_weekly_engagement_{academic_year}.csv"
+            if csv_parts is None:
+                weekly_df.to_csv(path, index=False)
+            else:
+                join_csv_parts(csv_parts, path)
+        if "quantized" in settings["formats"]:
+            QuantizedEngagement.from_frame(weekly_df, bits=settings["quant_bits"]).save(
+                relational_dir / f"fact_weekly_engagement_{academic_year}.npz"
+            )
+        if "tensor" in settings["formats"]:
+            EngagementTensor.write(weekly_df, relational_dir / f"fact_weekly_engagement_{academic_year}.tensor")
+    else:
+        # No weekly rows this run: drop stale splits so they are not mixed into relational outputs
+        for ext in ("csv", "npz"):
+            (relational_dir / f"fact_weekly_engagement_{academic_year}.{ext}").unlink(missing_ok=True)
+        shutil.rmtree(relational_dir / f"fact_weekly_engagement_{academic_year}.tensor", ignore_errors=True)
+    student_week_path = relational_dir / f"fact_student_week_engagement_{academic_year}.csv"
+    if student_week_df is not None:
+        student_week_df.to_csv(student_week_path, index=False)
+    else:
+        student_week_path.unlink(missing_ok=True)
+
+
+def _generate_engagement(enrolled_df, features, cohort_enrollment, academic_year: str, settings: dict,
+                         relational_dir: Path):
+    """
+    Engagement for the year's enrolled students, drawing on from the RNG state after
+    new-cohort enrollment. Writes the year's engagement files (settings["formats"]) and
+    returns the aggregates assessment and NSS read: (assessment_engagement, nss_engagement).
+    """
+    from core_systems.assessment_system import AssessmentSystem
+    from core_systems.engagement_system import EngagementSystem
+    from core_systems.nss_system import NSSSystem
+    from core_systems.stage_cache import restore_rng_state
+
+    restore_rng_state(cohort_enrollment[1])
+    engagement = EngagementSystem().generate_engagement_data(
+        enrolled_df, weeks_per_semester=settings["semester_weeks"], academic_year=academic_year,
+        fidelity=settings["fidelity"], grain=settings["grain"], resolution=settings["resolution"],
+        features=features() if settings["fidelity"] == "summary" else None,
+    )
+    weekly_df = engagement[0]
+    student_week_df = engagement[2] if len(engagement) > 2 else None
+    weekly_df["academic_year"] = academic_year
+    _write_engagement_files(weekly_df, student_week_df, academic_year, settings, relational_dir)
+
+    assessment_engagement = AssessmentSystem().engagement_means(
+        academic_year=academic_year, engagement_df=weekly_df, weeks_per_semester=settings["semester_weeks"],
+    )
+    nss_engagement = NSSSystem().aggregate_engagement(weekly_df, academic_year)
+    return assessment_engagement, nss_engagement
+
+
+def _assess(enrolled_df, features, engagement, academic_year: str, seed: int, marks_ledger):
+    """Assessment events for the year; records FINAL marks into marks_ledger."""
+    from core_systems.assessment_system import AssessmentSystem
+    # assessment_date no longer passed; dates computed internally per module/semester
+    return AssessmentSystem(seed=seed).generate_assessment_data(
+        enrolled_df,
+        academic_year=academic_year,
+        features=features(),
+        engagement_means=engagement[0],
+        marks_ledger=marks_ledger,
+    )
+
+
+def _progress(assessment_df, enrolled_df, features, academic_year: str, status_change_at: str, seed: int, history):
+    """Progression outcomes for the year; records them into history."""
+    from core_systems.progression_system import ProgressionSystem
+    return ProgressionSystem(seed=seed).compute_progression(
+        assessment_df,
+        enrolled_df,
+        academic_year=academic_year,
+        status_change_at=status_change_at,
+        features=features(),
+        history=history,
+    )
+
+
+def _graduate_outcomes(enrolled_df, progression_df, assessment_df, features, academic_year: str, seed: int,
+                       marks_ledger):
+    """Outcomes for the students who graduated this year, and their aggregation cube cells."""
+    import pandas as pd
+    from core_systems.aggregation_cube import AggregationCube
+    from core_systems.graduate_outcomes_system import GraduateOutcomesSystem
+
+    graduates = enrolled_df[
+        enrolled_df.get('status', pd.Series(dtype=str)).astype(str) == 'graduated'
+    ] if 'status' in enrolled_df.columns else pd.DataFrame()
+    if len(graduates) == 0:
+        # Also check progression_df for graduated students, merge back to get traits
+        grad_sids = progression_df[progression_df['status'] == 'graduated']['student_id'].astype(str).tolist()
+        graduates = enrolled_df[enrolled_df['student_id'].astype(str).isin(grad_sids)]
+    cube = AggregationCube()
+    outcomes_df = GraduateOutcomesSystem(seed=seed).generate_outcomes(
+        graduates, academic_year=academic_year, all_assessment_df=assessment_df,
+        features=features(), marks_ledger=marks_ledger, cube=cube,
+    )
+    return outcomes_df, cube.cells
+
+
+def _nss_responses(enrolled_df, assessment_df, engagement, features, academic_year: str, seed: int):
+    """NSS responses of all programme_year == 3 students (including repeating Yr3), and their cube cells."""
+    from core_systems.aggregation_cube import AggregationCube
+    from core_systems.nss_system import NSSSystem
+    cube = AggregationCube()
+    nss_df = NSSSystem(seed=seed).generate_responses(
+        enrolled_df,
+        academic_year=academic_year,
+        assessment_df=assessment_df,
+        features=features(),
+        engagement_agg=engagement[1],
+        cube=cube,
+    )
+    return nss_df, cube.cells
+
+
+# ---------------------------------------------------------------------------
+# Sharded stages (SHARDS > 1, core_systems/sharding.py). The year's enrolled students
+# are split into SHARDS student ID ranges; each shard runs the stage above on its own
+# students' rows, with its own random stream (shard_seed of the year seed), in one of
+# WORKERS forked processes. Outputs are merged in shard order, so they depend on SHARDS
+# but not on WORKERS. Marks and repeat history are recorded from the merged outputs by
+# run_year, as for stages loaded from the cache.
+# ---------------------------------------------------------------------------
+
+def _shard_features(enrolled_df):
+    """features() for a shard's students (built on first use)."""
+    from core_systems.student_features import StudentFeatures
+    built = []
+
+    def features():
+        if not built:
+            built.append(StudentFeatures(enrolled_df))
+        return built[0]
+    return features
+
+
+def _concat_frames(frames):
+    """Non-empty frames concatenated in order (the first frame if all are empty)."""
+    import pandas as pd
+    frames = list(frames)
+    full = [f for f in frames if f is not None and not f.empty]
+    if not full:
+        return frames[0] if frames else pd.DataFrame()
+    return full[0] if len(full) == 1 else pd.concat(full, ignore_index=True)
+
+
+def _merge_cells(cells):
+    """Aggregation cube cells of several shards, merged."""
+    from core_systems.aggregation_cube import AggregationCube
+    cube = AggregationCube()
+    for part in cells:
+        cube.merge(AggregationCube(part))
+    return cube.cells
+
+
+def _engagement_shard(shard, shards, enrolled_df, seed: int, academic_year: str, settings: dict, csv_dir):
+    """
+    One shard's engagement, drawn from the shard's stream. Writes its weekly CSV rows to
+    csv_dir/<shard>.csv (if given); returns (assessment_engagement, nss_engagement,
+    weekly rows if other weekly formats need them, student-week rows).
+    """
+    from core_systems.assessment_system import AssessmentSystem
+    from core_systems.engagement_system import EngagementSystem
+    from core_systems.nss_system import NSSSystem
+    from core_systems.sharding import seed_global_rng, shard_seed
+
+    seed_global_rng(shard_seed(seed, shard))
+    engagement = EngagementSystem().generate_engagement_data(
+        shards.take(enrolled_df, shard), weeks_per_semester=settings["semester_weeks"], academic_year=academic_year,
+        fidelity=settings["fidelity"], grain=settings["grain"], resolution=settings["resolution"],
+    )
+    weekly_df = engagement[0]
+    student_week_df = engagement[2] if len(engagement) > 2 else None
+    weekly_df["academic_year"] = academic_year
+    if csv_dir is not None:
+        weekly_df.to_csv(csv_dir / f"{shard:04d}.csv", index=False)
+    return (
+        AssessmentSystem().engagement_means(academic_year=academic_year, engagement_df=weekly_df,
+                                            weeks_per_semester=settings["semester_weeks"]),
+        NSSSystem().aggregate_engagement(weekly_df, academic_year),
+        weekly_df if {"quantized", "tensor"} & set(settings["formats"]) else None,
+        student_week_df,
+    )
+
+
+def _generate_engagement_sharded(enrolled_df, features, cohort_enrollment, academic_year: str, settings: dict,
+                                 relational_dir: Path, seed: int, n_shards: int, workers: int):
+    """_generate_engagement by shard: the same files and aggregates, drawn from per-shard streams."""
+    import shutil
+    import pandas as pd
+    from core_systems.sharding import Shards, map_shards
+
+    shards = Shards(enrolled_df["student_id"], n_shards)
+    csv_dir = None
+    if settings["fidelity"] == "weekly" and settings["grain"] != "student_week" and "csv" in settings["formats"]:
+        csv_dir = relational_dir / f".fact_weekly_engagement_{academic_year}.shards"
+        shutil.rmtree(csv_dir, ignore_errors=True)
+        csv_dir.mkdir(parents=True)
+    results = map_shards(_engagement_shard, shards.n, shards, enrolled_df, seed, academic_year, settings, csv_dir,
+                         workers=workers)
+
+    weekly = [r[2] for r in results if r[2] is not None]
+    student_weeks = [r[3] for r in results if r[3] is not None]
+    _write_engagement_files(
+        pd.concat(weekly, ignore_index=True) if weekly else None,
+        pd.concat(student_weeks, ignore_index=True) if student_weeks else None,
+        academic_year, settings, relational_dir,
+        csv_parts=sorted(csv_dir.glob("*.csv")) if csv_dir is not None else None,
+    )
+    if csv_dir is not None:
+        shutil.rmtree(csv_dir)
+
+    means = [r[0] for r in results if r[0][0] is not None]
+    assessment_engagement = ((pd.concat([m[0] for m in means]), pd.concat([m[1] for m in means]))
+                             if means else (None, None))
+    nss = [r[1] for r in results if not r[1].empty]
+    nss_engagement = pd.concat(nss, ignore_index=True) if nss else results[0][1]
+    return assessment_engagement, nss_engagement
+
+
+def _assessment_shard(shard, shards, enrolled_df, engagement, academic_year: str, seed: int):
+    from core_systems.sharding import shard_seed
+    enrolled = shards.take(enrolled_df, shard)
+    return _assess(enrolled, _shard_features(enrolled), engagement, academic_year, shard_seed(seed, shard), None)
+
+
+def _assess_sharded(enrolled_df, features, engagement, academic_year: str, seed: int, marks_ledger,
+                    n_shards: int, workers: int):
+    """_assess by shard (run_year records the merged marks into marks_ledger)."""
+    from core_systems.assessment_storage import concat_assessment
+    from core_systems.sharding import Shards, map_shards
+    shards = Shards(enrolled_df["student_id"], n_shards)
+    return concat_assessment(map_shards(
+        _assessment_shard, shards.n, shards, enrolled_df, engagement, academic_year, seed, workers=workers,
+    ))
+
+
+def _progression_shard(shard, shards, assessment_df, enrolled_df, academic_year: str, status_change_at: str,
+                       seed: int, history):
+    import copy
+    from core_systems.sharding import shard_seed
+    enrolled = shards.take(enrolled_df, shard)
+    # A copy to read prior repeats from: the shard's records are not kept (run_year records the merged outcomes)
+    return _progress(shards.take(assessment_df, shard), enrolled, _shard_features(enrolled), academic_year,
+                     status_change_at, shard_seed(seed, shard), copy.deepcopy(history))
+
+
+def _progress_sharded(assessment_df, enrolled_df, features, academic_year: str, status_change_at: str, seed: int,
+                      history, n_shards: int, workers: int):
+    """_progress by shard (run_year records the merged outcomes into history)."""
+    from core_systems.sharding import Shards, map_shards
+    shards = Shards(enrolled_df["student_id"], n_shards)
+    return _concat_frames(map_shards(
+        _progression_shard, shards.n, shards, assessment_df, enrolled_df, academic_year, status_change_at, seed,
+        history, workers=workers,
+    ))
+
+
+def _graduate_outcomes_shard(shard, shards, enrolled_df, progression_df, assessment_df, academic_year: str,
+                             seed: int, marks_ledger):
+    from core_systems.sharding import shard_seed
+    enrolled = shards.take(enrolled_df, shard)
+    return _graduate_outcomes(enrolled, shards.take(progression_df, shard), shards.take(assessment_df, shard),
+                              _shard_features(enrolled), academic_year, shard_seed(seed, shard), marks_ledger)
+
+
+def _graduate_outcomes_sharded(enrolled_df, progression_df, assessment_df, features, academic_year: str, seed: int,
+                               marks_ledger, n_shards: int, workers: int):
+    """_graduate_outcomes by shard."""
+    from core_systems.sharding import Shards, map_shards
+    shards = Shards(enrolled_df["student_id"], n_shards)
+    results = map_shards(
+        _graduate_outcomes_shard, shards.n, shards, enrolled_df, progression_df, assessment_df, academic_year,
+        seed, marks_ledger, workers=workers,
+    )
+    return _concat_frames(r[0] for r in results), _merge_cells(r[1] for r in results)
+
+
+def _nss_shard(shard, shards, enrolled_df, assessment_df, engagement, academic_year: str, seed: int):
+    from core_systems.sharding import shard_seed
+    enrolled = shards.take(enrolled_df, shard)
+    return _nss_responses(enrolled, shards.take(assessment_df, shard), engagement, _shard_features(enrolled),
+                          academic_year, shard_seed(seed, shard))
+
+
+def _nss_responses_sharded(enrolled_df, assessment_df, engagement, features, academic_year: str, seed: int,
+                           n_shards: int, workers: int):
+    """_nss_responses by shard."""
+    from core_systems.sharding import Shards, map_shards
+    shards = Shards(enrolled_df["student_id"], n_shards)
+    results = map_shards(
+        _nss_shard, shards.n, shards, enrolled_df, assessment_df, engagement, academic_year, seed, workers=workers,
+    )
+    return _concat_frames(r[0] for r in results), _merge_cells(r[1] for r in results)
+
+
+def _stages(sharded: bool = False) -> dict:
+    """
+    Stage declarations by name, in run order (paths relative to the project root).
+    sharded: the per-student stages in their sharded form.
+    """
+    from core_systems.stage_cache import Stage
+    features = ["core_systems/student_features.py"]
+    sharding = ["core_systems/sharding.py"] if sharded else []
+
+    def per_student(fn, by_shard, shard_fn, *calls):
+        """fn (or its sharded form) and the helpers whose source is part of the stage."""
+        if not sharded:
+            return {"fn": fn, "calls": calls}
+        return {"fn": by_shard, "calls": (fn, shard_fn, _shard_features, _concat_frames, _merge_cells) + calls}
+
+    return {stage.name: stage for stage in (
+        Stage("students", _generate_cohort,
+              code=["core_systems/student_generation_pipeline.py", "supporting_systems/name_generator.py",
+                    "supporting_systems/personality_refinement_system.py",
+                    "supporting_systems/motivation_profile_system.py"],
+              config=["config/clan_personality_specifications.yaml", "config/clan_socioeconomic_distributions.csv",
+                      "config/clan_name_pools.yaml", "config/personality_refinement_modifiers.yaml"]),
+        Stage("enrollment", _enroll_cohort,
+              code=["core_systems/program_enrollment_system.py", "supporting_systems/record_batch.py"],
+              config=["curriculum-and-lore/Stonegrove_University_Curriculum.xlsx",
+                      "config/clan_program_affinities.yaml", "config/programme_characteristics.csv",
+                      "config/trait_programme_mapping.csv"]),
+        Stage("engagement",
+              **per_student(_generate_engagement, _generate_engagement_sharded, _engagement_shard,
+                            _write_engagement_files),
+              code=["core_systems/engagement_system.py", "core_systems/engagement_storage.py",
+                    "core_systems/module_registry.py", "supporting_systems/record_batch.py",
+                    "core_systems/assessment_system.py", "core_systems/nss_system.py"] + features + sharding,
+              config=["config/engagement_modifiers.yaml", "config/programme_characteristics.csv",
+                      "config/module_characteristics.csv"]),
+        Stage("assessment", **per_student(_assess, _assess_sharded, _assessment_shard),
+              code=["core_systems/assessment_system.py", "core_systems/assessment_storage.py",
+                    "core_systems/module_registry.py", "core_systems/marks_ledger.py"] + features + sharding,
+              config=["config/assessment_modifiers.yaml", "config/disability_assessment_modifiers.csv",
+                      "config/module_characteristics.csv"]),
+        Stage("progression", **per_student(_progress, _progress_sharded, _progression_shard),
+              code=["core_systems/progression_system.py", "core_systems/progression_history.py",
+                    "core_systems/assessment_storage.py"] + features + sharding,
+              config=["config/year_progression_rules.yaml"]),
+        Stage("graduate_outcomes",
+              **per_student(_graduate_outcomes, _graduate_outcomes_sharded, _graduate_outcomes_shard),
+              code=["core_systems/graduate_outcomes_system.py", "core_systems/marks_ledger.py",
+                    "core_systems/assessment_storage.py", "core_systems/aggregation_cube.py"] + features + sharding,
+              config=["config/graduate_outcomes.yaml", "config/programme_characteristics.csv"]),
+        Stage("nss", **per_student(_nss_responses, _nss_responses_sharded, _nss_shard),
+              code=["core_systems/nss_system.py", "core_systems/assessment_storage.py",
+                    "core_systems/aggregation_cube.py"] + features + sharding,
+              config=["config/nss_modifiers.yaml", "config/programme_characteristics.csv"]),
+    )}
+
+
+STAGES = _stages()
+SHARDED_STAGES = _stages(sharded=True)
+PER_STUDENT_STAGES = ("engagement", "assessment", "progression", "graduate_outcomes", "nss")
+
+
 def run_year(
     academic_year: str,
     year_index: int,
-    new_students_df,
     continuing_students_df,
-    progression_outcomes_prev,
     seed: int,
-    prior_progression_df=None,
+    stage_cache=None,
+    progression_history=None,
+    marks_ledger=None,
+    lineage=None,
+    cube=None,
+    student_state=None,
 ):
-    """Run pipeline for one academic year. Returns (enrolled_df, progression_df)."""
+    """
+    Run the stages of one academic year (STAGES). Returns (new_students_df, enrolled_df,
+    assessment_df, progression_df, graduate_outcomes_df, nss_df); all but new_students_df
+    are None if nobody is enrolled.
+
+    stage_cache (core_systems/stage_cache.StageCache): stages whose version and inputs
+    match a cached run are loaded instead of executed. Without it every stage runs and
+    nothing is written to data/cache/.
+
+    progression_history (core_systems/progression_history.ProgressionHistory): repeat
+    history of prior years; progression records this year's outcomes into it.
+
+    marks_ledger (core_systems/marks_ledger.MarksLedger): FINAL marks by programme year
+    from prior years; assessment records this year's marks into it, and graduates'
+    degree classifications weight their Y2 and Y3 averages from it. Without it, only
+    this year's assessments are available to degree classification.
+
+    lineage: {"history": ..., "marks": ...} hashes of the history and ledger contents
+    (chained over the progression and assessment outputs recorded into them), for the
+    stages that read them; updated in place.
+
+    student_state (core_systems/student_state.StudentStateTable): the run's carried
+    state; when given, continuing students are gathered from it already enrolled
+    (continuing_enrolled) instead of enrolled from continuing_students_df.
+
+    cube (core_systems/aggregation_cube.AggregationCube): NSS and graduate outcomes add
+    this year's measures to it by programme and subgroup.
+    """
     import pandas as pd
     import os
     os.chdir(PROJECT_ROOT)
     sys.path.insert(0, str(PROJECT_ROOT))
     sys.path.insert(0, str(PROJECT_ROOT / "supporting_systems"))
 
-    from core_systems.student_generation_pipeline import generate_students
+    from core_systems.aggregation_cube import AggregationCube
     from core_systems.program_enrollment_system import ProgramEnrollmentSystem
-    from core_systems.engagement_system import EngagementSystem
-    from core_systems.assessment_system import AssessmentSystem
-    from core_systems.progression_system import ProgressionSystem
-    from core_systems.graduate_outcomes_system import GraduateOutcomesSystem
-    from core_systems.nss_system import NSSSystem
+    from core_systems.stage_cache import StageCache, chain, engagement_key, fingerprint
+    from core_systems.student_features import StudentFeatures
+
+    data_dir = DATA_DIR
+    if stage_cache is None:
+        stage_cache = StageCache(data_dir / "cache", PROJECT_ROOT, enabled=False)
+    if lineage is None:
+        lineage = {"history": "", "marks": ""}
+    status_change = _status_change_at(academic_year)
+    next_status_change = (_status_change_at(ACADEMIC_YEARS[year_index + 1])
+                          if year_index + 1 < len(ACADEMIC_YEARS) else "")
 
-    enrollment_sys = ProgramEnrollmentSystem()
-    engagement_sys = EngagementSystem()
-    assessment_sys = AssessmentSystem(seed=seed)
-    progression_sys = ProgressionSystem(seed=seed)
-    outcomes_sys = GraduateOutcomesSystem(seed=seed)
-    nss_sys = NSSSystem(seed=seed)
+    # Sharded per-student stages also take the shard count (part of their key) and worker count (not)
+    sharded = SHARDS > 1
+    stages = SHARDED_STAGES if sharded else STAGES
 
-    status_change = _status_change_at(academic_year)
-    assessment_date = _assessment_date(academic_year)
+    def stage_inputs(name, inputs):
+        return dict(inputs, shards=SHARDS) if sharded and name in PER_STUDENT_STAGES else inputs
+
+    def stage(name, inputs, *args, force=False):
+        if sharded and name in PER_STUDENT_STAGES:
+            args += (SHARDS, WORKERS or os.cpu_count() or 1)
+        return stage_cache.run(stages[name], academic_year, stage_inputs(name, inputs), *args, force=force)
+
+    # 1. New cohort (Year 1) and its programme enrollment
+    cohort, cohort_hash, _ = stage(
+        "students", {"cohort_size": COHORT_SIZE, "seed": seed, "academic_year": academic_year, "year_index": year_index},
+        COHORT_SIZE, seed, academic_year, year_index,
+    )
+    new_students_df = cohort[0]
+    cohort_enrollment, cohort_enrollment_hash, _ = stage(
+        "enrollment", {"students": cohort_hash, "academic_year": academic_year, "status_change_at": status_change},
+        cohort, academic_year, status_change,
+    )
 
-    # 1. Combine new + continuing students
-    if continuing_students_df is not None and len(continuing_students_df) > 0:
+    # Continuing students (no random draws) + new cohort
+    if student_state is not None:
+        continuing_enrolled = student_state.continuing_enrolled(academic_year, status_change)
+        if continuing_enrolled is None:
+            continuing_enrolled = pd.DataFrame()
+    elif continuing_students_df is not None and len(continuing_students_df) > 0:
         cont = continuing_students_df.copy()
         if "programme_year_next" in cont.columns:
             cont["programme_year"] = cont["programme_year_next"].fillna(1).astype(int)
@@ -79,28 +601,16 @@ def run_year(
             cont["programme_year"] = prog + is_progress.astype(int)
         else:
             cont["programme_year"] = 1
-        continuing_enrolled = enrollment_sys.enroll_continuing_students(
+        continuing_enrolled = ProgramEnrollmentSystem().enroll_continuing_students(
             cont, academic_year=academic_year, status_change_at=status_change,
         )
     else:
         continuing_enrolled = pd.DataFrame()
-
-    if new_students_df is not None and len(new_students_df) > 0:
-        # Assign student_ids for new cohort (offset by year)
-        new_students_df = new_students_df.copy()
-        offset = year_index * COHORT_SIZE
-        new_students_df["student_id"] = range(offset, offset + len(new_students_df))
-        new_enrolled = enrollment_sys.enroll_students_batch(
-            new_students_df,
-            academic_year=academic_year,
-            status_change_at=status_change,
-        )
-    else:
-        new_enrolled = pd.DataFrame()
+    new_enrolled = cohort_enrollment[0]
 
     # Combine (drop duplicate columns before concat)
     def _dedup_cols(df):
-        return df.loc[:, ~df.columns.duplicated()] if len(df) > 0 else df
+        return df.loc[:, ~df.columns.duplicated()] if len(df) > 0 and df.columns.has_duplicates else df
     if len(continuing_enrolled) > 0 and len(new_enrolled) > 0:
         enrolled_df = pd.concat([_dedup_cols(new_enrolled), _dedup_cols(continuing_enrolled)], ignore_index=True)
     elif len(continuing_enrolled) > 0:
@@ -108,183 +618,238 @@ def run_year(
     elif len(new_enrolled) > 0:
         enrolled_df = new_enrolled
     else:
-        return None, None, None, None, None, None, None
-
-    # 2. Engagement (deduplicate columns before passing downstream)
-    enrolled_clean = enrolled_df.loc[:, ~enrolled_df.columns.duplicated()] if len(enrolled_df) > 0 else enrolled_df
-    weekly_df, semester_df = engagement_sys.generate_engagement_data(
-        enrolled_clean, weeks_per_semester=12, academic_year=academic_year
+        return new_students_df, None, None, None, None, None
+
+    # Deduplicate columns before passing downstream
+    enrolled_clean = _dedup_cols(enrolled_df)
+    enrolled_hash = fingerprint(enrolled_clean)
+
+    # Student traits, categorical codes and modifier columns: prepared once (when a stage
+    # runs), shared by engagement (summary fidelity), assessment, progression, graduate
+    # outcomes and NSS
+    built = []
+
+    def features():
+        if not built:
+            built.append(StudentFeatures(enrolled_clean))
+        return built[0]
+
+    # 2. Engagement — re-executed if this year's engagement files were last written for other inputs
+    settings = {
+        "fidelity": ENGAGEMENT_FIDELITY, "grain": ENGAGEMENT_GRAIN,
+        "resolution": ENGAGEMENT_RESOLUTION, "semester_weeks": SEMESTER_WEEKS,
+    }
+    file_settings = dict(settings, formats=list(ENGAGEMENT_FORMATS), quant_bits=ENGAGEMENT_QUANT_BITS)
+    relational_dir = data_dir / "relational"
+    engagement_inputs = {
+        "enrolled": engagement_key(enrolled_clean, settings), "enrollment": cohort_enrollment_hash,
+        "academic_year": academic_year, "files": file_settings,
+    }
+    engagement_args = (enrolled_clean, features, cohort_enrollment, academic_year, file_settings, relational_dir)
+    if sharded:
+        # Shards draw from streams of the year seed rather than the stream after enrollment
+        engagement_inputs["seed"] = seed
+        engagement_args += (seed,)
+    marker = stage_cache.directory / "engagement" / f"{academic_year}.written"
+    key = stage_cache.key(stages["engagement"], stage_inputs("engagement", engagement_inputs))
+    files_current = (marker.exists() and marker.read_text() == key
+                     and all(path.exists() for path in _engagement_files(academic_year, relational_dir, file_settings)))
+    engagement, engagement_hash, engagement_cached = stage(
+        "engagement", engagement_inputs, *engagement_args, force=not files_current,
     )
-    weekly_df["academic_year"] = academic_year
-
-    # 3. Assessment — pass engagement DataFrame directly (no mid-loop disk write)
-    # assessment_date no longer passed; dates computed internally per module/semester
-    assessment_df = assessment_sys.generate_assessment_data(
-        enrolled_clean,
-        academic_year=academic_year,
-        weekly_engagement_df=weekly_df,
+    if stage_cache.enabled and not engagement_cached:
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.write_text(key)
+
+    # 3. Assessment
+    assessment_df, assessment_hash, cached = stage(
+        "assessment", {"enrolled": enrolled_hash, "engagement": engagement_hash,
+                       "academic_year": academic_year, "seed": seed},
+        enrolled_clean, features, engagement, academic_year, seed, marks_ledger,
     )
-
-    # 4. Progression (enrolled_clean already built above)
-    progression_df = progression_sys.compute_progression(
-        assessment_df,
-        enrolled_clean,
-        academic_year=academic_year,
-        status_change_at=_status_change_at(ACADEMIC_YEARS[year_index + 1]) if year_index + 1 < len(ACADEMIC_YEARS) else "",
-        prior_progression_df=prior_progression_df,
+    if (cached or sharded) and marks_ledger is not None:
+        marks_ledger.record_frame(assessment_df)
+    lineage["marks"] = chain(lineage["marks"], assessment_hash)
+
+    # 4. Progression
+    progression_df, progression_hash, cached = stage(
+        "progression", {"assessment": assessment_hash, "enrolled": enrolled_hash, "history": lineage["history"],
+                        "academic_year": academic_year, "status_change_at": next_status_change, "seed": seed},
+        assessment_df, enrolled_clean, features, academic_year, next_status_change, seed, progression_history,
     )
+    if (cached or sharded) and progression_history is not None:
+        progression_history.record(progression_df["student_id"], academic_year, progression_df["status"])
+    lineage["history"] = chain(lineage["history"], progression_hash)
 
     # 5. Graduate outcomes — for students who graduated this year
-    graduates = enrolled_clean[
-        enrolled_clean.get('status', pd.Series(dtype=str)).astype(str) == 'graduated'
-    ] if 'status' in enrolled_clean.columns else pd.DataFrame()
-    if len(graduates) == 0:
-        # Also check progression_df for graduated students, merge back to get traits
-        grad_sids = progression_df[progression_df['status'] == 'graduated']['student_id'].astype(str).tolist()
-        graduates = enrolled_clean[enrolled_clean['student_id'].astype(str).isin(grad_sids)]
-    graduate_outcomes_df = outcomes_sys.generate_outcomes(
-        graduates, academic_year=academic_year, all_assessment_df=assessment_df
+    (graduate_outcomes_df, outcome_cells), _, _ = stage(
+        "graduate_outcomes", {"enrolled": enrolled_hash, "progression": progression_hash,
+                              "assessment": assessment_hash, "marks": lineage["marks"],
+                              "academic_year": academic_year, "seed": seed},
+        enrolled_clean, progression_df, assessment_df, features, academic_year, seed, marks_ledger,
     )
 
     # 6. NSS responses — all programme_year == 3 students (including repeating Yr3)
-    nss_df = nss_sys.generate_responses(
-        enrolled_clean,
-        academic_year=academic_year,
-        weekly_engagement_df=weekly_df,
-        assessment_df=assessment_df,
+    (nss_df, nss_cells), _, _ = stage(
+        "nss", {"enrolled": enrolled_hash, "assessment": assessment_hash, "engagement": engagement_hash,
+                "academic_year": academic_year, "seed": seed},
+        enrolled_clean, assessment_df, engagement, features, academic_year, seed,
     )
 
-    return enrolled_df, progression_df, assessment_df, weekly_df, semester_df, graduate_outcomes_df, nss_df
+    if cube is not None:
+        cube.merge(AggregationCube(outcome_cells)).merge(AggregationCube(nss_cells))
+    return new_students_df, enrolled_df, assessment_df, progression_df, graduate_outcomes_df, nss_df
 
 
-def main():
-    import pandas as pd
+def main(use_cache: bool = True, resume: bool = False, prune_cache: bool = False):
+    """
+    Run all academic years and write DATA_DIR (data/) and its relational/.
+
+    Every stage output is cached under data/cache/ (core_systems/stage_cache.py), keyed
+    by the stage's code and config, its seed and settings, and the hashes of its inputs.
+    With use_cache, a stage whose key is unchanged is loaded rather than executed, so
+    after editing one config file only the stages that read it (and those whose inputs
+    it changes) run. Outputs match a run without the cache. use_cache=False executes
+    every stage and refreshes the cache. prune_cache deletes the entries this run did
+    not use (the cache is otherwise never cleaned).
+
+    After each academic year the run's carried state is checkpointed to
+    data/archive/checkpoint.pkl (core_systems/checkpoint.py). With resume, a run picks
+    up after the last completed year of an interrupted run with the same settings and
+    writes the same outputs as one that was not interrupted.
+    """
     import os
     os.chdir(PROJECT_ROOT)
     sys.path.insert(0, str(PROJECT_ROOT))
     sys.path.insert(0, str(PROJECT_ROOT / "supporting_systems"))
 
-    from core_systems.student_generation_pipeline import generate_students
-    from core_systems.program_enrollment_system import ProgramEnrollmentSystem
-    from core_systems.engagement_system import EngagementSystem
-    from core_systems.assessment_system import AssessmentSystem
-    from core_systems.progression_system import ProgressionSystem
-    from core_systems.graduate_outcomes_system import GraduateOutcomesSystem
-    from core_systems.nss_system import NSSSystem
+    from core_systems.assessment_storage import encode_assessment, to_layout
+    from core_systems.stage_cache import StageCache, capture_rng_state, restore_rng_state
+    from core_systems.checkpoint import RunCheckpoint
+    from core_systems.student_state import StudentStateTable
+    from core_systems.fact_archive import FactArchive
+    from core_systems.aggregation_cube import AggregationCube
 
     print("Stonegrove University Longitudinal Pipeline")
     print("=" * 50)
     print(f"Academic years: {ACADEMIC_YEARS[0]} to {ACADEMIC_YEARS[-1]}")
     print(f"Cohort size: {COHORT_SIZE}")
+    if not use_cache:
+        print("Stage cache: off (every stage runs; data/cache/ refreshed)")
+    if SHARDS > 1:
+        print(f"Shards: {SHARDS} per year, {WORKERS or os.cpu_count() or 1} worker processes")
     print()
 
-    data_dir = PROJECT_ROOT / "data"
-    data_dir.mkdir(exist_ok=True)
+    data_dir = DATA_DIR
+    data_dir.mkdir(parents=True, exist_ok=True)
     relational_dir = data_dir / "relational"
     relational_dir.mkdir(exist_ok=True)
+    stage_cache = StageCache(data_dir / "cache", PROJECT_ROOT, refresh=not use_cache)
 
-    all_enrollment = []
-    all_assessment = []
-    all_progression = []
-    all_individual = []
-    all_weekly = []
-    all_graduate_outcomes = []
-    all_nss = []
-
-    progression_prev = None
-    prev_enrolled_df = None
-    accumulated_progression = None  # all prior years' progression (for repeat history)
+    # Everything a year's results depend on; a checkpoint only resumes a run with the same
+    checkpoint_path = data_dir / "archive" / "checkpoint.pkl"
+    run_settings = {
+        "cohort_size": COHORT_SIZE,
+        "base_seed": BASE_SEED,
+        "academic_years": list(ACADEMIC_YEARS),
+        "engagement": {
+            "formats": list(ENGAGEMENT_FORMATS), "quant_bits": ENGAGEMENT_QUANT_BITS,
+            "fidelity": ENGAGEMENT_FIDELITY, "grain": ENGAGEMENT_GRAIN,
+            "resolution": ENGAGEMENT_RESOLUTION, "semester_weeks": SEMESTER_WEEKS,
+        },
+        "shards": SHARDS,
+        "stages": {name: stage.version(PROJECT_ROOT)
+                   for name, stage in (SHARDED_STAGES if SHARDS > 1 else STAGES).items()},
+    }
+    checkpoint = RunCheckpoint.load(checkpoint_path, run_settings) if resume else None
+
+    if checkpoint is not None:
+        archive, cube = checkpoint.archive, checkpoint.cube
+        student_state, lineage = checkpoint.student_state, checkpoint.lineage
+        stage_cache.manifest = checkpoint.manifest
+        restore_rng_state(checkpoint.rng_state)
+        completed = checkpoint.completed
+        print(f"Resuming after {ACADEMIC_YEARS[completed - 1]} ({completed} of {len(ACADEMIC_YEARS)} years done)")
+    else:
+        if resume:
+            print("No checkpoint to resume from; starting from the first year")
+        # Each year's facts go to disk as they are produced (cold tier); nothing accumulates
+        archive = FactArchive(data_dir / "archive")
+        # NSS and graduate outcome measures by year, programme and subgroup, built as they are generated
+        cube = AggregationCube()
+
+        # Hot tier: student columns, latest outcomes, repeat history and marks of students still
+        # enrolled or repeating (graduates and withdrawals are evicted each year)
+        student_state = StudentStateTable()
+        lineage = {"history": "", "marks": ""}
+        completed = 0
 
     for i, acad_year in enumerate(ACADEMIC_YEARS):
+        if i < completed:
+            continue
         print(f"\n--- {acad_year} ---")
 
         seed = BASE_SEED + i * 1000
 
-        # New cohort (Year 1 only) every year
-        new_students = generate_students(n=COHORT_SIZE, seed=seed)
-        new_students["academic_year"] = acad_year
-        new_students["student_id"] = range(i * COHORT_SIZE, (i + 1) * COHORT_SIZE)
-        all_individual.append(new_students)
-
-        # Continuing students from previous progression (enrolled + repeating, not withdrawn)
-        if progression_prev is not None and len(progression_prev) > 0 and prev_enrolled_df is not None:
-            active = progression_prev[
-                progression_prev["status"].isin(["enrolled", "repeating"])
-            ].copy()
-            if len(active) > 0:
-                prev = prev_enrolled_df.loc[:, ~prev_enrolled_df.columns.duplicated()].copy()
-                prev["student_id"] = prev["student_id"].astype(str)
-                drop_from_prev = [
-                    "status", "status_change_at", "academic_year",
-                    "year_outcome", "modules_passed", "avg_mark", "modules_total", "programme_year_next",
-                ]
-                prev = prev.drop(columns=[c for c in drop_from_prev if c in prev.columns], errors="ignore")
-                active = active.copy()
-                active["student_id"] = active["student_id"].astype(str)
-                active = active.merge(prev, on="student_id", how="left")
-                continuing_students = active
-            else:
-                continuing_students = None
-        else:
-            continuing_students = None
-
-        # Run pipeline for this year
-        enrolled_df, progression_df, assessment_df, weekly_df, semester_df, graduate_outcomes_df, nss_df = run_year(
-            acad_year, i, new_students, continuing_students, progression_prev, seed,
-            prior_progression_df=accumulated_progression,
+        # Run pipeline for this year; continuing students (enrolled + repeating, not
+        # withdrawn) come from the state table
+        (new_students, enrolled_df, assessment_df, progression_df,
+         graduate_outcomes_df, nss_df) = run_year(
+            acad_year, i, None, seed, stage_cache=stage_cache,
+            progression_history=student_state.history, marks_ledger=student_state.marks,
+            lineage=lineage, cube=cube, student_state=student_state,
         )
+        archive.append("individual", new_students)
+        stages = stage_cache.manifest.get(acad_year, {})
+        loaded = [name for name, entry in stages.items() if entry["cached"]]
+        if loaded:
+            print(f"  Loaded from cache: {', '.join(loaded)}")
 
         if enrolled_df is None:
             print(f"  No students for {acad_year}, skipping.")
-            continue
-
-        all_enrollment.append(enrolled_df.loc[:, ~enrolled_df.columns.duplicated()])
-        all_assessment.append(assessment_df)
-        all_progression.append(progression_df)
-        all_weekly.append(weekly_df)
-        weekly_df.to_csv(relational_dir / f"fact_weekly_engagement_{acad_year}.csv", index=False)
-        if graduate_outcomes_df is not None and len(graduate_outcomes_df) > 0:
-            all_graduate_outcomes.append(graduate_outcomes_df)
-        if nss_df is not None and len(nss_df) > 0:
-            all_nss.append(nss_df)
-        progression_prev = progression_df
-        prev_enrolled_df = enrolled_df
-        # Accumulate all progression outcomes for repeat-history lookup in subsequent years
-        accumulated_progression = pd.concat(all_progression, ignore_index=True)
-
-        n_grads = len(graduate_outcomes_df) if graduate_outcomes_df is not None else 0
-        n_nss = len(nss_df) if nss_df is not None else 0
-        print(f"  Enrolled: {len(enrolled_df)}, Assessments: {len(assessment_df)}, Graduates: {n_grads}, NSS: {n_nss}")
-
-    # Concatenate and save — all files overwritten fresh each run
-    if all_enrollment:
-        clean = [e.loc[:, ~e.columns.duplicated()] for e in all_enrollment]
-        pd.concat(clean, ignore_index=True).to_csv(
-            data_dir / "stonegrove_enrollment.csv", index=False
-        )
+        else:
+            archive.append("enrollment", enrolled_df)
+            archive.append("assessment", assessment_df)
+            archive.append("progression", progression_df)
+            archive.append("graduate_outcomes", graduate_outcomes_df)
+            archive.append("nss", nss_df)
+            student_state.advance(enrolled_df, progression_df)
+
+            n_grads = len(graduate_outcomes_df) if graduate_outcomes_df is not None else 0
+            n_nss = len(nss_df) if nss_df is not None else 0
+            print(f"  Enrolled: {len(enrolled_df)}, Assessments: {len(assessment_df)}, Graduates: {n_grads}, NSS: {n_nss}")
+
+        RunCheckpoint(
+            run_settings, i + 1, student_state, lineage, archive, cube,
+            stage_cache.manifest, capture_rng_state(),
+        ).save(checkpoint_path)
+
+    print(f"\nStage cache: {stage_cache.summary()}")
+    if prune_cache:
+        print(f"Stage cache: pruned {stage_cache.prune()} unused entries")
+
+    # Assemble CSVs from the archive, one year at a time — all files overwritten fresh each run
+    if "enrollment" in archive:
+        archive.write_csv("enrollment", data_dir / "stonegrove_enrollment.csv")
         print(f"\nSaved stonegrove_enrollment.csv")
-    if all_assessment:
-        pd.concat(all_assessment, ignore_index=True).to_csv(
-            data_dir / "stonegrove_assessment_events.csv", index=False
-        )
-    if all_progression:
-        pd.concat(all_progression, ignore_index=True).to_csv(
-            data_dir / "stonegrove_progression_outcomes.csv", index=False
-        )
-    if all_individual:
-        pd.concat(all_individual, ignore_index=True).to_csv(
-            data_dir / "stonegrove_individual_students.csv", index=False
-        )
-    if all_graduate_outcomes:
-        pd.concat(all_graduate_outcomes, ignore_index=True).to_csv(
-            data_dir / "stonegrove_graduate_outcomes.csv", index=False
+    if "assessment" in archive:
+        archive.write_csv(
+            "assessment", data_dir / "stonegrove_assessment_events.csv",
+            transform=lambda part: to_layout(encode_assessment(part), ASSESSMENT_LAYOUT),
         )
+    if "progression" in archive:
+        archive.write_csv("progression", data_dir / "stonegrove_progression_outcomes.csv")
+    if "individual" in archive:
+        archive.write_csv("individual", data_dir / "stonegrove_individual_students.csv")
+    if "graduate_outcomes" in archive:
+        archive.write_csv("graduate_outcomes", data_dir / "stonegrove_graduate_outcomes.csv")
         print(f"Saved stonegrove_graduate_outcomes.csv")
-    if all_nss:
-        pd.concat(all_nss, ignore_index=True).to_csv(
-            data_dir / "stonegrove_nss_responses.csv", index=False
-        )
+    if "nss" in archive:
+        archive.write_csv("nss", data_dir / "stonegrove_nss_responses.csv")
         print(f"Saved stonegrove_nss_responses.csv")
+    if len(cube):
+        cube.write_csv(data_dir / "stonegrove_aggregation_cube.csv")
+        print(f"Saved stonegrove_aggregation_cube.csv")
 
     # Write metadata
     import subprocess
@@ -305,18 +870,70 @@ def main():
         "academic_years": ACADEMIC_YEARS,
         "cohorts_total": len(ACADEMIC_YEARS),
         "cohorts_graduating": max(0, len(ACADEMIC_YEARS) - 2),
+        "shards": SHARDS,
+        "stage_cache": stage_cache.manifest,
     }
     with open(data_dir / "metadata.json", "w") as f:
         json.dump(metadata, f, indent=2)
-    print(f"\nSaved data/metadata.json")
+    print(f"\nSaved {data_dir.name}/metadata.json")
 
     # Build relational schema outputs
     print("\nBuilding relational schema...")
     from core_systems import build_relational_outputs
-    build_relational_outputs.main()
+    build_relational_outputs.main(data_dir)
 
     print("\nPipeline complete.")
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Stonegrove University longitudinal pipeline")
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="execute every stage instead of loading unchanged ones from data/cache/ (the cache is refreshed)",
+    )
+    parser.add_argument(
+        "--prune-cache", action="store_true",
+        help="after the run, delete data/cache/ entries it did not use (old code, config, seeds or inputs)",
+    )
+    parser.add_argument(
+        "--years", type=int, default=None,
+        help=f"simulate this many academic years from {FIRST_ACADEMIC_YEAR}-{(FIRST_ACADEMIC_YEAR + 1) % 100:02d} "
+             f"(default {len(ACADEMIC_YEARS_FULL)}); per-year cost stays flat over long horizons",
+    )
+    parser.add_argument("--seed", type=int, default=None, help=f"base seed (default {BASE_SEED})")
+    parser.add_argument(
+        "--data-dir", type=Path, default=None,
+        help="write outputs here instead of data/ (relative paths are from the project root)",
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="continue an interrupted run after its last completed year (data/archive/checkpoint.pkl)",
+    )
+    parser.add_argument(
+        "--shards", type=int, default=None,
+        help="split each year's students into this many shards for the per-student stages "
+             "(default 1: unsharded; outputs depend on the shard count)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="processes running the shards (default: one per CPU; outputs do not depend on it)",
+    )
+    args = parser.parse_args()
+    if args.shards is not None:
+        if args.shards < 1:
+            parser.error("--shards must be at least 1")
+        SHARDS = args.shards
+    if args.workers is not None:
+        if args.workers < 1:
+            parser.error("--workers must be at least 1")
+        WORKERS = args.workers
+    if args.years is not None:
+        if args.years < 1:
+            parser.error("--years must be at least 1")
+        ACADEMIC_YEARS = academic_years(args.years)
+    if args.seed is not None:
+        BASE_SEED = args.seed
+    if args.data_dir is not None:
+        DATA_DIR = PROJECT_ROOT / args.data_dir
+    main(use_cache=not args.no_cache, resume=args.resume, prune_cache=args.prune_cache)
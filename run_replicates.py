@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Run the Stonegrove University longitudinal simulation for several seeds in parallel
+and summarise the validation metrics across them (Monte Carlo uncertainty on
+progression rates, mark distributions and awarding gaps).
+
+- Replicate r uses base seed --seed + r * SEED_STRIDE (replicate 0 is the default run)
+- Replicates run in a process pool (--jobs, default one per CPU). The parent imports
+  the pipeline and loads the module registry before the pool starts; where processes
+  are forked, workers share them instead of loading their own
+- Each replicate writes a full run (CSVs, relational/, archive/, cache/) to its own
+  partition, data/replicates/seed_<seed>/, with the pipeline's output in pipeline.log
+- Each worker computes metaanalysis/validate_outputs.metrics() on its partition; the
+  runner writes them to data/replicates/metrics.csv (one row per seed) and their mean,
+  std and 5/25/50/75/95th percentiles to data/replicates/summary.csv
+
+Execute from project root:
+    python run_replicates.py --replicates 32
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / "supporting_systems"))
+
+import run_longitudinal_pipeline as pipeline
+from metaanalysis import validate_outputs
+
+# Year seeds are base seed + year_index * 1000, so replicates this far apart never share one
+SEED_STRIDE = 1_000_000
+PERCENTILES = (5, 25, 50, 75, 95)
+REPLICATES_DIR = pipeline.DATA_DIR / "replicates"
+
+
+def replicate_seeds(n_replicates: int, first_seed: int = pipeline.BASE_SEED) -> list:
+    return [first_seed + r * SEED_STRIDE for r in range(n_replicates)]
+
+
+def _preload() -> None:
+    """Import the stages' modules and load the module registry (inherited by forked workers)."""
+    os.chdir(PROJECT_ROOT)
+    from core_systems import (  # noqa: F401
+        assessment_system, build_relational_outputs, engagement_system, graduate_outcomes_system,
+        nss_system, program_enrollment_system, progression_system, student_generation_pipeline,
+    )
+    from core_systems.module_registry import load_module_registry
+    load_module_registry()
+
+
+def run_replicate(seed: int, data_dir: Path, cohort_size: int, years: list, use_cache: bool = True):
+    """
+    One pipeline run with base seed `seed` into data_dir, then its validation metrics.
+    Returns (seed, metrics, seconds).
+    """
+    pipeline.BASE_SEED = seed
+    pipeline.COHORT_SIZE = cohort_size
+    pipeline.ACADEMIC_YEARS = list(years)
+    pipeline.DATA_DIR = Path(data_dir)
+    pipeline.WORKERS = 1   # replicates already occupy the CPUs; shards (if any) run in turn
+    pipeline.DATA_DIR.mkdir(parents=True, exist_ok=True)
+    start = time.time()
+    with open(pipeline.DATA_DIR / "pipeline.log", "w") as log, redirect_stdout(log):
+        pipeline.main(use_cache=use_cache)
+        values = validate_outputs.metrics(validate_outputs.load(pipeline.DATA_DIR / "relational"))
+    return seed, values, time.time() - start
+
+
+def summarise(metrics: pd.DataFrame) -> pd.DataFrame:
+    """One row per metric: replicates, mean, std and percentiles across seeds (NaNs skipped)."""
+    rows = []
+    for name in metrics.columns.drop("seed"):
+        values = metrics[name].to_numpy(dtype=float)
+        values = values[~np.isnan(values)]
+        row = {"metric": name, "replicates": len(values),
+               "mean": values.mean() if len(values) else np.nan,
+               "std": values.std(ddof=1) if len(values) > 1 else np.nan}
+        for q in PERCENTILES:
+            row[f"p{q}"] = np.percentile(values, q) if len(values) else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main(n_replicates: int, first_seed: int = pipeline.BASE_SEED, jobs: int = None,
+         out_dir: Path = REPLICATES_DIR, use_cache: bool = True):
+    seeds = replicate_seeds(n_replicates, first_seed)
+    jobs = min(jobs or os.cpu_count() or 1, len(seeds))
+    years = list(pipeline.ACADEMIC_YEARS)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    print("Stonegrove University Replicates")
+    print("=" * 50)
+    print(f"Replicates: {len(seeds)} (seeds {seeds[0]} to {seeds[-1]}), {jobs} at a time")
+    print(f"Academic years: {years[0]} to {years[-1]}, cohort size {pipeline.COHORT_SIZE}")
+    print(f"Partitions: {out_dir}/seed_<seed>/")
+    print()
+
+    _preload()
+    context = (multiprocessing.get_context("fork")
+               if "fork" in multiprocessing.get_all_start_methods() else None)
+    results, failed = [], []
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+        futures = {
+            pool.submit(run_replicate, seed, out_dir / f"seed_{seed}", pipeline.COHORT_SIZE, years, use_cache): seed
+            for seed in seeds
+        }
+        for future in as_completed(futures):
+            seed = futures[future]
+            try:
+                _, values, seconds = future.result()
+            except Exception as exc:
+                failed.append(seed)
+                print(f"  seed {seed}: FAILED ({exc!r}; see {out_dir / f'seed_{seed}' / 'pipeline.log'})")
+                continue
+            results.append(dict(seed=seed, **values))
+            print(f"  seed {seed}: done in {seconds:.0f}s ({len(results) + len(failed)}/{len(seeds)})")
+    print(f"\n{len(results)} replicates in {time.time() - start:.0f}s")
+
+    if not results:
+        print("No replicate completed; nothing to summarise.")
+        return None
+    metrics = pd.DataFrame(results).sort_values("seed").reset_index(drop=True)
+    summary = summarise(metrics)
+    metrics.to_csv(out_dir / "metrics.csv", index=False)
+    summary.to_csv(out_dir / "summary.csv", index=False)
+    print(f"Saved {out_dir / 'metrics.csv'} and {out_dir / 'summary.csv'}\n")
+    with pd.option_context("display.width", 120, "display.float_format", "{:.3f}".format):
+        print(summary.to_string(index=False))
+    if failed:
+        print(f"\nFailed seeds (not summarised): {', '.join(map(str, sorted(failed)))}")
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Stonegrove University replicate runner")
+    parser.add_argument("--replicates", type=int, default=8, help="number of seeds to run (default 8)")
+    parser.add_argument("--seed", type=int, default=pipeline.BASE_SEED,
+                        help=f"base seed of the first replicate (default {pipeline.BASE_SEED})")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--years", type=int, default=None,
+                        help=f"academic years per replicate (default {len(pipeline.ACADEMIC_YEARS_FULL)})")
+    parser.add_argument("--cohort-size", type=int, default=None,
+                        help=f"new students per year (default {pipeline.COHORT_SIZE})")
+    parser.add_argument("--out", type=Path, default=REPLICATES_DIR,
+                        help="directory for the partitions and summaries (default data/replicates/)")
+    parser.add_argument("--no-cache", action="store_true", help="execute every stage in every replicate")
+    args = parser.parse_args()
+    if args.replicates < 1:
+        parser.error("--replicates must be at least 1")
+    if args.years is not None:
+        if args.years < 3:
+            # The relational build needs graduates and NSS responses, first produced in year 3
+            parser.error("--years must be at least 3 (graduates and NSS responses start in year 3)")
+        pipeline.ACADEMIC_YEARS = pipeline.academic_years(args.years)
+    if args.cohort_size is not None:
+        pipeline.COHORT_SIZE = args.cohort_size
+    main(args.replicates, args.seed, args.jobs, PROJECT_ROOT / args.out, use_cache=not args.no_cache)
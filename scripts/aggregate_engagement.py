@@ -3,27 +3,118 @@
 
 Output: week, elf_attendance, dwarf_attendance, elf_stress, dwarf_stress
 (mean values per week number across all years and modules, by species).
+Reads fact_weekly_engagement_*.csv, or the quantized fact_weekly_engagement_*.npz
+files when no CSVs are present (aggregated on the fixed-point codes directly), or
+the memory-mapped fact_weekly_engagement_*.tensor/ stores. Student-week files
+(fact_student_week_engagement_*.csv) are used first when present: weighting each
+row by n_modules gives the same means as the module-week rows.
 Run from project root after run_longitudinal_pipeline.py and build_relational_outputs.py.
 """
+import sys
 import pandas as pd
+import numpy as np
 import glob
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
 
-files = sorted(glob.glob(str(ROOT / "data/relational/fact_weekly_engagement_*.csv")))
-if not files:
-    raise FileNotFoundError("No fact_weekly_engagement_*.csv files found in data/relational/")
+from core_systems.engagement_storage import METRICS, EngagementTensor, QuantizedEngagement
 
-df = pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
 students = pd.read_csv(ROOT / "data/relational/dim_students.csv")
-df = df.merge(students[["student_id", "species"]], on="student_id")
 
-eng = (
-    df.groupby(["week_number", "species"])[["attendance_rate", "stress_level"]]
-    .mean()
-    .unstack()
-)
+files = sorted(glob.glob(str(ROOT / "data/relational/fact_weekly_engagement_*.csv")))
+quantized_files = sorted(glob.glob(str(ROOT / "data/relational/fact_weekly_engagement_*.npz")))
+tensor_dirs = sorted(glob.glob(str(ROOT / "data/relational/fact_weekly_engagement_*.tensor")))
+student_week_files = sorted(glob.glob(str(ROOT / "data/relational/fact_student_week_engagement_*.csv")))
+if not files and not quantized_files and not tensor_dirs and not student_week_files:
+    raise FileNotFoundError("No fact_weekly_engagement_*.csv/.npz/.tensor or "
+                            "fact_student_week_engagement_*.csv found in data/relational/")
+
+if student_week_files:
+    metrics = ["attendance_rate", "stress_level"]
+    df = pd.concat([pd.read_csv(f) for f in student_week_files], ignore_index=True)
+    df = df.merge(students[["student_id", "species"]], on="student_id")
+    for m in metrics:
+        df[m] = df[m] * df["n_modules"]
+    sums = df.groupby(["week_number", "species"])[metrics + ["n_modules"]].sum()
+    eng = sums[metrics].div(sums["n_modules"], axis=0).unstack()
+elif files:
+    df = pd.concat([pd.read_csv(f) for f in files], ignore_index=True)
+    df = df.merge(students[["student_id", "species"]], on="student_id")
+
+    eng = (
+        df.groupby(["week_number", "species"])[["attendance_rate", "stress_level"]]
+        .mean()
+        .unstack()
+    )
+elif not quantized_files:
+    # Per (species, week): sum and count over student rows × module slots of each memmap,
+    # reading CHUNK contiguous rows of one metric at a time (only the chunk is copied)
+    CHUNK = 4096
+    metrics = ["attendance_rate", "stress_level"]
+    species_of = students.set_index("student_id")["species"]
+    species_names = np.array(sorted(students["species"].unique()), dtype=object)
+    parts = []
+    for d in tensor_dirs:
+        t = EngagementTensor.open(d)
+        species = species_of.reindex(t.student_ids).to_numpy()
+        code = np.full(len(species), -1, dtype=np.int64)
+        known = pd.notna(species)
+        code[known] = np.searchsorted(species_names, species[known])
+        n_periods = t.values.shape[1]
+        sums = np.zeros((len(metrics), len(species_names), n_periods))
+        counts = np.zeros((len(species_names), n_periods), dtype=np.int64)
+        for a in range(0, len(code), CHUNK):
+            b = min(a + CHUNK, len(code))
+            # (species, rows) indicator: per-row sums over slots -> per-species sums
+            onehot = (code[a:b] == np.arange(len(species_names))[:, None]).astype(np.float64)
+            for i, m in enumerate(metrics):
+                block = t.values[a:b, :, :, METRICS.index(m)]   # (rows, periods, slots)
+                sums[i] += onehot @ np.nansum(block, axis=2)
+                if i == 0:
+                    counts += (onehot @ (~np.isnan(block)).sum(axis=2)).astype(np.int64)
+        for s, sp in enumerate(species_names):
+            parts.append(pd.DataFrame({
+                "week_number": t.period_week,
+                "species": sp,
+                **{f"{m}_sum": sums[i, s] for i, m in enumerate(metrics)},
+                "n": counts[s],
+            }))
+    long = pd.concat(parts).groupby(["week_number", "species"]).sum()
+    long = long[long["n"] > 0]
+    eng = pd.DataFrame({m: long[f"{m}_sum"] / long["n"] for m in metrics}).unstack()
+else:
+    # student_id -> species code lookup, then sums per (week, species) on the integer codes
+    species_names = np.array(sorted(students["species"].unique()))
+    species_lookup = np.full(int(students["student_id"].max()) + 1, -1, dtype=np.int64)
+    species_lookup[students["student_id"].to_numpy()] = np.searchsorted(species_names, students["species"])
+    n_species = len(species_names)
+    n_groups = 256 * n_species  # week_number is stored as uint8
+    metrics = ["attendance_rate", "stress_level"]
+    sums = {m: np.zeros(n_groups) for m in metrics}
+    counts = np.zeros(n_groups, dtype=np.int64)
+    for f in quantized_files:
+        q = QuantizedEngagement.load(f)
+        sid = q.keys["student_id"].astype(np.int64)
+        sp = np.full(len(sid), -1, dtype=np.int64)
+        known = sid < len(species_lookup)
+        sp[known] = species_lookup[sid[known]]
+        mask = sp >= 0
+        group = q.keys["week_number"].astype(np.int64) * n_species + np.maximum(sp, 0)
+        counts += np.bincount(group[mask], minlength=n_groups)
+        for m in metrics:
+            sums[m] += q.grouped_sums(m, group, n_groups, mask=mask)
+
+    present = counts > 0
+    week_idx, sp_idx = np.divmod(np.arange(n_groups), n_species)
+    long = pd.DataFrame({
+        "week_number": week_idx[present],
+        "species": species_names[sp_idx[present]],
+        **{m: sums[m][present] / counts[present] for m in metrics},
+    })
+    eng = long.set_index(["week_number", "species"])[metrics].unstack()
+
 eng.columns = ["_".join(col).lower() for col in eng.columns]
 eng = eng.round(3).reset_index()
 eng.columns = ["week", "dwarf_attendance", "elf_attendance", "dwarf_stress", "elf_stress"]
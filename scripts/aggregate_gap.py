@@ -1,24 +1,38 @@
 #!/usr/bin/env python3
-"""Generate docs/data/gap-summary.csv from relational pipeline outputs.
+"""Generate docs/data/gap-summary.csv from pipeline outputs.
 
 Output: academic_year, elf_good, dwarf_good
 Good degree rate (First or 2:1, as %) by species per graduating year.
-Run from project root after run_longitudinal_pipeline.py and build_relational_outputs.py.
+Reads the aggregation cube (data/stonegrove_aggregation_cube.csv) when present,
+otherwise fact_graduate_outcomes.csv and dim_students.csv from data/relational/.
+Run from project root after run_longitudinal_pipeline.py (and build_relational_outputs.py).
 """
+import sys
 import pandas as pd
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
 
-outcomes = pd.read_csv(ROOT / "data/relational/fact_graduate_outcomes.csv")
-students  = pd.read_csv(ROOT / "data/relational/dim_students.csv")
+cube_path = ROOT / "data/stonegrove_aggregation_cube.csv"
+if cube_path.exists():
+    from core_systems.aggregation_cube import AggregationCube
 
-df = outcomes.merge(students[["student_id", "species"]], on="student_id")
-df["good_degree"] = df["degree_classification"].isin(["First", "2:1"])
+    rates = AggregationCube.read_csv(cube_path).summary(
+        "graduate_outcomes", ["good_degree"], by=["academic_year"], dimension="species",
+    )
+    gap = rates.set_index(["academic_year", "group"])["mean"]
+    gap.index.names = ["academic_year_graduated", "species"]
+else:
+    outcomes = pd.read_csv(ROOT / "data/relational/fact_graduate_outcomes.csv")
+    students = pd.read_csv(ROOT / "data/relational/dim_students.csv")
+
+    df = outcomes.merge(students[["student_id", "species"]], on="student_id")
+    df["good_degree"] = df["degree_classification"].isin(["First", "2:1"])
+    gap = df.groupby(["academic_year_graduated", "species"])["good_degree"].mean()
 
 gap = (
-    df.groupby(["academic_year_graduated", "species"])["good_degree"]
-    .mean()
+    gap
     .mul(100)
     .round(1)
     .unstack()
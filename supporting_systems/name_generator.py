@@ -7,6 +7,7 @@ from dataclasses import dataclass
 @dataclass
 class GeneratedName:
     """Container for a generated name with metadata"""
+    __slots__ = ('forename', 'surname', 'gender', 'clan', 'full_name')
     forename: str
     surname: str
     gender: str
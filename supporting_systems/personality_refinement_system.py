@@ -10,6 +10,7 @@ CONFIG_PATH = Path("config/personality_refinement_modifiers.yaml")
 @dataclass
 class PersonalityRefinement:
     """Container for personality refinement data"""
+    __slots__ = ('base_personality', 'refined_personality', 'applied_modifiers', 'characteristics')
     base_personality: Dict[str, float]
     refined_personality: Dict[str, float]
     applied_modifiers: Dict[str, Dict[str, float]]
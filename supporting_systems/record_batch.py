@@ -0,0 +1,93 @@
+"""
+Stonegrove University Record Batches
+
+Column-oriented row accumulation for the generation loops. A RecordBatchBuilder
+holds one preallocated NumPy array per column and appends rows, or blocks of rows
+given as arrays, straight into them. A finished batch converts to a DataFrame (or
+an Arrow table, if pyarrow is installed) without a dict or dataclass per row.
+
+The per-record dataclasses (WeeklyEngagement, SemesterEngagement, ProgramEnrollment,
+GeneratedName, PersonalityRefinement) stay as the single-record API.
+"""
+
+from typing import Dict, List, Mapping
+
+import numpy as np
+import pandas as pd
+
+
+class RecordBatchBuilder:
+    """
+    Growable struct-of-arrays batch with a fixed column schema.
+
+    columns: ordered {name: dtype}; use object for strings. Column order is the
+    DataFrame column order. Capacity doubles when full.
+    """
+
+    __slots__ = ('dtypes', '_arrays', '_capacity', '_n')
+
+    def __init__(self, columns: Mapping[str, object], capacity: int = 1024):
+        self.dtypes: Dict[str, np.dtype] = {name: np.dtype(dt) for name, dt in columns.items()}
+        self._capacity = max(int(capacity), 1)
+        self._arrays = {name: np.empty(self._capacity, dtype=dt) for name, dt in self.dtypes.items()}
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.dtypes)
+
+    def _reserve(self, n: int) -> None:
+        need = self._n + n
+        if need <= self._capacity:
+            return
+        capacity = max(need, 2 * self._capacity)
+        for name, arr in self._arrays.items():
+            grown = np.empty(capacity, dtype=arr.dtype)
+            grown[:self._n] = arr[:self._n]
+            self._arrays[name] = grown
+        self._capacity = capacity
+
+    def append(self, *values, **named) -> None:
+        """Append one row, given positionally in column order or by column name."""
+        if values:
+            if named or len(values) != len(self._arrays):
+                raise ValueError(f"append() takes all {len(self._arrays)} columns positionally, or by name")
+            named = dict(zip(self._arrays, values))
+        self.extend(1, **named)
+
+    def extend(self, n: int, **values) -> None:
+        """Append n rows. Each column is a scalar (repeated) or a length-n array."""
+        missing = self._arrays.keys() - values.keys()
+        extra = values.keys() - self._arrays.keys()
+        if missing or extra:
+            raise ValueError(f"Column mismatch: missing {sorted(missing)}, unexpected {sorted(extra)}")
+        if n <= 0:
+            return
+        self._reserve(n)
+        start, stop = self._n, self._n + n
+        for name, value in values.items():
+            self._arrays[name][start:stop] = value
+        self._n = stop
+
+    def column(self, name: str, start: int = 0) -> np.ndarray:
+        """Read-only view of rows [start:] of one column (valid until the next append)."""
+        view = self._arrays[name][start:self._n]
+        view.flags.writeable = False
+        return view
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame copy of the batch. No rows gives pd.DataFrame(), as a list of no dicts does."""
+        if not self._n:
+            return pd.DataFrame()
+        return pd.DataFrame({name: arr[:self._n].copy() for name, arr in self._arrays.items()})
+
+    def to_arrow(self):
+        """pyarrow.Table of the batch. pyarrow is optional and only needed here."""
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("RecordBatchBuilder.to_arrow() requires pyarrow (pip install pyarrow)") from e
+        return pa.table({name: arr[:self._n] for name, arr in self._arrays.items()})